@@ -0,0 +1,269 @@
+"""
+A deterministic local stand-in for Gemini, used to benchmark the pipelines without
+calling the real API.
+
+Responses are canned, but shaped like real ones: topic prompts get a topic for a
+fixed fraction of sentences, claim extraction prompts get claims quoting the
+transcript, and PASTEL gets a score for each sentence.
+Latency, failures and malformed JSON are all drawn from a random generator seeded
+by the prompt and the number of times it has been sent, so runs are repeatable
+whatever order calls are made in.
+"""
+
+import ast
+import asyncio
+import hashlib
+import json
+import random
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+from genai_utils.gemini import GeminiError
+from pastel.models import ScoreAndAnswers, Sentence
+
+from harmful_claim_finder.pastel_inference import CheckworthyClaimDetector
+from harmful_claim_finder.utils.tokens import estimate_tokens
+
+_CODE_BLOCK = re.compile(r"```\s*\n(.*?)\n\s*```", re.DOTALL)
+_NUMBERED_LINE = re.compile(r"^(\d+): (.*)$")
+
+
+@dataclass
+class FakeGeminiConfig:
+    """
+    Attributes:
+        median_latency_s (float):
+            Median time taken by a call, before the per-token delay.
+        latency_sigma (float):
+            Spread of the lognormal latency distribution.
+        per_token_s (float):
+            Extra delay for each estimated token of prompt and response.
+        failure_rate (float):
+            Fraction of calls which raise a `GeminiError`.
+        malformed_rate (float):
+            Fraction of responses with broken JSON, which need a fix_json call.
+        topic_rate (float):
+            Fraction of sentences given a topic.
+        claim_rate (float):
+            Fraction of sentences quoted as claims by claim extraction.
+        nonzero_score_rate (float):
+            Fraction of sentences given a nonzero PASTEL score.
+        seed (int):
+            Changes every random choice.
+    """
+
+    median_latency_s: float = 0.05
+    latency_sigma: float = 0.5
+    per_token_s: float = 0.00002
+    failure_rate: float = 0.0
+    malformed_rate: float = 0.0
+    topic_rate: float = 0.3
+    claim_rate: float = 0.1
+    nonzero_score_rate: float = 0.5
+    seed: int = 0
+
+
+@dataclass
+class FakeGemini:
+    """
+    Stands in for `genai_utils.gemini.run_prompt_async`, and counts the calls made.
+    """
+
+    config: FakeGeminiConfig = field(default_factory=FakeGeminiConfig)
+    calls: Counter[str] = field(default_factory=Counter)
+    _attempts: Counter[str] = field(default_factory=Counter)
+    _broken: dict[str, str] = field(default_factory=dict)
+
+    def _rng(self, *parts: str) -> random.Random:
+        digest = hashlib.sha256(
+            "\x00".join([str(self.config.seed), *parts]).encode("utf-8")
+        ).digest()
+        return random.Random(digest)
+
+    def _call_rng(self, *parts: str) -> random.Random:
+        # retries of the same call get a fresh draw, so failures aren't permanent
+        key = "\x00".join(parts)
+        self._attempts[key] += 1
+        return self._rng(*parts, str(self._attempts[key]))
+
+    def _chance(self, rate: float, *parts: str) -> bool:
+        return self._rng(*parts).random() < rate
+
+    async def _wait(self, rng: random.Random, prompt: str, response: str) -> None:
+        delay = rng.lognormvariate(0, self.config.latency_sigma)
+        delay *= self.config.median_latency_s
+        delay += self.config.per_token_s * estimate_tokens(prompt + response)
+        await asyncio.sleep(delay)
+
+    def _topic_response(self, prompt: str) -> str:
+        blocks = _CODE_BLOCK.findall(prompt)
+        sentences: list[str] = []
+        numbered: dict[int, str] = {}
+        for line in blocks[-1].splitlines() if blocks else []:
+            if line.startswith("["):
+                sentences.extend(ast.literal_eval(line))
+            elif match := _NUMBERED_LINE.match(line):
+                numbered[int(match[1])] = match[2]
+        if numbered:
+            ids = [
+                i
+                for i, sentence in numbered.items()
+                if self._chance(self.config.topic_rate, sentence)
+            ]
+            return json.dumps([{"topic": "1", "sentence_ids": ids}] if ids else [])
+        topical = [s for s in sentences if self._chance(self.config.topic_rate, s)]
+        return json.dumps({"1": topical} if topical else {}, ensure_ascii=False)
+
+    def _claims_response(self, prompt: str) -> str:
+        blocks = _CODE_BLOCK.findall(prompt)
+        lines = blocks[-1].splitlines() if blocks else []
+        numbered = [match for line in lines if (match := _NUMBERED_LINE.match(line))]
+        if numbered:
+            return json.dumps(
+                [
+                    {
+                        "language": "English",
+                        "claim": f"The speaker claims that {match[2]}",
+                        "first_sentence": int(match[1]),
+                        "last_sentence": int(match[1]),
+                        "topics": ["1"],
+                    }
+                    for match in numbered
+                    if self._chance(self.config.claim_rate, match[2])
+                ],
+                ensure_ascii=False,
+            )
+        words = blocks[-1].split() if blocks else []
+        claims = []
+        # treat every 12 words as a "sentence" which might be quoted
+        for start in range(0, len(words), 12):
+            quote = " ".join(words[start : start + 12])
+            if self._chance(self.config.claim_rate, quote):
+                claims.append(
+                    {
+                        "language": "English",
+                        "claim": f"The speaker claims that {quote}.",
+                        "original_text": quote,
+                        "topics": ["1"],
+                    }
+                )
+        return json.dumps(claims, ensure_ascii=False)
+
+    def _fixed_response(self, prompt: str) -> str:
+        for broken, fixed in self._broken.items():
+            if broken in prompt:
+                return fixed
+        return "[]"
+
+    async def run_prompt_async(
+        self,
+        prompt: str,
+        *args: object,
+        labels: dict[str, str] | None = None,
+        **_: object,
+    ) -> str:
+        """
+        Returns a canned response to a prompt, after a simulated delay.
+        """
+        feature = (labels or {}).get("feature", "unlabelled")
+        self.calls[feature] += 1
+        rng = self._call_rng(feature, prompt)
+
+        if feature.endswith("/fix_json"):
+            response = self._fixed_response(prompt)
+        elif feature.startswith("run_all_for_article"):
+            response = self._topic_response(prompt)
+        elif feature.startswith("get_transcript_claims"):
+            response = self._claims_response(prompt)
+        else:
+            response = "[]"
+
+        await self._wait(rng, prompt, response)
+        if rng.random() < self.config.failure_rate:
+            raise GeminiError(f"Simulated failure for {feature}")
+        if not feature.endswith("/fix_json") and (
+            rng.random() < self.config.malformed_rate
+        ):
+            broken = response[: len(response) // 2]
+            self._broken[broken] = response
+            return broken
+        return response
+
+    async def score_sentences(self, sentences: list[str]) -> dict[str, ScoreAndAnswers]:
+        """
+        Returns a canned PASTEL result for each sentence, after simulating one
+        Gemini call per sentence.
+        """
+
+        async def score(sentence: str) -> ScoreAndAnswers:
+            self.calls["pastel"] += 1
+            rng = self._call_rng("pastel", sentence)
+            await self._wait(rng, sentence, "")
+            if rng.random() < self.config.failure_rate:
+                raise GeminiError("Simulated failure for pastel")
+            nonzero = rng.random() < self.config.nonzero_score_rate
+            return ScoreAndAnswers(
+                sentence=Sentence(sentence, ()),
+                score=round(rng.uniform(1, 5), 2) if nonzero else 0.0,
+                answers={"Is this a specific claim?": float(nonzero)},
+            )
+
+        results = await asyncio.gather(*(score(s) for s in sentences))
+        return dict(zip(sentences, results))
+
+
+class FakePrefixCacheBackend:
+    """
+    Stands in for Gemini context caching. Prompts using a cached prefix are answered
+    by a `FakeGemini`, as if the whole prompt had been sent.
+    """
+
+    def __init__(self, fake: FakeGemini) -> None:
+        self.fake = fake
+        self.prefixes: dict[str, str] = {}
+        self.created = 0
+        self.deleted = 0
+        self.cached_calls = 0
+
+    async def create(
+        self, model: str, system_instruction: str | None, prefix: str, ttl_s: float
+    ) -> str:
+        self.created += 1
+        name = f"cachedContents/fake-{self.created}"
+        self.prefixes[name] = prefix
+        await asyncio.sleep(self.fake.config.median_latency_s)
+        return name
+
+    async def delete(self, name: str) -> None:
+        self.deleted += 1
+        self.prefixes.pop(name, None)
+
+    async def generate(
+        self,
+        name: str,
+        model: str,
+        prompt: str,
+        output_schema: Any = None,
+        video_uri: str | None = None,
+        labels: dict[str, str] | None = None,
+    ) -> str:
+        self.cached_calls += 1
+        return await self.fake.run_prompt_async(
+            self.prefixes[name] + prompt, labels=labels
+        )
+
+
+class FakeCheckworthyClaimDetector(CheckworthyClaimDetector):
+    """
+    A detector which scores sentences with a `FakeGemini` instead of PASTEL, while
+    keeping the real caching, coalescing and retry logic.
+    """
+
+    def __init__(self, fake: FakeGemini) -> None:
+        super().__init__()
+        self.fake = fake
+
+    async def _predict(self, sentences: list[str]) -> dict[str, ScoreAndAnswers]:
+        return await self.fake.score_sentences(sentences)
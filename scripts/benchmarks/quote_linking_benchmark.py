@@ -0,0 +1,119 @@
+"""
+Benchmarks linking quotes to transcript sentences, as transcripts get longer.
+
+Compares today's `link_quotes_and_sentences`, and `QuoteLinker` scoring every
+sentence, with the n-gram indexed `QuoteLinker`. Transcripts are made from the
+sentences of every transcript in `data/example_transcripts`, and quotes are taken
+from them, sometimes running across sentences or with a word changed.
+
+Usage:
+    python scripts/benchmarks/quote_linking_benchmark.py --lengths 100 500 1400
+"""
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import Callable
+from uuid import UUID
+
+from genai_utils.sentence_linking import link_quotes_and_sentences
+
+from harmful_claim_finder.utils.models import TranscriptFragment
+from harmful_claim_finder.utils.quote_linking import QuoteLinker
+from harmful_claim_finder.utils.transcript_assembly import assemble_sentences
+
+TRANSCRIPTS_DIR = Path("data/example_transcripts")
+
+Linker = Callable[[list[str], list[str]], list[tuple[int, int, float]]]
+
+LINKERS: dict[str, Linker] = {
+    "today": link_quotes_and_sentences,
+    "all_pairs": lambda quotes, sentences: QuoteLinker(
+        sentences, max_candidates=None
+    ).link(quotes),
+    "indexed": lambda quotes, sentences: QuoteLinker(sentences).link(quotes),
+}
+
+
+def load_sentences() -> list[str]:
+    sentences = []
+    for path in sorted(TRANSCRIPTS_DIR.glob("*.json")):
+        fragments: list[TranscriptFragment] = json.loads(path.read_text())
+        sentences += [s.text for s in assemble_sentences(fragments, UUID(int=0))]
+    return sentences
+
+
+def make_quotes(sentences: list[str], count: int, rng: random.Random) -> list[str]:
+    quotes = []
+    for _ in range(count):
+        start = rng.randrange(len(sentences) - 1)
+        words = " ".join(sentences[start : start + 2]).split()
+        offset = rng.randrange(min(3, len(words)))
+        quote = words[offset : offset + rng.randint(6, 25)]
+        if rng.random() < 0.3:
+            quote[rng.randrange(len(quote))] = "something"
+        quotes.append(" ".join(quote))
+    return quotes
+
+
+def time_linker(
+    linker: Linker, quotes: list[str], sentences: list[str], repeats: int
+) -> tuple[float, list[tuple[int, int]]]:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        linked = linker(quotes, sentences)
+    elapsed = (time.perf_counter() - start) / repeats
+    return elapsed, [(quote_idx, sentence_idx) for quote_idx, sentence_idx, _ in linked]
+
+
+def agreement(links: list[tuple[int, int]], reference: list[tuple[int, int]]) -> float:
+    """
+    Returns the fraction of quotes linked to the same sentence, or not linked, by
+    both linkers.
+    """
+    linked = dict(links)
+    expected = dict(reference)
+    quotes = set(linked) | set(expected)
+    same = sum(linked.get(quote) == expected.get(quote) for quote in quotes)
+    return same / len(quotes) if quotes else 1.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--lengths", type=int, nargs="+", default=[100, 250, 500, 1000, 1400]
+    )
+    parser.add_argument("--quotes", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    all_sentences = load_sentences()
+    rng = random.Random(args.seed)
+    print(
+        f"{'sentences':>10}"
+        + "".join(f"{name + ' s':>13}" for name in LINKERS)
+        + f"{'speedup':>9}{'same as today':>15}{'same as all pairs':>19}"
+    )
+    for length in args.lengths:
+        sentences = all_sentences[:length]
+        quotes = make_quotes(sentences, args.quotes, rng)
+        times = {}
+        links = {}
+        for name, linker in LINKERS.items():
+            times[name], links[name] = time_linker(
+                linker, quotes, sentences, args.repeats
+            )
+        print(
+            f"{len(sentences):>10}"
+            + "".join(f"{times[name]:>13.4f}" for name in LINKERS)
+            + f"{times['today'] / times['indexed']:>8.1f}x"
+            + f"{agreement(links['indexed'], links['today']):>15.0%}"
+            + f"{agreement(links['indexed'], links['all_pairs']):>19.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
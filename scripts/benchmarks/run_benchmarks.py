@@ -0,0 +1,363 @@
+"""
+Benchmarks the transcript pipelines against a fake Gemini backend, using every
+transcript in `data/example_transcripts`. No API calls are made.
+
+Reports throughput, latency percentiles, LLM calls and peak memory for each
+pipeline, and can save the results as a baseline to compare later runs against.
+
+Usage:
+    python scripts/benchmarks/run_benchmarks.py --save scripts/benchmarks/baseline.json
+    python scripts/benchmarks/run_benchmarks.py --compare scripts/benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+from unittest.mock import patch
+from uuid import UUID, uuid5
+
+from fake_gemini import (
+    FakeCheckworthyClaimDetector,
+    FakeGemini,
+    FakeGeminiConfig,
+    FakePrefixCacheBackend,
+)
+
+from harmful_claim_finder import transcript_inference, transcript_search
+from harmful_claim_finder.claim_extraction import _parse_transcript_claims
+from harmful_claim_finder.utils.context_cache import (
+    PrefixCache,
+    get_prefix_cache,
+    set_prefix_cache,
+)
+from harmful_claim_finder.utils.hedging import (
+    RequestHedger,
+    get_request_hedger,
+    set_request_hedger,
+)
+from harmful_claim_finder.utils.models import TranscriptFragment, TranscriptSentence
+from harmful_claim_finder.utils.rate_limit import (
+    AdaptiveRateLimiter,
+    set_rate_limiter,
+)
+from harmful_claim_finder.utils.transcript_assembly import assemble_sentences
+from harmful_claim_finder.utils.usage import UsageLedger, track_usage
+
+TRANSCRIPTS_DIR = Path("data/example_transcripts")
+KEYWORDS = {
+    "vaccines": ["covid-19", "vaxxer", "vaccine"],
+    "miracle_cures": ["miracle cure", "magic herbs", "traditional medicine"],
+    "health": ["doctor", "hospital", "cancer", "oil"],
+}
+# regressions smaller than this are treated as noise
+DEFAULT_TOLERANCE = 0.2
+
+
+def load_transcripts() -> dict[str, list[TranscriptSentence]]:
+    transcripts = {}
+    for path in sorted(TRANSCRIPTS_DIR.glob("*.json")):
+        fragments: list[TranscriptFragment] = json.loads(path.read_text())
+        video_id = uuid5(UUID(int=0), path.stem)
+        transcripts[path.stem] = list(
+            assemble_sentences(fragments, video_id, source="benchmark")
+        )
+    return transcripts
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[int(percent) - 1]
+
+
+async def run_pipeline(
+    name: str,
+    transcripts: dict[str, list[TranscriptSentence]],
+    process: Callable[[list[TranscriptSentence]], Awaitable[Any]],
+    fake: FakeGemini,
+    concurrency: int,
+) -> dict[str, Any]:
+    fake.calls.clear()
+    prefix_cache = get_prefix_cache()
+    if prefix_cache is not None:
+        prefix_cache.hits = prefix_cache.misses = 0
+    hedger = get_request_hedger()
+    hedges_before = hedger.hedges if hedger else 0
+    slots = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    failures = 0
+
+    async def run_one(sentences: list[TranscriptSentence]) -> None:
+        nonlocal failures
+        async with slots:
+            start = time.perf_counter()
+            try:
+                await process(sentences)
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    ledger = UsageLedger()
+    with track_usage(ledger):
+        await asyncio.gather(
+            *(run_one(sentences) for sentences in transcripts.values())
+        )
+    wall_time_s = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n_sentences = sum(len(sentences) for sentences in transcripts.values())
+    return {
+        "pipeline": name,
+        "transcripts": len(transcripts),
+        "failures": failures,
+        "wall_time_s": wall_time_s,
+        "transcripts_per_s": len(transcripts) / wall_time_s,
+        "sentences_per_s": n_sentences / wall_time_s,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "llm_calls": sum(fake.calls.values()),
+        "llm_calls_by_feature": dict(sorted(fake.calls.items())),
+        "llm_output_tokens": ledger.summary().output_tokens,
+        "context_cache_hit_rate": prefix_cache.hit_rate if prefix_cache else None,
+        "hedged_calls": hedger.hedges - hedges_before if hedger else 0,
+        "peak_memory_mb": peak_memory / 1e6,
+    }
+
+
+def run_parser_benchmark(
+    transcripts: dict[str, list[TranscriptSentence]], fake: FakeGemini, repeats: int
+) -> dict[str, Any]:
+    """
+    Times the claim extraction parser on its own, using canned responses.
+    """
+    responses = {
+        name: fake._claims_response(
+            "```\n" + " ".join(s.text for s in sentences) + "\n```"
+        )
+        for name, sentences in transcripts.items()
+    }
+    latencies = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for name, sentences in transcripts.items():
+            parse_start = time.perf_counter()
+            _parse_transcript_claims(responses[name], sentences)
+            latencies.append(time.perf_counter() - parse_start)
+    wall_time_s = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "pipeline": "claim_extraction_parser",
+        "transcripts": len(latencies),
+        "failures": 0,
+        "wall_time_s": wall_time_s,
+        "transcripts_per_s": len(latencies) / wall_time_s,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "llm_calls": 0,
+        "peak_memory_mb": peak_memory / 1e6,
+    }
+
+
+async def run_benchmarks(args: argparse.Namespace) -> list[dict[str, Any]]:
+    transcripts = load_transcripts()
+    fake = FakeGemini(
+        FakeGeminiConfig(
+            median_latency_s=args.median_latency_s,
+            latency_sigma=args.latency_sigma,
+            per_token_s=args.per_token_s,
+            failure_rate=args.failure_rate,
+            malformed_rate=args.malformed_rate,
+            seed=args.seed,
+        )
+    )
+    set_rate_limiter(
+        AdaptiveRateLimiter(
+            requests_per_s=args.requests_per_s,
+            burst=args.requests_per_s,
+            max_concurrency=args.max_llm_concurrency,
+        )
+    )
+    detector = FakeCheckworthyClaimDetector(fake)
+    if args.hedge:
+        set_request_hedger(
+            RequestHedger(
+                percentile=args.hedge_percentile,
+                max_extra_fraction=args.hedge_max_extra,
+                min_samples=args.hedge_min_samples,
+            )
+        )
+    if args.context_cache:
+        set_prefix_cache(
+            PrefixCache(
+                FakePrefixCacheBackend(fake),
+                min_tokens=args.context_cache_min_tokens,
+            )
+        )
+
+    results = []
+    with patch(
+        "harmful_claim_finder.utils.gemini._run_prompt_async", fake.run_prompt_async
+    ):
+        results.append(
+            await run_pipeline(
+                "transcript_inference",
+                transcripts,
+                lambda sentences: transcript_inference.get_claims(
+                    KEYWORDS,
+                    sentences,
+                    checkworthy_model=detector,
+                    topic_output=args.topic_output,
+                ),
+                fake,
+                args.concurrency,
+            )
+        )
+        results.append(
+            await run_pipeline(
+                "transcript_search",
+                transcripts,
+                lambda sentences: transcript_search.get_claims(
+                    KEYWORDS,
+                    sentences,
+                    checkworthy_model=detector,
+                    extraction_mode=args.extraction_mode,
+                ),
+                fake,
+                args.concurrency,
+            )
+        )
+    results.append(run_parser_benchmark(transcripts, fake, args.parser_repeats))
+    return results
+
+
+def compare(
+    results: list[dict[str, Any]], baseline: list[dict[str, Any]], tolerance: float
+) -> list[str]:
+    """
+    Returns a description of each metric which is worse than the baseline by more
+    than `tolerance`, as a fraction of the baseline.
+    """
+    lower_is_better = ["latency_p50_s", "latency_p95_s", "latency_p99_s", "llm_calls"]
+    regressions = []
+    by_pipeline = {result["pipeline"]: result for result in baseline}
+    for result in results:
+        old = by_pipeline.get(result["pipeline"])
+        if old is None:
+            continue
+        if result["transcripts_per_s"] < old["transcripts_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{result['pipeline']} transcripts_per_s: "
+                f"{old['transcripts_per_s']:.2f} -> {result['transcripts_per_s']:.2f}"
+            )
+        for metric in lower_is_better:
+            if result[metric] > old[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{result['pipeline']} {metric}: "
+                    f"{old[metric]:.4g} -> {result[metric]:.4g}"
+                )
+    return regressions
+
+
+def print_report(results: list[dict[str, Any]]) -> None:
+    print(
+        f"{'pipeline':<26}{'transcripts/s':>14}{'p50 s':>9}{'p95 s':>9}"
+        f"{'p99 s':>9}{'LLM calls':>11}{'peak MB':>9}{'failures':>10}"
+        f"{'cache hits':>12}{'hedged':>8}"
+    )
+    for result in results:
+        hit_rate = result.get("context_cache_hit_rate")
+        print(
+            f"{result['pipeline']:<26}{result['transcripts_per_s']:>14.2f}"
+            f"{result['latency_p50_s']:>9.3f}{result['latency_p95_s']:>9.3f}"
+            f"{result['latency_p99_s']:>9.3f}{result['llm_calls']:>11}"
+            f"{result['peak_memory_mb']:>9.1f}{result['failures']:>10}"
+            f"{'-' if hit_rate is None else f'{hit_rate:.0%}':>12}"
+            f"{result.get('hedged_calls', 0):>8}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--median-latency-s", type=float, default=0.05)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--per-token-s", type=float, default=0.00002)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.05)
+    parser.add_argument("--requests-per-s", type=float, default=1_000)
+    parser.add_argument("--max-llm-concurrency", type=int, default=64)
+    parser.add_argument("--parser-repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--context-cache",
+        action="store_true",
+        help="Cache static prompt prefixes with a fake context cache.",
+    )
+    parser.add_argument("--context-cache-min-tokens", type=int, default=1024)
+    parser.add_argument(
+        "--topic-output",
+        choices=["sentences", "indices"],
+        default="sentences",
+        help="Whether topic detection returns sentence text or sentence numbers.",
+    )
+    parser.add_argument(
+        "--extraction-mode",
+        choices=["quotes", "spans"],
+        default="quotes",
+        help="Whether claim extraction returns quotes or sentence numbers.",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate of calls slower than --hedge-percentile.",
+    )
+    parser.add_argument("--hedge-percentile", type=float, default=95.0)
+    parser.add_argument(
+        "--hedge-max-extra",
+        type=float,
+        default=0.05,
+        help="The most duplicate calls to send, as a fraction of all calls.",
+    )
+    parser.add_argument(
+        "--hedge-min-samples",
+        type=int,
+        default=5,
+        help="The number of calls to see for a feature before hedging it.",
+    )
+    parser.add_argument("--save", type=Path, help="Save the results as a baseline.")
+    parser.add_argument("--compare", type=Path, help="Compare with a saved baseline.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmarks(args))
+    print_report(results)
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=4))
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        regressions = compare(
+            results, json.loads(args.compare.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
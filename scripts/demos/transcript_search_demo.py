@@ -1,18 +1,11 @@
 import asyncio
 import json
 from pathlib import Path
-from typing import TypedDict
 from uuid import UUID
 
 from harmful_claim_finder.transcript_search import get_claims
-from harmful_claim_finder.utils.models import TranscriptSentence
-
-
-class TranscriptFragment(TypedDict):
-    text: str
-    start: float
-    duration: float
-
+from harmful_claim_finder.utils.models import TranscriptFragment
+from harmful_claim_finder.utils.transcript_assembly import assemble_sentences
 
 transcripts = [
     "data/example_transcripts/9V1U_hnxEjo.json",
@@ -37,15 +30,7 @@ def find_checkworthy_claims() -> None:
             transcript: list[TranscriptFragment] = json.loads(
                 Path(transcript_path).read_text()
             )
-            sentences = [
-                TranscriptSentence(
-                    video_id=video_id,
-                    source="",
-                    text=fragment["text"],
-                    start_time_s=fragment["start"],
-                )
-                for fragment in transcript
-            ]
+            sentences = list(assemble_sentences(transcript, video_id))
             claims = asyncio.run(get_claims(kw, sentences))
             print(f"Found {len(claims)} claims in transcript {transcript_path}")
             jsonable = [claim.model_dump(mode="json") for claim in claims]
@@ -1,22 +1,30 @@
 import json
 import logging
 import os
-import traceback
 from pathlib import Path
 from textwrap import dedent
-from typing import Any, cast
+from typing import Any, Literal, cast
 from uuid import UUID
 
-from genai_utils.gemini import run_prompt_async
 from genai_utils.parsing import parse_model_json_output
 from genai_utils.sentence_linking import link_quotes_and_sentences
 from pydantic import BaseModel, Field, ValidationError
-
+from rapidfuzz import fuzz
+
+from harmful_claim_finder.utils.cache import normalise_sentence
+from harmful_claim_finder.utils.chunking import chunk_by_tokens, gather_successes
+from harmful_claim_finder.utils.context_cache import outline_scope
+from harmful_claim_finder.utils.gemini import run_prompt_async
+from harmful_claim_finder.utils.json_recovery import parse_with_repair
+from harmful_claim_finder.utils.metrics import REJECTED_ITEMS, STAGE_LATENCY
 from harmful_claim_finder.utils.models import (
+    BudgetExceededError,
     ClaimExtractionError,
     TranscriptSentence,
     VideoClaims,
 )
+from harmful_claim_finder.utils.quote_linking import QuoteLinker
+from harmful_claim_finder.utils.retry import RetryPolicy, get_retry_policy
 
 _logger = logging.getLogger(__name__)
 
@@ -30,6 +38,22 @@ TRANSCRIPT_PROMPT_FILE = (
     / "transcript_search_prompt.md"
 )
 
+# Claims from overlapping chunks with the same timestamp and claim text at least
+# this similar are treated as duplicates.
+DUPLICATE_CLAIM_SIMILARITY = 85
+DEFAULT_CHUNK_OVERLAP_TOKENS = 200
+# Quotes from transcripts with at least this many sentences are linked with an
+# n-gram index, rather than by comparing every quote with every sentence.
+INDEXED_LINKING_MIN_SENTENCES = 200
+# Video claims failing validation are skipped. If fewer than this fraction of the
+# claims in a response are valid, the LLM is asked to fix the JSON.
+DEFAULT_MIN_COMPLETENESS = 0.5
+
+# "quotes" asks for the text of each claim's quote, which is linked back to the
+# transcript by fuzzy matching. "spans" numbers the sentences and asks for the
+# numbers of the first and last sentence of each claim instead.
+ExtractionMode = Literal["quotes", "spans"]
+
 
 class TextClaimSchema(BaseModel):
     language: str = Field(
@@ -66,6 +90,41 @@ class TextClaimSchema(BaseModel):
     )
 
 
+class SpanClaimSchema(BaseModel):
+    language: str = Field(
+        description=(
+            "The language of this claim/quote (e.g. 'French', 'Arabic', 'Spanish'). "
+            "Identify this before writing the claim."
+        )
+    )
+    claim: str = Field(
+        description=(
+            "The claim being made, written in the SAME language as the original quote. "
+            "Rephrase to make the claim clear without context, "
+            "but do not change the meaning or language. "
+            "The claim should have enough context to make sense "
+            "to a fact checker without seeing the whole transcript. "
+            "This MUST be in the same language identified above."
+        )
+    )
+    first_sentence: int = Field(
+        description="The number of the first sentence in which the claim is made."
+    )
+    last_sentence: int = Field(
+        description=(
+            "The number of the last sentence in which the claim is made. "
+            "The same as first_sentence if the claim is made in one sentence."
+        )
+    )
+    topics: list[str] = Field(
+        description=(
+            "A list of topics which the claim relates to."
+            "The topics should be based on those described in the JSON keywords"
+            " you were given."
+        )
+    )
+
+
 class VideoClaimSchema(BaseModel):
     language: str = Field(
         description=(
@@ -130,6 +189,22 @@ CLAIMS_PROMPT_TEXT = dedent(
     """
 )
 
+CLAIMS_PROMPT_SPANS = dedent(
+    """
+    Here are the keywords:
+    {KEYWORDS}
+
+    The text is given as numbered sentences, one per line, like "0: The first sentence."
+    Do not quote the text. Instead, give the numbers of the first and last sentences
+    in which each claim is made.
+
+    Here is the text:
+    ```
+    {TEXT}
+    ```
+    """
+)
+
 
 CLAIMS_INSTRUCTION_VIDEO = VIDEO_PROMPT_FILE.read_text()
 
@@ -157,7 +232,11 @@ def _get_timestamps(
 ) -> dict[str, float]:
     sentences = [s.text for s in transcript]
     quotes = [claim.original_text for claim in claims]
-    linked = link_quotes_and_sentences(quotes, sentences)
+    with STAGE_LATENCY.time(stage="quote_linking"):
+        if len(sentences) >= INDEXED_LINKING_MIN_SENTENCES:
+            linked = QuoteLinker(sentences).link(quotes)
+        else:
+            linked = link_quotes_and_sentences(quotes, sentences)
     quote_timestamps = {
         claims[quote_idx].original_text: transcript[sentence_idx].start_time_s
         for quote_idx, sentence_idx, _ in linked
@@ -175,12 +254,13 @@ def _parse_transcript_claims(
         try:
             genai_claims.append(TextClaimSchema(**claim_dict))
         except ValidationError:
+            REJECTED_ITEMS.inc(feature="get_transcript_claims")
             _logger.info(
                 f"Skipped malformed json: {json.dumps(claim_dict, ensure_ascii=False)}"
             )
     timestamp_map = _get_timestamps(genai_claims, transcript)
 
-    most_recent_time = 0.0
+    most_recent_time = transcript[0].start_time_s if transcript else 0.0
     output_claims = []
     for claim in genai_claims:
         new_timestamp = timestamp_map.get(claim.original_text, most_recent_time)
@@ -196,45 +276,182 @@ def _parse_transcript_claims(
     return output_claims
 
 
+def _number_sentences(transcript: list[TranscriptSentence]) -> str:
+    return "\n".join(
+        f"{i}: {' '.join(sentence.text.split())}"
+        for i, sentence in enumerate(transcript)
+    )
+
+
+def _parse_span_claims(
+    genai_response: str, transcript: list[TranscriptSentence]
+) -> list[VideoClaims]:
+    """
+    Parses claims given as sentence number ranges. Quotes and timestamps are
+    looked up directly from the numbered sentences, so no fuzzy linking is needed.
+    Claims with sentence numbers outside the transcript are skipped.
+    """
+    parsed = parse_model_json_output(genai_response)
+    if not isinstance(parsed, list):
+        raise ValueError(f"Expected a list of claims, got {type(parsed).__name__}.")
+    output_claims = []
+    for claim_dict in parsed:
+        try:
+            claim = SpanClaimSchema.model_validate(claim_dict)
+        except ValidationError:
+            REJECTED_ITEMS.inc(feature="get_transcript_claims")
+            _logger.info(
+                f"Skipped malformed json: {json.dumps(claim_dict, ensure_ascii=False)}"
+            )
+            continue
+        first, last = sorted([claim.first_sentence, claim.last_sentence])
+        if first < 0 or last >= len(transcript):
+            _logger.info(
+                f"Skipped claim with sentences {first}-{last} outside the "
+                f"{len(transcript)} sentence transcript: {claim.claim}"
+            )
+            continue
+        output_claims.append(
+            VideoClaims(
+                video_id=transcript[first].video_id,
+                claim=claim.claim,
+                start_time_s=transcript[first].start_time_s,
+                metadata={
+                    "quote": " ".join(s.text for s in transcript[first : last + 1]),
+                    "topics": claim.topics,
+                },
+            )
+        )
+    return output_claims
+
+
 async def _get_transcript_claims(
     transcript: list[TranscriptSentence],
     keywords: dict[str, list[str]],
+    mode: ExtractionMode = "quotes",
+    cache_scope: str | None = None,
 ) -> list[VideoClaims]:
-    transcript_text = " ".join([s.text for s in transcript])
-    prompt = CLAIMS_PROMPT_TEXT.replace("{TEXT}", transcript_text)
-    prompt = prompt.replace("{KEYWORDS}", json.dumps(keywords))
-    response = await run_prompt_async(
-        prompt,
-        system_instruction=CLAIMS_INSTRUCTION_TEXT,
-        output_schema=list[TextClaimSchema],
-        labels={
-            "feature": "get_transcript_claims",
-        },
-    )
-    try:
-        claims = _parse_transcript_claims(response, transcript)
-    except ValueError:
-        _logger.info(f"Parsing error: {traceback.format_exc()}")
-        fixed_response = await run_prompt_async(
-            FIX_JSON.replace("{TEXT}", response),
-            output_schema=list[TextClaimSchema],
+    if mode == "spans":
+        prompt_outline = CLAIMS_PROMPT_SPANS
+        transcript_text = _number_sentences(transcript)
+        output_schema: Any = list[SpanClaimSchema]
+        parse = _parse_span_claims
+    else:
+        prompt_outline = CLAIMS_PROMPT_TEXT
+        transcript_text = " ".join([s.text for s in transcript])
+        output_schema = list[TextClaimSchema]
+        parse = _parse_transcript_claims
+    # everything before the text is the same for every chunk, so can be cached
+    split_at = prompt_outline.index("{TEXT}")
+    prefix = prompt_outline[:split_at].replace("{KEYWORDS}", json.dumps(keywords))
+    prompt = prompt_outline[split_at:].replace("{TEXT}", transcript_text)
+    with STAGE_LATENCY.time(stage="claim_extraction"):
+        response = await run_prompt_async(
+            prompt,
+            cached_prefix=prefix,
+            cache_scope=outline_scope(cache_scope, prompt_outline),
+            system_instruction=CLAIMS_INSTRUCTION_TEXT,
+            output_schema=output_schema,
+            labels={
+                "feature": "get_transcript_claims",
+            },
+        )
+
+    async def fix_json(broken: str) -> str:
+        return await run_prompt_async(
+            FIX_JSON.replace("{TEXT}", broken),
+            output_schema=output_schema,
             labels={
                 "feature": "get_transcript_claims/fix_json",
             },
         )
-        claims = _parse_transcript_claims(fixed_response, transcript)
 
-    return claims
+    return await parse_with_repair(
+        response,
+        lambda text: parse(text, transcript),
+        fix_json,
+        feature="get_transcript_claims",
+    )
+
+
+class ClaimDeduplicator:
+    """
+    Finds duplicate claims from overlapping chunks of a transcript.
+    Claims with the same quote, or with a similar claim at the same time, as a claim
+    already added are duplicates.
+    """
+
+    def __init__(self) -> None:
+        self._seen_quotes: set[str] = set()
+        self._claims_at_time: dict[float, list[str]] = {}
+
+    def add(self, claim: VideoClaims) -> bool:
+        """
+        Adds a claim, unless it's a duplicate of one already added.
+
+        Returns:
+            bool: True if the claim was added, or False if it's a duplicate.
+        """
+        quote = normalise_sentence(str(claim.metadata.get("quote", claim.claim)))
+        same_time = self._claims_at_time.setdefault(claim.start_time_s, [])
+        if quote in self._seen_quotes or any(
+            fuzz.ratio(claim.claim, other) >= DUPLICATE_CLAIM_SIMILARITY
+            for other in same_time
+        ):
+            return False
+        self._seen_quotes.add(quote)
+        same_time.append(claim.claim)
+        return True
+
+
+def _merge_chunk_claims(chunk_claims: list[list[VideoClaims]]) -> list[VideoClaims]:
+    """
+    Merges the claims found in overlapping chunks of a transcript.
+    Duplicates, as found by `ClaimDeduplicator`, are only kept once. The merged
+    claims are sorted by start time.
+    """
+    deduplicator = ClaimDeduplicator()
+    merged = [
+        claim for claims in chunk_claims for claim in claims if deduplicator.add(claim)
+    ]
+    return sorted(merged, key=lambda claim: claim.start_time_s)
+
+
+async def _extract_transcript_claims_with_retries(
+    transcript: list[TranscriptSentence],
+    keywords: dict[str, list[str]],
+    retry_policy: RetryPolicy,
+    mode: ExtractionMode = "quotes",
+    cache_scope: str | None = None,
+) -> list[VideoClaims]:
+    try:
+        return await retry_policy.run(
+            "claim_extraction",
+            lambda: _get_transcript_claims(transcript, keywords, mode, cache_scope),
+        )
+    except BudgetExceededError:
+        raise
+    except Exception as exc:
+        raise ClaimExtractionError(f"Claim extraction failed: {repr(exc)}") from exc
 
 
 async def extract_claims_from_transcript(
     transcript: list[TranscriptSentence],
     keywords: dict[str, list[str]],
     max_attempts: int = 1,
+    max_chunk_tokens: int | None = None,
+    overlap_tokens: int = DEFAULT_CHUNK_OVERLAP_TOKENS,
+    mode: ExtractionMode = "quotes",
+    retry_policy: RetryPolicy | None = None,
+    cache_scope: str | None = None,
 ) -> list[VideoClaims]:
     """
     Extract claims made in a video transcript.
 
+    Long transcripts can be split into overlapping chunks, which are processed
+    concurrently. The claims from each chunk are then merged and deduplicated.
+    If some chunks fail, the claims from the others are still returned.
+
     Args:
         transcript: list[str]
             A list of sentences in the transcript.
@@ -248,24 +465,86 @@ async def extract_claims_from_transcript(
             ```
         max_attempts: int
             The number of times the extraction will be attempted upon failure.
+            For chunked transcripts, this applies to each chunk.
+        max_chunk_tokens: int | None
+            The estimated number of tokens of transcript to send in each prompt.
+            If not given, the whole transcript is sent in one prompt.
+        overlap_tokens: int
+            The estimated number of tokens to repeat between consecutive chunks.
+        mode: ExtractionMode
+            "quotes" asks the model to quote each claim, and links the quotes back
+            to the transcript by fuzzy matching to find their timestamps.
+            "spans" numbers the sentences and asks for the first and last sentence
+            of each claim, so quotes and timestamps are looked up directly. This
+            uses much less output, and avoids fuzzy matching on long transcripts.
+        retry_policy: RetryPolicy | None
+            How to back off between attempts, which errors to retry, and any
+            deadline. Defaults to the policy set for "claim_extraction", making
+            `max_attempts` attempts.
+        cache_scope: str | None
+            Identifies who the keywords are for, e.g. an organisation and
+            language. If context caching is turned on, the prompt up to the
+            transcript is cached under it, and when the keywords for the scope
+            change the previously cached prompt is deleted.
 
     Returns:
         list[VideoClaim]: A list of claims found in the transcript.
+
+    Raises:
+        ClaimExtractionError:
+            If extraction fails on every attempt, or for every chunk.
     """
-    for _ in range(max_attempts):
-        try:
-            return await _get_transcript_claims(transcript, keywords)
-        except Exception as exc:
-            _logger.info(f"Error raised while running claim extraction: {repr(exc)}")
-            traceback.print_exc()
+    policy = retry_policy or get_retry_policy("claim_extraction", max_attempts)
+    if max_chunk_tokens is None:
+        return await _extract_transcript_claims_with_retries(
+            transcript, keywords, policy, mode, cache_scope
+        )
 
-    raise ClaimExtractionError(f"Claim extraction failed {max_attempts} times.")
+    chunks = chunk_by_tokens(
+        transcript, lambda sentence: sentence.text, max_chunk_tokens, overlap_tokens
+    )
+    chunk_claims, errors = await gather_successes(
+        _extract_transcript_claims_with_retries(
+            chunk, keywords, policy, mode, cache_scope
+        )
+        for chunk in chunks
+    )
+    if errors:
+        _logger.warning(
+            f"Claim extraction failed for {len(errors)} of {len(chunks)} chunks."
+        )
+        if not chunk_claims:
+            raise ClaimExtractionError(
+                f"Claim extraction failed for all {len(chunks)} chunks."
+            ) from errors[0]
+    return _merge_chunk_claims(chunk_claims)
 
 
-def _parse_video_claims(genai_response: str, video_id: UUID) -> list[VideoClaims]:
+def _parse_video_claims(
+    genai_response: str, video_id: UUID, min_completeness: float = 0.0
+) -> list[VideoClaims]:
+    """
+    Parses the claims found in a video. Claims which fail validation, e.g. with a
+    missing duration or an unknown claim type, are logged and skipped, so one bad
+    claim doesn't lose the rest.
+    If fewer than `min_completeness` of the claims are valid, the error for the
+    first skipped claim is raised instead.
+    """
     parsed = parse_model_json_output(genai_response)
     parsed = cast(list[dict[str, Any]], parsed)
-    genai_claims = [VideoClaimSchema(**claim) for claim in parsed]
+    genai_claims = []
+    errors: list[Exception] = []
+    for claim_dict in parsed:
+        try:
+            genai_claims.append(VideoClaimSchema(**claim_dict))
+        except (TypeError, ValidationError) as exc:
+            errors.append(exc)
+            REJECTED_ITEMS.inc(feature="get_video_claims")
+            _logger.info(
+                f"Skipped malformed json: {json.dumps(claim_dict, ensure_ascii=False)}"
+            )
+    if errors and len(genai_claims) < min_completeness * len(parsed):
+        raise errors[0]
     output_claims = [
         VideoClaims(
             video_id=video_id,
@@ -284,30 +563,54 @@ def _parse_video_claims(genai_response: str, video_id: UUID) -> list[VideoClaims
 
 
 async def _get_video_claims(
-    video_id: UUID, video_uri: str, keywords: dict[str, list[str]]
+    video_id: UUID,
+    video_uri: str,
+    keywords: dict[str, list[str]],
+    min_completeness: float = DEFAULT_MIN_COMPLETENESS,
+    cache_scope: str | None = None,
 ) -> list[VideoClaims]:
-    response = await run_prompt_async(
-        CLAIMS_PROMPT_VIDEO.replace("{KEYWORDS}", json.dumps(keywords)),
-        video_uri=video_uri,
-        system_instruction=CLAIMS_INSTRUCTION_VIDEO,
-        output_schema=list[VideoClaimSchema],
-        labels={
-            "feature": "get_video_claims",
-        },
-    )
-    try:
-        claims = _parse_video_claims(response, video_id)
-    except ValueError:
-        _logger.info(f"Parsing error: {traceback.format_exc()}")
-        fixed_response = await run_prompt_async(
-            FIX_JSON.replace("{TEXT}", response),
+    with STAGE_LATENCY.time(stage="claim_extraction"):
+        response = await run_prompt_async(
+            "",
+            cached_prefix=CLAIMS_PROMPT_VIDEO.replace(
+                "{KEYWORDS}", json.dumps(keywords)
+            ),
+            cache_scope=outline_scope(cache_scope, CLAIMS_PROMPT_VIDEO),
+            video_uri=video_uri,
+            system_instruction=CLAIMS_INSTRUCTION_VIDEO,
+            output_schema=list[VideoClaimSchema],
+            labels={
+                "feature": "get_video_claims",
+            },
+        )
+
+    async def fix_json(broken: str) -> str:
+        return await run_prompt_async(
+            FIX_JSON.replace("{TEXT}", broken),
             output_schema=list[VideoClaimSchema],
             labels={
                 "feature": "get_video_claims/fix_json",
             },
         )
-        claims = _parse_video_claims(fixed_response, video_id)
-    return claims
+
+    try:
+        return await parse_with_repair(
+            response,
+            lambda text: _parse_video_claims(text, video_id, min_completeness),
+            fix_json,
+            feature="get_video_claims",
+            errors=(TypeError, ValueError),
+        )
+    except (TypeError, ValueError):
+        # rerunning the video is expensive, so keep any valid claims we have
+        salvaged = _parse_video_claims(response, video_id)
+        if not salvaged:
+            raise
+        _logger.warning(
+            f"Could not fix the claims for video {video_id}, "
+            f"so only kept the {len(salvaged)} valid claims."
+        )
+        return salvaged
 
 
 async def extract_claims_from_video(
@@ -315,10 +618,16 @@ async def extract_claims_from_video(
     video_uri: str,
     keywords: dict[str, list[str]],
     max_attempts: int = 1,
+    min_completeness: float = DEFAULT_MIN_COMPLETENESS,
+    retry_policy: RetryPolicy | None = None,
+    cache_scope: str | None = None,
 ) -> list[VideoClaims]:
     """
     Extract claims made in a video.
     The claims can be audio or visual.
+    Claims which fail validation are skipped. The LLM is only asked to fix its
+    output if fewer than `min_completeness` of the claims are valid, rather than
+    rerunning the video.
 
     Args:
         video_id: UUID
@@ -336,15 +645,35 @@ async def extract_claims_from_video(
             ```
         max_attempts: int
             The number of times the extraction will be attempted upon failure.
+        min_completeness: float
+            The fraction of claims which must be valid to keep the valid ones
+            without asking the LLM to fix the output.
+        retry_policy: RetryPolicy | None
+            How to back off between attempts, which errors to retry, and any
+            deadline. Defaults to the policy set for "claim_extraction", making
+            `max_attempts` attempts.
+        cache_scope: str | None
+            Identifies who the keywords are for, e.g. an organisation and
+            language. If context caching is turned on, the prompt before the
+            video is cached under it, and when the keywords for the scope
+            change the previously cached prompt is deleted.
 
     Returns:
         list[VideoClaim]: A list of claims found in the video.
-    """
-    for _ in range(max_attempts):
-        try:
-            return await _get_video_claims(video_id, video_uri, keywords)
-        except Exception as exc:
-            _logger.info(f"Error raised while running claim extraction: {repr(exc)}")
-            traceback.print_exc()
 
-    raise ClaimExtractionError(f"Claim extraction failed {max_attempts} times.")
+    Raises:
+        ClaimExtractionError:
+            If extraction fails on every attempt.
+    """
+    policy = retry_policy or get_retry_policy("claim_extraction", max_attempts)
+    try:
+        return await policy.run(
+            "claim_extraction",
+            lambda: _get_video_claims(
+                video_id, video_uri, keywords, min_completeness, cache_scope
+            ),
+        )
+    except BudgetExceededError:
+        raise
+    except Exception as exc:
+        raise ClaimExtractionError(f"Claim extraction failed: {repr(exc)}") from exc
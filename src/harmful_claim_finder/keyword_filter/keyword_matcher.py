@@ -0,0 +1,251 @@
+"""
+A local keyword matcher, used to skip sentences which can't plausibly be about
+any topic before they are sent to the LLM topic filter.
+
+Keywords and text are case folded, accent folded and lightly stemmed, then matched
+with an Aho-Corasick automaton, so a sentence is checked against every keyword in
+one pass.
+"""
+
+import json
+import re
+import unicodedata
+from collections import deque
+from functools import lru_cache
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Stems shorter than this must match a whole word, otherwise they also match as
+# a prefix, so that "migration" (stem "migr") matches "migrants".
+_MIN_PREFIX_STEM_LENGTH = 4
+_MIN_STEM_LENGTH = 3
+
+# Suffixes are written accent folded, as they're stripped from folded tokens.
+_SUFFIXES: dict[str, tuple[str, ...]] = {
+    "en": (
+        "ations", "ation", "ments", "ment", "ness", "ings", "ing", "ies", "ied",
+        "ers", "ed", "es", "er", "ly", "s", "e",
+    ),
+    "es": (
+        "aciones", "acion", "amientos", "amiento", "imientos", "imiento", "idades",
+        "idad", "mente", "ismos", "ismo", "istas", "ista", "ados", "adas", "idos",
+        "idas", "ado", "ada", "ido", "ida", "ar", "er", "ir", "es", "os", "as", "o",
+        "a", "e", "s",
+    ),
+    "ca": (
+        "acions", "acio", "ament", "ades", "ats", "ada", "at", "es", "os", "a", "e",
+        "s",
+    ),
+    "de": (
+        "ungen", "ung", "heiten", "heit", "keiten", "keit", "lich", "isch", "ern",
+        "em", "en", "er", "es", "e", "n", "s",
+    ),
+    "tr": (
+        "lari", "leri", "lar", "ler", "dan", "den", "tan", "ten", "nin", "in", "un",
+        "da", "de", "ta", "te", "i", "u", "a", "e",
+    ),
+    "fr": (
+        "ations", "ation", "ements", "ement", "ments", "ment", "ites", "ite", "euses",
+        "euse", "eurs", "eur", "ees", "ee", "es", "er", "e", "s", "x",
+    ),
+    "it": (
+        "azioni", "azione", "amenti", "amento", "mente", "ita", "ismi", "ismo",
+        "isti", "ista", "are", "ere", "ire", "i", "e", "o", "a",
+    ),
+    "pt": (
+        "acoes", "acao", "amentos", "amento", "mente", "idades", "idade", "ismos",
+        "ismo", "istas", "ista", "ados", "adas", "ado", "ada", "ar", "er", "ir", "os",
+        "as", "es", "o", "a", "e", "s",
+    ),
+}  # fmt: skip
+
+# When no language is given, strip the longest suffix from any language.
+_ALL_SUFFIXES = tuple(
+    sorted({s for suffixes in _SUFFIXES.values() for s in suffixes}, key=len)[::-1]
+)
+
+
+def fold_text(text: str) -> str:
+    """
+    Case folds text and strips accents, so "Inmigración" becomes "inmigracion".
+
+    Parameters
+    ----------
+    text: str
+        The text to fold.
+
+    Returns
+    -------
+    str
+        The folded text.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return folded.replace("ı", "i")
+
+
+def stem(token: str, language: str | None = None) -> str:
+    """
+    Strips the longest matching suffix from a folded token.
+    This is deliberately simple, as it only has to map a keyword and its close
+    variants to the same stem.
+
+    Parameters
+    ----------
+    token: str
+        A single, already folded, word.
+    language: str | None
+        ISO 639-1 code of the language. If it isn't known, suffixes from all
+        supported languages are used.
+
+    Returns
+    -------
+    str
+        The stemmed token.
+    """
+    suffixes = _SUFFIXES.get(language, _ALL_SUFFIXES) if language else _ALL_SUFFIXES
+    for suffix in suffixes:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM_LENGTH:
+            return token[: -len(suffix)]
+    return token
+
+
+def normalise(text: str, language: str | None = None) -> str:
+    """
+    Folds, tokenises and stems text, returning the stems separated by single spaces,
+    with a leading and trailing space so matches can be anchored to word boundaries.
+    """
+    tokens = _WORD_PATTERN.findall(fold_text(text))
+    return " " + " ".join(stem(token, language) for token in tokens) + " "
+
+
+class KeywordMatcher:
+    """
+    An Aho-Corasick automaton over the normalised keywords for each topic.
+
+    Attributes
+    ----------
+    keywords: dict[str, list[str]]
+        Topic names mapped to the keywords for that topic.
+    language: str | None
+        The language used for stemming, if known.
+    """
+
+    def __init__(
+        self, keywords: dict[str, list[str]], language: str | None = None
+    ) -> None:
+        """
+        Parameters
+        ----------
+        keywords: dict[str, list[str]]
+        language: str | None
+        """
+        self.keywords = keywords
+        self.language = language
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[set[str]] = [set()]
+        for topic, topic_keywords in keywords.items():
+            for keyword in topic_keywords:
+                pattern = self._keyword_pattern(keyword)
+                if pattern.strip():
+                    self._add_pattern(pattern, topic)
+        self._build_failure_links()
+
+    def _keyword_pattern(self, keyword: str) -> str:
+        pattern = normalise(keyword, self.language).rstrip(" ")
+        last_stem = pattern.rsplit(" ", 1)[-1]
+        if len(last_stem) < _MIN_PREFIX_STEM_LENGTH:
+            pattern += " "
+        return pattern
+
+    def _add_pattern(self, pattern: str, topic: str) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(topic)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def match(self, text: str) -> set[str]:
+        """
+        Finds the topics with at least one keyword, or close variant, in the text.
+
+        Parameters
+        ----------
+        text: str
+            The text to search.
+
+        Returns
+        -------
+        set[str]
+            The topics which have a keyword in the text.
+        """
+        topics: set[str] = set()
+        state = 0
+        for char in normalise(text, self.language):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                topics |= self._output[state]
+        return topics
+
+    def has_match(self, text: str) -> bool:
+        """
+        Returns True if any keyword, or close variant, appears in the text.
+        """
+        return bool(self.match(text))
+
+
+# Each organisation and language has its own keywords, so only keep the matchers
+# used most recently.
+MAX_CACHED_MATCHERS = 128
+
+
+@lru_cache(maxsize=MAX_CACHED_MATCHERS)
+def _compile_matcher(key: str) -> KeywordMatcher:
+    keywords, language = json.loads(key)
+    return KeywordMatcher(keywords, language)
+
+
+def get_keyword_matcher(
+    keywords: dict[str, list[str]], language: str | None = None
+) -> KeywordMatcher:
+    """
+    Returns a compiled matcher for a keyword dictionary.
+    Matchers are compiled once per keyword dictionary and language, and reused.
+    Only the `MAX_CACHED_MATCHERS` most recently used matchers are kept.
+
+    Parameters
+    ----------
+    keywords: dict[str, list[str]]
+        Topic names mapped to the keywords for that topic.
+    language: str | None
+        The language used for stemming, if known.
+
+    Returns
+    -------
+    KeywordMatcher
+        The compiled matcher.
+    """
+    return _compile_matcher(
+        json.dumps([keywords, language], sort_keys=True, ensure_ascii=False)
+    )
@@ -1,18 +1,57 @@
+import asyncio
+import contextvars
 import logging
 import re
-import traceback
+from typing import Any, Callable, Literal, overload
 
-from genai_utils.gemini import GeminiError, run_prompt_async
 from genai_utils.parsing import ParsedType, parse_model_json_output
+from pydantic import BaseModel, Field, ValidationError
 
-from harmful_claim_finder.keyword_filter.prompts import FIX_JSON, TOPIC_PROMPT
-from harmful_claim_finder.utils.models import ParsingError, TopicDetectionError
+from harmful_claim_finder.keyword_filter.keyword_matcher import get_keyword_matcher
+from harmful_claim_finder.keyword_filter.prompts import (
+    FIX_INDEX_JSON,
+    FIX_JSON,
+    INDEXED_TOPIC_PROMPT,
+    PACKED_INDEXED_TOPIC_PROMPT,
+    PACKED_TOPIC_PROMPT,
+    TOPIC_PROMPT,
+)
+from harmful_claim_finder.utils.cache import (
+    TieredCache,
+    make_fingerprint,
+    normalise_sentence,
+    text_hash,
+)
+from harmful_claim_finder.utils.chunking import chunk_by_tokens, gather_successes
+from harmful_claim_finder.utils.context_cache import outline_scope
+from harmful_claim_finder.utils.gemini import run_prompt_async
+from harmful_claim_finder.utils.json_recovery import (
+    PARTIAL_TIERS,
+    parse_with_repair_tier,
+)
+from harmful_claim_finder.utils.metrics import STAGE_LATENCY
+from harmful_claim_finder.utils.models import (
+    BudgetExceededError,
+    ParsingError,
+    TopicDetectionError,
+)
+from harmful_claim_finder.utils.retry import RetryPolicy, get_retry_policy
+from harmful_claim_finder.utils.tokens import estimate_tokens
 
 AllKeywordsType = dict[str, dict[str, dict[str, dict[str, list[str]]]]]
+PrefilterMode = Literal["off", "strict", "context"]
+OutputMode = Literal["sentences", "indices"]
 
 logger = logging.getLogger(__name__)
 
 
+class TopicSentencesSchema(BaseModel):
+    topic: str = Field(description="The number of the topic, e.g. '1'.")
+    sentence_ids: list[int] = Field(
+        description="The numbers of the sentences which make claims about the topic."
+    )
+
+
 class TopicKeywordFilter:
     """
     A class used to create a GenAI keyword topic filter.
@@ -30,23 +69,101 @@ class TopicKeywordFilter:
         lists of keywords for the topic.
     prompt_outline: str
         This is the bulk of the prompt. It should contain the substitutable parts
-        [KEYWORDS] and [TEXT]. It will likely be `TOPIC_KEYWORD_ARTICLE_PROMPT`.
+        [KEYWORDS] and [TEXT]. Defaults to `TOPIC_PROMPT`, or
+        `INDEXED_TOPIC_PROMPT` in "indices" output mode.
+    prefilter: PrefilterMode
+        Whether to check sentences against the keywords locally before prompting.
+        "off" sends every sentence to the LLM.
+        "strict" only sends sentences containing a keyword or close variant.
+        "context" sends those sentences plus `context_sentences` either side.
+        In both "strict" and "context" modes, articles with no keyword matches
+        are not sent to the LLM at all.
+    context_sentences: int
+        How many sentences either side of a match to send in "context" mode.
+    language: str | None
+        ISO 639-1 code of the keywords' language, used for stemming in the
+        prefilter. If not given, suffixes from all supported languages are used.
+    cache: TieredCache[list[str]] | None
+        Cache of the topics found for each sentence. Entries are keyed by the
+        normalised sentence and a fingerprint of the mapped keywords and prompt
+        outline. If not given, every sentence is sent to the LLM.
+    packed_prompt_outline: str
+        The prompt used when several articles are packed into one prompt by
+        `run_all_for_articles`. It should contain [KEYWORDS] and [TEXT].
+        Defaults to `PACKED_TOPIC_PROMPT`, or `PACKED_INDEXED_TOPIC_PROMPT` in
+        "indices" output mode.
+    max_chunk_tokens: int | None
+        The estimated number of tokens of article to send in each prompt.
+        Longer articles are split into overlapping chunks, which are run
+        concurrently. If not given, each article is sent in one prompt.
+    chunk_overlap_tokens: int
+        The estimated number of tokens to repeat between consecutive chunks.
+    cache_scope: str | None
+        Identifies the organisation and language the filter is for, e.g.
+        "fullfact/en". If context caching is turned on, the prompt up to the
+        article text is cached, and when the keywords for this scope change the
+        previously cached prompt is deleted.
+    output_mode: OutputMode
+        What the LLM returns for each topic.
+        "sentences" asks for the text of each sentence, which is matched back to
+        the article exactly.
+        "indices" numbers the sentences in the prompt and asks for the numbers
+        only, validated against `TopicSentencesSchema`. This uses far fewer
+        output tokens, and a sentence can't be lost to a small change in its text.
     """
 
     def __init__(
         self,
         keywords: dict[str, list[str]],
-        prompt_outline: str = TOPIC_PROMPT,
+        prompt_outline: str | None = None,
+        prefilter: PrefilterMode = "off",
+        context_sentences: int = 1,
+        language: str | None = None,
+        cache: TieredCache[list[str]] | None = None,
+        packed_prompt_outline: str | None = None,
+        max_chunk_tokens: int | None = None,
+        chunk_overlap_tokens: int = 100,
+        cache_scope: str | None = None,
+        output_mode: OutputMode = "sentences",
     ) -> None:
         """
         Parameters
         ----------
         keywords: dict[str, list[str]]
-        prompt_outline: str
+        prompt_outline: str | None
+        prefilter: PrefilterMode
+        context_sentences: int
+        language: str | None
+        cache: TieredCache[list[str]] | None
+        packed_prompt_outline: str | None
+        max_chunk_tokens: int | None
+        chunk_overlap_tokens: int
+        cache_scope: str | None
+        output_mode: OutputMode
         """
         self.keywords = keywords
-        self.prompt_outline = prompt_outline
+        self.output_mode = output_mode
+        indexed = output_mode == "indices"
+        self.prompt_outline = prompt_outline or (
+            INDEXED_TOPIC_PROMPT if indexed else TOPIC_PROMPT
+        )
+        self.prefilter = prefilter
+        self.context_sentences = context_sentences
+        self.language = language
         self.mapped_keywords, self.topic_name_map = self.do_topic_name_mapping()
+        self.cache = cache
+        self.packed_prompt_outline = packed_prompt_outline or (
+            PACKED_INDEXED_TOPIC_PROMPT if indexed else PACKED_TOPIC_PROMPT
+        )
+        self.max_chunk_tokens = max_chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.cache_scope = cache_scope
+        self.cache_fingerprint = make_fingerprint(
+            self.mapped_keywords,
+            self.prompt_outline,
+            self.packed_prompt_outline,
+            self.output_mode,
+        )
 
     def do_topic_name_mapping(self) -> tuple[dict[str, list[str]], dict[str, str]]:
         """
@@ -98,6 +215,83 @@ class TopicKeywordFilter:
         }
         return unmapped_result
 
+    def prefilter_sentences(self, article: list[str]) -> list[str]:
+        """Selects the sentences worth sending to the LLM, using the local keyword
+        matcher. See `prefilter` for the available modes.
+
+        Parameters
+        ----------
+        article: list[str]
+            The article to check, formatted as a list of strings.
+
+        Returns
+        -------
+        list[str]
+            The sentences to send to the LLM, in their original order.
+            Empty if no sentence could plausibly be about any topic.
+        """
+        if self.prefilter == "off":
+            return article
+
+        matcher = get_keyword_matcher(self.keywords, self.language)
+        matched = [
+            i for i, sentence in enumerate(article) if matcher.has_match(sentence)
+        ]
+        if self.prefilter == "strict":
+            keep = set(matched)
+        else:
+            keep = {
+                j
+                for i in matched
+                for j in range(
+                    i - self.context_sentences, i + self.context_sentences + 1
+                )
+            }
+        return [sentence for i, sentence in enumerate(article) if i in keep]
+
+    def make_keyword_block(self) -> str:
+        """Describes each numbered topic and its keywords, for use in the prompt.
+
+        Returns
+        -------
+        str
+            The keyword section of the prompt.
+        """
+        # This version is deprecated as it encourages Gemini to produce Python as output
+        # prompt = prompt.replace("[KEYWORDS]", str(self.mapped_keywords))
+        # Instead we make the prompt look more "english" and less "python":
+        keyword_prompt = ""
+        for topic, keyword_list in self.mapped_keywords.items():
+            keyword_prompt += (
+                f"Topic '{topic}' is defined by the terms "
+                f"[{', '.join(keyword_list)}] \n"
+            )
+        return keyword_prompt
+
+    def split_prompt(self, prompt_outline: str, text: str) -> tuple[str, str]:
+        """Fills in a prompt outline, split into the static part before the text,
+        which can be cached, and the rest.
+
+        Parameters
+        ----------
+        prompt_outline: str
+            The prompt outline, containing [KEYWORDS] and [TEXT].
+        text: str
+            The text to substitute for [TEXT].
+
+        Returns
+        -------
+        str
+            The prompt up to the text, containing the keywords.
+        str
+            The rest of the prompt, containing the text.
+        """
+        split_at = max(prompt_outline.find("[TEXT]"), 0)
+        keyword_block = self.make_keyword_block()
+        prefix = prompt_outline[:split_at].replace("[KEYWORDS]", keyword_block)
+        rest = prompt_outline[split_at:].replace("[KEYWORDS]", keyword_block)
+        return prefix, rest.replace("[TEXT]", text)
+
     def make_keyword_prompt(self, text: list[str]) -> str:
         """Makes prompt by substituting keywords and article
         text into prompt outline.
@@ -114,22 +308,80 @@ class TopicKeywordFilter:
             The final prompt to send to the LLM, containing all the keywords
             and the article text.
         """
-        prompt = self.prompt_outline
-        keywords_for_prompt = self.mapped_keywords
+        return "".join(self.split_prompt(self.prompt_outline, self.format_text(text)))
 
-        # This version is deprecated as it encourages Gemini to produce Python as output
-        # prompt = prompt.replace("[KEYWORDS]", str(keywords_for_prompt))
-        # Instead we make the prompt look more "english" and less "python":
-        keyword_prompt = ""
-        for topic, keyword_list in keywords_for_prompt.items():
-            keyword_prompt += (
-                f"Topic '{topic}' is defined by the terms "
-                f"[{', '.join(keyword_list)}] \n"
+    def format_text(self, sentences: list[str]) -> str:
+        """Formats sentences for the prompt. In "indices" output mode, each
+        sentence is put on its own line, after its number.
+
+        Parameters
+        ----------
+        sentences: list[str]
+            The sentences to format.
+
+        Returns
+        -------
+        str
+            The sentences, as they appear in the prompt.
+        """
+        if self.output_mode == "indices":
+            return "\n".join(
+                f"{i}: {' '.join(sentence.split())}"
+                for i, sentence in enumerate(sentences)
             )
+        return str(sentences)
 
-        prompt = prompt.replace("[KEYWORDS]", keyword_prompt)
-        prompt = prompt.replace("[TEXT]", str(text))
-        return prompt
+    def make_packed_prompt(self, articles: list[list[str]]) -> str:
+        """Makes a prompt containing several articles, each under its own header.
+
+        Parameters
+        ----------
+        articles: list[list[str]]
+            The articles to check against the keywords, each formatted as a list
+            of strings.
+
+        Returns
+        -------
+        str
+            The final prompt to send to the LLM, containing all the keywords
+            and the text of every article.
+        """
+        return "".join(
+            self.split_prompt(self.packed_prompt_outline, self.pack_articles(articles))
+        )
+
+    def pack_articles(self, articles: list[list[str]]) -> str:
+        """Formats several articles as one text, each under its own header.
+        In "indices" output mode, sentences are numbered across all the articles,
+        in order of first appearance, and repeated sentences keep one number.
+
+        Parameters
+        ----------
+        articles: list[list[str]]
+            The articles, each formatted as a list of strings.
+
+        Returns
+        -------
+        str
+            The text of every article.
+        """
+        if self.output_mode == "indices":
+            numbers: dict[str, int] = {}
+            for article in articles:
+                for sentence in article:
+                    numbers.setdefault(sentence, len(numbers))
+            return "\n".join(
+                f"### Transcript {i + 1}\n"
+                + "\n".join(
+                    f"{numbers[sentence]}: {' '.join(sentence.split())}"
+                    for sentence in article
+                )
+                for i, article in enumerate(articles)
+            )
+        return "\n".join(
+            f"### Transcript {i + 1}\n{str(article)}"
+            for i, article in enumerate(articles)
+        )
 
     @staticmethod
     def parse(response: str) -> ParsedType:
@@ -213,12 +465,302 @@ class TopicKeywordFilter:
 
         return result_with_all_sentences
 
+    def format_indexed_results(
+        self, result: ParsedType, sentences: list[str]
+    ) -> dict[str, list[str]]:
+        """Formats the output of a prompt in "indices" output mode, mapping the
+        sentence numbers back to the sentences in one pass.
+        Numbers outside the prompt, and unknown topics, are skipped.
+
+        Parameters
+        ----------
+        result: `ParsedType`
+            A list of `TopicSentencesSchema` dictionaries. A dictionary of topics
+            to lists of sentence numbers is also accepted.
+        sentences: list[str]
+            The sentences in the prompt, in the order they were numbered.
+
+        Returns
+        -------
+        dict[str, list[str]]
+            Returns dictionary where the keys are the sentences, and values are
+            lists of topics associated with those sentences.
+
+        Raises
+        ------
+        ParsingError:
+            If the output doesn't match `TopicSentencesSchema`.
+        """
+        if isinstance(result, dict):
+            result = [
+                {"topic": topic, "sentence_ids": ids} for topic, ids in result.items()
+            ]
+        if result is None:
+            result = []
+        if not isinstance(result, list):
+            raise ParsingError("Topic detection could not parse gemini output")
+
+        detected: dict[str, list[str]] = {sent: [] for sent in sentences}
+        skipped = 0
+        for item in result:
+            try:
+                parsed = TopicSentencesSchema.model_validate(item)
+            except ValidationError as exc:
+                raise ParsingError(
+                    "Topic detection could not parse gemini output"
+                ) from exc
+            if parsed.topic not in self.mapped_keywords:
+                skipped += len(parsed.sentence_ids)
+                continue
+            for index in parsed.sentence_ids:
+                if not 0 <= index < len(sentences):
+                    skipped += 1
+                    continue
+                topics = detected[sentences[index]]
+                if parsed.topic not in topics:
+                    topics.append(parsed.topic)
+        if skipped:
+            logger.info(f"Skipped {skipped} unknown topics or sentence numbers.")
+        return detected
+
+    def all_matched(self, result: ParsedType, sentences: list[str]) -> bool:
+        """Checks whether everything in the parsed output of a prompt was matched
+        to a sentence in the prompt by `format_results` or `format_indexed_results`.
+        If not, a sentence given no topics may have been dropped, rather than
+        having none.
+
+        Parameters
+        ----------
+        result: `ParsedType`
+            The parsed output of the prompt.
+        sentences: list[str]
+            The sentences in the prompt.
+
+        Returns
+        -------
+        bool
+            True if every sentence or sentence number in the output was matched.
+        """
+        if self.output_mode == "indices":
+            if isinstance(result, dict):
+                result = [
+                    {"topic": topic, "sentence_ids": ids}
+                    for topic, ids in result.items()
+                ]
+            if not isinstance(result, list):
+                return False
+            for item in result:
+                try:
+                    parsed = TopicSentencesSchema.model_validate(item)
+                except ValidationError:
+                    return False
+                if parsed.topic not in self.mapped_keywords or not all(
+                    0 <= index < len(sentences) for index in parsed.sentence_ids
+                ):
+                    return False
+            return True
+        if not isinstance(result, dict):
+            return False
+        in_prompt = set(sentences)
+        return all(
+            isinstance(values, list) and all(value in in_prompt for value in values)
+            for values in result.values()
+        )
+
+    def cache_key(self, sentence: str) -> str:
+        """Returns the cache key for a sentence's topics.
+        The key depends on the normalised sentence, the mapped keywords and the
+        prompt outline, so changing the keywords or the prompt invalidates the cache.
+
+        Parameters
+        ----------
+        sentence: str
+            The sentence to make the key for.
+
+        Returns
+        -------
+        str
+            The cache key.
+        """
+        return text_hash(normalise_sentence(sentence), self.cache_fingerprint)
+
+    async def _split_cached(
+        self, sentences: list[str]
+    ) -> tuple[list[str], dict[str, list[str]]]:
+        """Looks sentences up in the cache, if there is one.
+
+        Parameters
+        ----------
+        sentences: list[str]
+            The sentences to look up.
+
+        Returns
+        -------
+        list[str]
+            The sentences which weren't in the cache, in their original order.
+        dict[str, list[str]]
+            The cached topic numbers for the sentences which were.
+        """
+        if self.cache is None or not sentences:
+            return sentences, {}
+        keys = {sent: self.cache_key(sent) for sent in sentences}
+        cached_by_key = await self.cache.get_many_async(set(keys.values()))
+        cached = {
+            sent: cached_by_key[key]
+            for sent, key in keys.items()
+            if key in cached_by_key
+        }
+        logger.debug(f"{len(cached)} sentences had cached topics.")
+        return [sent for sent in sentences if sent not in cached], cached
+
+    def prefix_scope(self, prompt_outline: str) -> str | None:
+        """Returns the scope to cache the start of a prompt outline under, so the
+        single and packed prompts for the same filter are cached separately.
+
+        Parameters
+        ----------
+        prompt_outline: str
+            The prompt outline being used.
+
+        Returns
+        -------
+        str | None
+            The scope, or None if the filter has no `cache_scope`.
+        """
+        return outline_scope(self.cache_scope, prompt_outline)
+
+    async def _detect_topics(
+        self,
+        prompt: tuple[str, str],
+        sentences: list[str],
+        retry_policy: RetryPolicy,
+        cache_scope: str | None = None,
+        allow_partial: bool = True,
+    ) -> dict[str, list[str]]:
+        """Runs a topic prompt, and parses the output. Broken JSON is repaired
+        locally if possible, and otherwise the LLM is asked to fix it.
+        The whole thing is retried on failure, following `retry_policy`.
+        Results are added to the cache, if there is one. If the output mentions
+        sentences which weren't matched to the prompt, or was cut off and only
+        partly repaired, only sentences with topics are cached, as those with none
+        may just have been dropped.
+
+        Parameters
+        ----------
+        prompt: tuple[str, str]
+            The prompt to run, split into a static prefix which can be cached, and
+            the rest, as made by `split_prompt`.
+        sentences: list[str]
+            The sentences included in the prompt.
+        retry_policy: RetryPolicy
+            How many attempts to make, and how to back off between them.
+        cache_scope: str | None
+            The scope to cache the prompt prefix under, from `prefix_scope`.
+        allow_partial: bool
+            If False, output which was cut off and only partly repaired counts as
+            a failed attempt, rather than leaving the sentences it dropped without
+            topics.
+
+        Returns
+        -------
+        dict[str, list[str]]
+            Each sentence mapped to its topics, still identified by topic number.
+
+        Raises
+        ------
+        TopicDetectionError:
+            If topic detection fails on every attempt, an exception will be raised.
+        """
+        prefix, rest = prompt
+        format_results: Callable[[ParsedType, list[str]], dict[str, list[str]]]
+        if self.output_mode == "indices":
+            format_results = self.format_indexed_results
+            fix_json = FIX_INDEX_JSON
+            schema: dict[str, Any] = {"output_schema": list[TopicSentencesSchema]}
+        else:
+            format_results = self.format_results
+            fix_json = FIX_JSON
+            schema = {}
+
+        async def fix(broken: str) -> str:
+            return await run_prompt_async(
+                fix_json.replace("{INPUT_TEXT}", broken),
+                labels={
+                    "feature": "run_all_for_article/fix_json",
+                },
+                **schema,
+            )
+
+        def parse(text: str) -> tuple[dict[str, list[str]], bool]:
+            parsed = self.parse(text)
+            return format_results(parsed, sentences), self.all_matched(
+                parsed, sentences
+            )
+
+        async def detect() -> tuple[dict[str, list[str]], bool]:
+            with STAGE_LATENCY.time(stage="topic_filter"):
+                response = await run_prompt_async(
+                    rest,
+                    labels={
+                        "feature": "run_all_for_article",
+                    },
+                    cached_prefix=prefix,
+                    cache_scope=cache_scope,
+                    **schema,
+                )
+            (detected, all_matched), tier = await parse_with_repair_tier(
+                response,
+                parse,
+                fix,
+                feature="run_all_for_article",
+                errors=(ParsingError, ValueError),
+            )
+            if tier in PARTIAL_TIERS:
+                if not allow_partial:
+                    raise ParsingError(
+                        f"Topic detection output was cut off, and {tier} only "
+                        "repaired part of it."
+                    )
+                all_matched = False
+            return detected, all_matched
+
+        try:
+            detected, all_matched = await retry_policy.run("topic_filter", detect)
+        except BudgetExceededError:
+            raise
+        except Exception as exc:
+            raise TopicDetectionError(f"Topic detection failed: {repr(exc)}") from exc
+
+        if self.cache is not None:
+            if not all_matched:
+                logger.info(
+                    "Some topic output didn't match the prompt, so only caching "
+                    "sentences with topics."
+                )
+            await self.cache.set_many_async(
+                {
+                    self.cache_key(sent): detected.get(sent, [])
+                    for sent in sentences
+                    if all_matched or detected.get(sent)
+                }
+            )
+        return detected
+
     async def run_all_for_article(
-        self, article: list[str], max_attempts: int = 3
+        self,
+        article: list[str],
+        max_attempts: int = 3,
+        retry_policy: RetryPolicy | None = None,
+        allow_partial: bool = True,
     ) -> dict[str, list[str]]:
         """Runs all functions on a new article.
         Makes the prompt, runs the prompt and parses the output, formats the
         result.
+        If the filter has a cache, only sentences missing from the cache are sent
+        to the LLM.
+        If the filter has a `max_chunk_tokens`, long articles are split into chunks
+        which are run concurrently. If some chunks fail, sentences only in those
+        chunks are given no topics.
 
         Parameters
         ----------
@@ -227,6 +769,15 @@ class TopicKeywordFilter:
 
         max_attempts: int
             The number of retries to attempt if there's an exception.
+        retry_policy: RetryPolicy | None
+            How to back off between attempts, which errors to retry, and any
+            deadline. Defaults to the policy set for "topic_filter", making
+            `max_attempts` attempts.
+        allow_partial: bool
+            If False, a chunk failing fails the whole article, rather than leaving
+            the sentences only in that chunk without topics. Output which was cut
+            off and only partly repaired counts as a failed attempt too, rather
+            than leaving the sentences it dropped without topics.
 
         Returns
         -------
@@ -237,36 +788,337 @@ class TopicKeywordFilter:
         Raises
         ------
         TopicDetectionError:
-            If topic detection fails `max_attempts` times, an exception will be raised.
+            If topic detection fails on every attempt, an exception will be raised.
         """
-        for _ in range(max_attempts):
-            try:
-                prompt = self.make_keyword_prompt(article)
-                response = await run_prompt_async(
-                    prompt,
-                    labels={
-                        "feature": "run_all_for_article",
-                    },
+        policy = retry_policy or get_retry_policy("topic_filter", max_attempts)
+        to_send = self.prefilter_sentences(article)
+        logger.debug(
+            f"Prefilter kept {len(to_send)} of {len(article)} sentences for topic detection."
+        )
+        to_send, cached = await self._split_cached(to_send)
+
+        detected: dict[str, list[str]] = {}
+        if to_send:
+            if self.max_chunk_tokens is None:
+                chunks = [to_send]
+            else:
+                chunks = chunk_by_tokens(
+                    to_send, str, self.max_chunk_tokens, self.chunk_overlap_tokens
                 )
-                result = self.parse(response)
-                try:
-                    formatted_result = self.format_results(result, article)
-                except ParsingError:
-                    logger.info(f"Parsing error: {traceback.format_exc()}")
-                    fixed_json = await run_prompt_async(
-                        FIX_JSON.replace("{INPUT_TEXT}", response),
-                        labels={
-                            "feature": "run_all_for_article/fix_json",
-                        },
+            chunk_results, errors = await gather_successes(
+                self._detect_topics(
+                    self.split_prompt(self.prompt_outline, self.format_text(chunk)),
+                    chunk,
+                    policy,
+                    self.prefix_scope(self.prompt_outline),
+                    allow_partial,
+                )
+                for chunk in chunks
+            )
+            if errors:
+                if not chunk_results or not allow_partial:
+                    raise errors[0]
+                logger.warning(
+                    f"Topic detection failed for {len(errors)} of {len(chunks)} chunks."
+                )
+            for chunk_result in chunk_results:
+                for sent, topics in chunk_result.items():
+                    detected[sent] = list(
+                        dict.fromkeys([*detected.get(sent, []), *topics])
                     )
-                    fixed_result = self.parse(fixed_json)
-                    formatted_result = self.format_results(fixed_result, article)
-                formatted_result = self.do_result_unmapping(formatted_result)
-                return formatted_result
-            except GeminiError as exc:
-                logger.info(f"Error while running Gemini: {repr(exc)}")
-            except Exception as exc:
-                logger.info(f"Error raised while running topic detection: {repr(exc)}")
-                traceback.print_exc()
 
-        raise TopicDetectionError(f"Topic detection failed {max_attempts} times.")
+        merged = {sent: cached.get(sent, detected.get(sent, [])) for sent in article}
+        return self.do_result_unmapping(merged)
+
+    @overload
+    async def run_all_for_articles(
+        self,
+        articles: list[list[str]],
+        token_budget: int = ...,
+        max_attempts: int = ...,
+        retry_policy: RetryPolicy | None = ...,
+        return_exceptions: Literal[False] = ...,
+        allow_partial: bool = ...,
+    ) -> list[dict[str, list[str]]]: ...
+
+    @overload
+    async def run_all_for_articles(
+        self,
+        articles: list[list[str]],
+        token_budget: int = ...,
+        max_attempts: int = ...,
+        retry_policy: RetryPolicy | None = ...,
+        *,
+        return_exceptions: Literal[True],
+        allow_partial: bool = ...,
+    ) -> list[dict[str, list[str]] | Exception]: ...
+
+    async def run_all_for_articles(
+        self,
+        articles: list[list[str]],
+        token_budget: int = 8_000,
+        max_attempts: int = 3,
+        retry_policy: RetryPolicy | None = None,
+        return_exceptions: bool = False,
+        allow_partial: bool = True,
+    ) -> list[dict[str, list[str]]] | list[dict[str, list[str]] | Exception]:
+        """Finds topics for several articles, packing as many articles as fit in
+        `token_budget` into each prompt, so the keyword section is only sent once
+        per prompt rather than once per article.
+        Prompts are run concurrently, and the results are split back per article.
+        An article which is too big for the budget on its own gets its own prompt.
+        If a packed prompt fails on every attempt, each of its articles is tried
+        again in a prompt of its own, so one article can't fail the others.
+
+        Parameters
+        ----------
+        articles: list[list[str]]
+            The articles to check, each formatted as a list of strings.
+        token_budget: int
+            The estimated number of tokens to fill each prompt up to.
+        max_attempts: int
+            The number of retries to attempt for each prompt if there's an exception.
+        retry_policy: RetryPolicy | None
+            How to back off between attempts, which errors to retry, and any
+            deadline. Defaults to the policy set for "topic_filter", making
+            `max_attempts` attempts.
+        return_exceptions: bool
+            If True, the error for an article whose topic detection failed is
+            returned in place of its result, rather than raised.
+        allow_partial: bool
+            If False, output which was cut off and only partly repaired counts as
+            a failed attempt, rather than leaving the sentences it dropped without
+            topics.
+
+        Returns
+        -------
+        list[dict[str, list[str]]]
+            One dictionary per article, in the same order as `articles`, where the
+            keys are sentences from the article, and values are lists of topics
+            associated with those sentences.
+
+        Raises
+        ------
+        TopicDetectionError:
+            If topic detection fails on every attempt for any article, unless
+            `return_exceptions` is True.
+        BudgetExceededError:
+            If an active token budget has been used up.
+        """
+        policy = retry_policy or get_retry_policy("topic_filter", max_attempts)
+        pending: list[list[str]] = []
+        cached: list[dict[str, list[str]]] = []
+        for article in articles:
+            to_send, article_cached = await self._split_cached(
+                self.prefilter_sentences(article)
+            )
+            pending.append(to_send)
+            cached.append(article_cached)
+
+        packs: list[list[int]] = []
+        for i, to_send in enumerate(pending):
+            if not to_send:
+                continue
+            # headers and sentence numbers depend on the rest of the pack, so the
+            # prompt it would make is estimated with this article added
+            if packs and (
+                estimate_tokens(
+                    self.make_packed_prompt([pending[j] for j in [*packs[-1], i]])
+                )
+                <= token_budget
+            ):
+                packs[-1].append(i)
+            else:
+                packs.append([i])
+        logger.debug(f"Packed {len(articles)} articles into {len(packs)} prompts.")
+
+        async def run_pack(pack: list[int]) -> dict[str, list[str]]:
+            pack_articles = [pending[i] for i in pack]
+            sentences = list(
+                dict.fromkeys(s for article in pack_articles for s in article)
+            )
+            prompt = self.split_prompt(
+                self.packed_prompt_outline, self.pack_articles(pack_articles)
+            )
+            return await self._detect_topics(
+                prompt,
+                sentences,
+                policy,
+                self.prefix_scope(self.packed_prompt_outline),
+                allow_partial,
+            )
+
+        async def run_single(i: int) -> dict[str, list[str]]:
+            return await self._detect_topics(
+                self.split_prompt(self.prompt_outline, self.format_text(pending[i])),
+                pending[i],
+                policy,
+                self.prefix_scope(self.prompt_outline),
+                allow_partial,
+            )
+
+        def outcome(
+            result: dict[str, list[str]] | BaseException,
+        ) -> dict[str, list[str]] | Exception:
+            # a used up budget or a cancellation stops every article
+            if isinstance(result, BudgetExceededError) or not isinstance(
+                result, (dict, Exception)
+            ):
+                raise result
+            return result
+
+        detected: dict[int, dict[str, list[str]] | Exception] = {}
+        unpacked: list[int] = []
+        pack_results = await asyncio.gather(
+            *(run_pack(pack) for pack in packs), return_exceptions=True
+        )
+        for pack, pack_result in zip(packs, pack_results):
+            result = outcome(pack_result)
+            if isinstance(result, Exception) and len(pack) > 1:
+                logger.warning(
+                    f"Topic detection failed for {len(pack)} packed articles, "
+                    f"retrying them one at a time: {repr(result)}"
+                )
+                unpacked.extend(pack)
+            else:
+                detected.update({i: result for i in pack})
+        single_results = await asyncio.gather(
+            *(run_single(i) for i in unpacked), return_exceptions=True
+        )
+        for i, single_result in zip(unpacked, single_results):
+            detected[i] = outcome(single_result)
+
+        results: list[dict[str, list[str]] | Exception] = []
+        for i, article in enumerate(articles):
+            article_detected = detected.get(i, {})
+            if isinstance(article_detected, Exception):
+                if not return_exceptions:
+                    raise article_detected
+                results.append(article_detected)
+                continue
+            results.append(
+                self.do_result_unmapping(
+                    {
+                        sent: cached[i].get(sent, article_detected.get(sent, []))
+                        for sent in article
+                    }
+                )
+            )
+        return results
+
+
+class TopicPacker:
+    """
+    Finds topics for the articles of concurrent callers together, packing them
+    into shared prompts with `TopicKeywordFilter.run_all_for_articles`.
+
+    Articles are collected until about `token_budget` tokens are waiting, or for
+    `max_wait_s` after the first arrives, then sent together. The prompts run in
+    the context the packer was made in, so their tokens are recorded in the usage
+    ledgers active then, rather than those of one of the callers.
+    """
+
+    def __init__(
+        self,
+        topic_filter: TopicKeywordFilter,
+        token_budget: int = 8_000,
+        max_wait_s: float = 0.05,
+        max_attempts: int = 3,
+        allow_partial: bool = True,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        topic_filter: TopicKeywordFilter
+            The filter to find topics with.
+        token_budget: int
+            The estimated number of tokens to fill each prompt up to.
+        max_wait_s: float
+            The longest time to wait for more articles before sending a prompt.
+        max_attempts: int
+            The number of attempts to make for each prompt.
+        allow_partial: bool
+            If False, output which was cut off and only partly repaired counts as
+            a failed attempt. See `TopicKeywordFilter.run_all_for_articles`.
+        """
+        self.topic_filter = topic_filter
+        self.token_budget = token_budget
+        self.max_wait_s = max_wait_s
+        self.max_attempts = max_attempts
+        self.allow_partial = allow_partial
+        self._context = contextvars.copy_context()
+        self._waiting: list[tuple[list[str], asyncio.Future[dict[str, list[str]]]]] = []
+        self._waiting_tokens = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._running: set[asyncio.Task[None]] = set()
+
+    async def run(self, article: list[str]) -> dict[str, list[str]]:
+        """Finds the topics for an article, in a prompt shared with any other
+        articles sent at about the same time.
+
+        Parameters
+        ----------
+        article: list[str]
+            The article to check, formatted as a list of strings.
+
+        Returns
+        -------
+        dict[str, list[str]]
+            The topics of each sentence of the article, as returned by
+            `TopicKeywordFilter.run_all_for_article`.
+
+        Raises
+        ------
+        TopicDetectionError:
+            If topic detection fails on every attempt for the article.
+        """
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[dict[str, list[str]]] = loop.create_future()
+        self._waiting.append((article, future))
+        self._waiting_tokens += estimate_tokens(self.topic_filter.format_text(article))
+        if self._waiting_tokens >= self.token_budget:
+            self._send()
+        elif self._timer is None:
+            self._timer = loop.call_later(
+                self.max_wait_s, self._send, context=self._context
+            )
+        return await future
+
+    def _send(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        waiting, self._waiting, self._waiting_tokens = self._waiting, [], 0
+        task = asyncio.get_running_loop().create_task(
+            self._run_packed(waiting), context=self._context
+        )
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_packed(
+        self, waiting: list[tuple[list[str], asyncio.Future[dict[str, list[str]]]]]
+    ) -> None:
+        try:
+            results = await self.topic_filter.run_all_for_articles(
+                [article for article, _ in waiting],
+                self.token_budget,
+                self.max_attempts,
+                return_exceptions=True,
+                allow_partial=self.allow_partial,
+            )
+        except asyncio.CancelledError:
+            for _, future in waiting:
+                future.cancel()
+            raise
+        except Exception as exc:
+            for _, future in waiting:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), result in zip(waiting, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,13 +1,38 @@
 # Class to score each of a list of sentences for checkworthiness
+import asyncio
+import json
 import logging
 import os
+from functools import partial
 from pathlib import Path
 
 from genai_utils.gemini import GeminiError
 from pastel import pastel
 from pastel.models import ScoreAndAnswers, Sentence
 
-from harmful_claim_finder.utils.models import PastelError
+from harmful_claim_finder.utils.cache import (
+    LRUCache,
+    SQLiteCache,
+    TieredCache,
+    normalise_sentence,
+    text_hash,
+)
+from harmful_claim_finder.utils.chunking import gather_successes
+from harmful_claim_finder.utils.gemini import COALESCED, PASTEL_FEATURE
+from harmful_claim_finder.utils.hedging import run_hedged
+from harmful_claim_finder.utils.metrics import REGISTRY, STAGE_LATENCY, record_funnel
+from harmful_claim_finder.utils.model_registry import ModelRegistry, file_hash
+from harmful_claim_finder.utils.models import (
+    BudgetExceededError,
+    PastelError,
+    VideoClaims,
+)
+from harmful_claim_finder.utils.near_duplicates import NearDuplicateIndex
+from harmful_claim_finder.utils.rate_limit import DEFAULT_MODEL, get_rate_limiter
+from harmful_claim_finder.utils.retry import RetryPolicy, get_retry_policy
+from harmful_claim_finder.utils.single_flight import SingleFlight
+from harmful_claim_finder.utils.tokens import estimate_tokens
+from harmful_claim_finder.utils.usage import check_budgets, record_usage
 
 # flake8: noqa
 CHECKWORTHY_MODEL_FILE = (
@@ -15,22 +40,203 @@ CHECKWORTHY_MODEL_FILE = (
     / "pastel"
     / "checkworthy_model.json"
 )
+# sentences are sent to PASTEL in batches, each retried on its own, so a failure
+# doesn't lose the scores of the other batches
+PASTEL_BATCH_SIZE = 50
+PASTEL_RETRY_POLICY = RetryPolicy(retry_on=(GeminiError, ValueError))
+# PASTEL doesn't report its usage, so each sentence is counted as a prompt with the
+# sentence, every question and about this many tokens of instructions, and a
+# response with about this many tokens for each answer
+PASTEL_INSTRUCTION_TOKENS = 150
+PASTEL_ANSWER_TOKENS = 5
 
 _logger = logging.getLogger(__name__)
 
+_pastel_flights: SingleFlight[dict[str, ScoreAndAnswers]] = SingleFlight()
+
+NEAR_DUPLICATES = REGISTRY.counter(
+    "harmful_claim_finder_pastel_near_duplicates_total",
+    "Number of sentences which reused the PASTEL result of a near duplicate.",
+)
+
+
+def encode_score(result: ScoreAndAnswers) -> str:
+    """Serialises a PASTEL result so it can be stored in a disk cache."""
+    return json.dumps(
+        {"score": float(result.score), "answers": result.answers},
+        ensure_ascii=False,
+        default=float,
+    )
+
+
+def decode_score(encoded: str, sentence: str = "") -> ScoreAndAnswers:
+    """Deserialises a PASTEL result stored by `encode_score`."""
+    decoded = json.loads(encoded)
+    return ScoreAndAnswers(
+        sentence=Sentence(sentence, ()),
+        score=decoded["score"],
+        answers=decoded["answers"],
+    )
+
+
+def make_score_cache(
+    memory: LRUCache[ScoreAndAnswers] | None = None, disk: SQLiteCache | None = None
+) -> TieredCache[ScoreAndAnswers]:
+    """
+    Makes a cache of PASTEL results, for use with `CheckworthyClaimDetector`.
+
+    Args:
+        memory (LRUCache | None):
+            The in-memory tier. A default sized `LRUCache` is used if not given.
+        disk (SQLiteCache | None):
+            The on-disk tier. If not given, only the memory tier is used.
+
+    Returns:
+        TieredCache[ScoreAndAnswers]: The cache.
+    """
+    return TieredCache(memory, disk, encode=encode_score, decode=decode_score)
+
+
+def _copy_score(sentence: str, result: ScoreAndAnswers) -> ScoreAndAnswers:
+    """Reuses another sentence's PASTEL result for a near duplicate sentence."""
+    return ScoreAndAnswers(
+        sentence=Sentence(sentence, ()), score=result.score, answers=result.answers
+    )
+
 
 class CheckworthyClaimDetector:
     """A class for detecting which claims may be worth checking"""
 
-    def __init__(self) -> None:
-        self.pastel = pastel.Pastel.load_model(str(CHECKWORTHY_MODEL_FILE))
+    def __init__(
+        self,
+        model_file: Path | str | None = None,
+        cache: TieredCache[ScoreAndAnswers] | None = None,
+        near_duplicates: NearDuplicateIndex[ScoreAndAnswers] | None = None,
+    ) -> None:
+        """
+        Args:
+            model_file (Path | str | None):
+                The PASTEL model file to load.
+                Defaults to `CHECKWORTHY_MODEL_FILE`.
+            cache (TieredCache[ScoreAndAnswers] | None):
+                Cache of previous results, keyed by the normalised sentence and the
+                hash of the model file. See `make_score_cache`.
+                If not given, every sentence is sent to PASTEL.
+            near_duplicates (NearDuplicateIndex[ScoreAndAnswers] | None):
+                Index of previously scored sentences. Sentences which are near
+                duplicates of one in the index reuse its result, and only one
+                sentence from each group of near duplicates is sent to PASTEL.
+                If not given, only exact matches are reused.
+        """
+        self.model_file = Path(model_file or CHECKWORTHY_MODEL_FILE)
+        self.model_hash = file_hash(self.model_file)
+        self.pastel = pastel.Pastel.load_model(str(self.model_file))
+        self.questions = [
+            question
+            for question in json.loads(self.model_file.read_text())
+            if question != "bias"
+        ]
+        self.cache = cache
+        self.near_duplicates = near_duplicates
+
+    def cache_key(self, sentence: str) -> str:
+        """Returns the cache key for a sentence's PASTEL result."""
+        return text_hash(normalise_sentence(sentence), self.model_hash)
+
+    def estimate_usage(self, sentence: str) -> tuple[int, int]:
+        """
+        Estimates the prompt and output tokens PASTEL uses to score a sentence.
+        """
+        prompt_tokens = (
+            PASTEL_INSTRUCTION_TOKENS
+            + estimate_tokens(sentence)
+            + sum(estimate_tokens(question) for question in self.questions)
+        )
+        return prompt_tokens, PASTEL_ANSWER_TOKENS * len(self.questions)
+
+    async def _predict(self, sentences: list[str]) -> dict[str, ScoreAndAnswers]:
+        # a duplicate sent by the hedger is checked against budgets and charged
+        # like any other batch
+        check_budgets()
+        usage = [self.estimate_usage(s) for s in sentences]
+        try:
+            scores_and_answers = await self.pastel.make_predictions(
+                [Sentence(s, ()) for s in sentences]
+            )
+        except asyncio.CancelledError:
+            # the prompts were sent, so are charged even if the batch was cancelled
+            for prompt_tokens, _ in usage:
+                record_usage(PASTEL_FEATURE, prompt_tokens, 0)
+            raise
+        for prompt_tokens, output_tokens in usage:
+            record_usage(PASTEL_FEATURE, prompt_tokens, output_tokens)
+        return {
+            sent.sentence_text: scores for sent, scores in scores_and_answers.items()
+        }
+
+    async def _score(self, sentences: list[str]) -> dict[str, ScoreAndAnswers]:
+        check_budgets()
+        # identical batches scored at the same time, e.g. for re-uploads of the same
+        # video, share one set of PASTEL calls
+        key = text_hash(self.model_hash, *sentences)
+        scored, shared = await _pastel_flights.run(
+            key,
+            lambda: run_hedged(
+                PASTEL_FEATURE,
+                lambda: self._predict(sentences),
+                len(sentences),
+                # PASTEL calls Gemini itself, at least once for each sentence
+                slot=lambda: get_rate_limiter().slot(
+                    DEFAULT_MODEL, PASTEL_FEATURE, cost=len(sentences)
+                ),
+            ),
+        )
+        if shared:
+            COALESCED.inc(feature=PASTEL_FEATURE)
+        return scored
+
+    def _group_near_duplicates(
+        self, sentences: list[str]
+    ) -> tuple[list[str], dict[str, ScoreAndAnswers], dict[str, str]]:
+        """
+        Finds sentences which are near duplicates of an already scored sentence, or
+        of another sentence in the list.
+
+        Returns:
+            list[str]: The sentences which still need scoring.
+            dict[str, ScoreAndAnswers]: Results reused from the index.
+            dict[str, str]: Each remaining near duplicate mapped to the sentence
+                being scored in its place.
+        """
+        assert self.near_duplicates is not None
+        index = self.near_duplicates
+        batch_index: NearDuplicateIndex[None] = NearDuplicateIndex()
+        to_score: list[str] = []
+        reused: dict[str, ScoreAndAnswers] = {}
+        representatives: dict[str, str] = {}
+        for sent in sentences:
+            if (match := index.get(sent)) is not None:
+                reused[sent] = _copy_score(sent, match[1])
+            elif (batch_match := batch_index.get(sent)) is not None:
+                representatives[sent] = batch_match[0]
+            else:
+                batch_index.add(sent, None)
+                to_score.append(sent)
+        return to_score, reused, representatives
 
     async def score_sentences(
-        self, sentences: list[str], max_attempts: int = 3
+        self,
+        sentences: list[str],
+        max_attempts: int = 3,
+        retry_policy: RetryPolicy | None = None,
+        batch_size: int = PASTEL_BATCH_SIZE,
     ) -> dict[str, ScoreAndAnswers]:
         """
         Returns a checkworthy score for each of a list of sentences.
-        High scores suggest more checkworthy
+        High scores suggest more checkworthy.
+        If the detector has a cache, only sentences missing from it are sent to PASTEL.
+        If it has a near duplicate index, near duplicates of sentences already scored
+        reuse their results.
 
         Args:
             sentences (list[str]):
@@ -39,6 +245,16 @@ class CheckworthyClaimDetector:
             max_attempts (int):
                 The number of retries to attempt if there's an exception.
 
+            retry_policy (RetryPolicy | None):
+                How to back off between attempts, which errors to retry, and any
+                deadline. Defaults to the policy set for "pastel", making
+                `max_attempts` attempts, and retrying Gemini and parsing errors.
+
+            batch_size (int):
+                The number of sentences sent to PASTEL in each batch. Batches are
+                scored concurrently and retried on their own, and the results of
+                batches which succeed are cached even if another fails.
+
         Returns:
             dict[str, pastel.ScoreAndAnswers]:
                 Checkworthy scores for each sentence, with answers for each
@@ -46,22 +262,149 @@ class CheckworthyClaimDetector:
 
         Raises:
             PastelError:
-                Raises an exception if Pastel fails `max_attempts` times.
+                Raises an exception if Pastel fails on every attempt for any batch.
+            BudgetExceededError:
+                If an active token budget has been used up.
         """
-        for _ in range(max_attempts):
-            try:
-                scores_and_answers = await self.pastel.make_predictions(
-                    [Sentence(s, ()) for s in sentences]
-                )
-                return {
-                    sent.sentence_text: scores
-                    for sent, scores in scores_and_answers.items()
-                }
-            except GeminiError as exc:
-                _logger.info(f"Error while running Gemini: {repr(exc)}")
-            except ValueError as exc:
-                _logger.info(
-                    f"Error raised while running Pastel (probably parsing): {repr(exc)}"
-                )
-
-        raise PastelError(f"Pastel failed {max_attempts} times.")
+        unique_sentences = list(dict.fromkeys(sentences))
+
+        cached: dict[str, ScoreAndAnswers] = {}
+        if self.cache is not None:
+            keys = {sent: self.cache_key(sent) for sent in unique_sentences}
+            cached_by_key = await self.cache.get_many_async(set(keys.values()))
+            # results from the disk tier, or for another form of the sentence,
+            # don't have this sentence in them
+            cached = {
+                sent: _copy_score(sent, cached_by_key[key])
+                for sent, key in keys.items()
+                if key in cached_by_key
+            }
+        to_score = [sent for sent in unique_sentences if sent not in cached]
+
+        reused: dict[str, ScoreAndAnswers] = {}
+        representatives: dict[str, str] = {}
+        if self.near_duplicates is not None:
+            to_score, reused, representatives = self._group_near_duplicates(to_score)
+            NEAR_DUPLICATES.inc(len(reused) + len(representatives))
+
+        policy = retry_policy or get_retry_policy(
+            "pastel", max_attempts, PASTEL_RETRY_POLICY
+        )
+        batches = [
+            to_score[i : i + batch_size] for i in range(0, len(to_score), batch_size)
+        ]
+        scored: dict[str, ScoreAndAnswers] = {}
+        with STAGE_LATENCY.time(stage="pastel") as timer:
+            batch_scores, errors = await gather_successes(
+                policy.run("pastel", partial(self._score, batch)) for batch in batches
+            )
+        for batch_scored in batch_scores:
+            scored.update(batch_scored)
+
+        if self.cache is not None and scored:
+            await self.cache.set_many_async(
+                {self.cache_key(sent): result for sent, result in scored.items()}
+            )
+        if self.near_duplicates is not None:
+            for sent, result in scored.items():
+                self.near_duplicates.add(sent, result)
+            for sent, representative in representatives.items():
+                if representative in scored:
+                    reused[sent] = _copy_score(sent, scored[representative])
+
+        _logger.info(
+            f"PASTEL scoring runtime: {timer.elapsed_s:.2f}s | "
+            f"{len(cached)} PASTEL cache hits | "
+            f"{len(reused)} near duplicates reused | "
+            f"{len(to_score)} sentences sent to PASTEL"
+        )
+        if errors:
+            for exc in errors:
+                if isinstance(exc, BudgetExceededError):
+                    raise exc
+            raise PastelError(
+                f"Pastel failed for {len(errors)} of {len(batches)} batches: "
+                f"{repr(errors[0])}"
+            ) from errors[0]
+        return {**cached, **reused, **scored}
+
+
+_score_cache: TieredCache[ScoreAndAnswers] | None = make_score_cache()
+
+_detector_registry: ModelRegistry[CheckworthyClaimDetector] = ModelRegistry(
+    lambda model_file: CheckworthyClaimDetector(model_file, cache=_score_cache)
+)
+
+
+def set_score_cache(cache: TieredCache[ScoreAndAnswers] | None) -> None:
+    """
+    Sets the cache used by the shared detectors from `get_checkworthy_detector`,
+    e.g. to add a disk tier, or turns caching off if `cache` is None. By default,
+    they share an in-memory cache. The detectors are reloaded on their next use.
+
+    Example:
+        ```python
+        set_score_cache(make_score_cache(disk=SQLiteCache("cache.db", "pastel")))
+        ```
+    """
+    global _score_cache
+    _score_cache = cache
+    _detector_registry.clear()
+
+
+def get_checkworthy_detector(
+    model_file: Path | str | None = None,
+) -> CheckworthyClaimDetector:
+    """
+    Returns the shared `CheckworthyClaimDetector` for a model file.
+    The model is loaded once per process, and reloaded if the file changes.
+    Shared detectors cache their results, see `set_score_cache`.
+
+    Args:
+        model_file (Path | str | None):
+            The PASTEL model file to load.
+            Defaults to `CHECKWORTHY_MODEL_FILE`.
+
+    Returns:
+        CheckworthyClaimDetector: The detector for the model file.
+    """
+    return _detector_registry.get(model_file or CHECKWORTHY_MODEL_FILE)
+
+
+async def score_claims(
+    pastel: CheckworthyClaimDetector, claims: list[VideoClaims], funnel: str
+) -> list[VideoClaims]:
+    """
+    Adds PASTEL scores and answers to the metadata of each claim, and records how
+    many were scored, and how many scored above zero, in the funnel for `funnel`.
+
+    Args:
+        pastel (CheckworthyClaimDetector):
+            The detector used to score claims.
+        claims (list[VideoClaims]):
+            The claims to score.
+        funnel (str):
+            The name of the pipeline the claims are from, e.g. "video_inference".
+
+    Returns:
+        list[VideoClaims]: The claims, marked up with scores.
+
+    Raises:
+        PastelError:
+            If PASTEL fails on every attempt.
+    """
+    claims_text = [claim.claim for claim in claims]
+    scores_and_answers = await pastel.score_sentences(claims_text, max_attempts=2)
+
+    for claim in claims:
+        claim.metadata = {
+            **claim.metadata,
+            "score": scores_and_answers[claim.claim].score,
+            "answers": scores_and_answers[claim.claim].answers,
+        }
+    record_funnel(
+        funnel,
+        scored=len(claims),
+        nonzero=sum(claim.metadata["score"] > 0 for claim in claims),
+    )
+    return claims
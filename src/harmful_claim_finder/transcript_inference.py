@@ -1,22 +1,166 @@
+import asyncio
+import json
 import logging
-import time
+from contextlib import nullcontext
+from typing import AsyncGenerator, AsyncIterable, AsyncIterator, Iterable
+from uuid import UUID
 
-from harmful_claim_finder.keyword_filter.topic_keyword_filter import TopicKeywordFilter
-from harmful_claim_finder.pastel_inference import CheckworthyClaimDetector
+from pastel.models import ScoreAndAnswers
+
+from harmful_claim_finder.keyword_filter.topic_keyword_filter import (
+    OutputMode,
+    PrefilterMode,
+    TopicKeywordFilter,
+    TopicPacker,
+)
+from harmful_claim_finder.pastel_inference import (
+    CheckworthyClaimDetector,
+    decode_score,
+    encode_score,
+    get_checkworthy_detector,
+)
+from harmful_claim_finder.utils.cache import TieredCache
+from harmful_claim_finder.utils.chunking import chunk_by_tokens
+from harmful_claim_finder.utils.journal import RESUMED_STAGES, JobJournal
+from harmful_claim_finder.utils.metrics import Timer, record_funnel
 from harmful_claim_finder.utils.models import (
     CheckworthyError,
     PastelError,
     TopicDetectionError,
     TranscriptSentence,
     VideoClaims,
+    VideoResult,
 )
+from harmful_claim_finder.utils.streaming import iterate_as_completed
+from harmful_claim_finder.utils.usage import UsageLedger, track_usage
 
 logger = logging.getLogger(__name__)
 
+TranscriptJob = tuple[UUID, list[TranscriptSentence]]
+
+DEFAULT_STREAM_CHUNK_TOKENS = 1_000
+
+
+def _make_claims(
+    sentences: list[TranscriptSentence],
+    topic_keywords: dict[str, list[str]],
+    scores_and_answers: dict[str, ScoreAndAnswers],
+) -> list[VideoClaims]:
+    """
+    Turns the sentences with a nonzero PASTEL score into claims.
+    """
+    return [
+        VideoClaims(
+            video_id=sentence.video_id,
+            claim=sentence.text,
+            start_time_s=sentence.start_time_s,
+            metadata=(
+                {
+                    **sentence.metadata,
+                    "score": float(scores_and_answers[sentence.text].score),
+                    "topics": topic_keywords[sentence.text],
+                    "answers": scores_and_answers[sentence.text].answers,
+                }
+            ),
+        )
+        for sentence in sentences
+        if sentence.text in scores_and_answers.keys()
+        and scores_and_answers[sentence.text].score > 0
+    ]
+
+
+def _encode_scores(scores_and_answers: dict[str, ScoreAndAnswers]) -> str:
+    return json.dumps(
+        {sent: encode_score(result) for sent, result in scores_and_answers.items()},
+        ensure_ascii=False,
+    )
+
+
+def _decode_scores(encoded: str) -> dict[str, ScoreAndAnswers]:
+    return {
+        sent: decode_score(result, sent) for sent, result in json.loads(encoded).items()
+    }
+
+
+async def _find_claims(
+    topic_filter: TopicKeywordFilter,
+    checkworthy_model: CheckworthyClaimDetector,
+    sentences: list[TranscriptSentence],
+    topic_slots: asyncio.Semaphore | None = None,
+    pastel_slots: asyncio.Semaphore | None = None,
+    journal: JobJournal | None = None,
+    job_id: str = "",
+    topic_packer: TopicPacker | None = None,
+) -> list[VideoClaims]:
+    """
+    Finds topics for some sentences, then scores those with topics with PASTEL.
+    If semaphores are given, each stage waits for a slot before running.
+    If a packer is given, topics are found in prompts shared with other videos.
+    If a journal is given, the output of each stage is recorded under `job_id`,
+    and stages which were already recorded aren't run again. Topics are only
+    recorded if every chunk succeeded and some sentence has a topic, so an empty
+    or partial result isn't kept across restarts.
+    """
+    recorded: dict[str, str] = {}
+    if journal is not None:
+        recorded = await asyncio.to_thread(journal.stages, job_id)
+    if "topics" in recorded:
+        RESUMED_STAGES.inc(stage="topics")
+        topic_keywords: dict[str, list[str]] = json.loads(recorded["topics"])
+    else:
+        texts = [sentence.text for sentence in sentences]
+        async with topic_slots or nullcontext():
+            if topic_packer is not None:
+                topic_keywords = await topic_packer.run(texts)
+            else:
+                topic_keywords = await topic_filter.run_all_for_article(
+                    texts, max_attempts=2, allow_partial=journal is None
+                )
+        if journal is not None and any(topic_keywords.values()):
+            await asyncio.to_thread(
+                journal.record,
+                job_id,
+                "topics",
+                json.dumps(topic_keywords, ensure_ascii=False),
+            )
+    have_topic = [sentence for sentence, topics in topic_keywords.items() if topics]
+    if not have_topic:
+        record_funnel("transcript_inference", input=len(sentences))
+        return []
+
+    if "scores" in recorded:
+        RESUMED_STAGES.inc(stage="scores")
+        scores_and_answers = _decode_scores(recorded["scores"])
+    else:
+        async with pastel_slots or nullcontext():
+            scores_and_answers = await checkworthy_model.score_sentences(
+                have_topic, max_attempts=2
+            )
+        if journal is not None:
+            await asyncio.to_thread(
+                journal.record, job_id, "scores", _encode_scores(scores_and_answers)
+            )
+    claims = _make_claims(sentences, topic_keywords, scores_and_answers)
+    record_funnel(
+        "transcript_inference",
+        input=len(sentences),
+        topical=len(have_topic),
+        scored=len(scores_and_answers),
+        nonzero=len(claims),
+    )
+    return claims
+
 
 async def get_claims(
     keywords: dict[str, list[str]],
     sentences: list[TranscriptSentence],
+    checkworthy_model: CheckworthyClaimDetector | None = None,
+    prefilter: PrefilterMode = "off",
+    topic_cache: TieredCache[list[str]] | None = None,
+    max_chunk_tokens: int | None = None,
+    topic_output: OutputMode = "sentences",
+    cache_scope: str | None = None,
+    usage: UsageLedger | None = None,
 ) -> list[VideoClaims]:
     """
     A wrapper function to run genai checkworthy.
@@ -34,6 +178,27 @@ async def get_claims(
             ```
         sentences (list[TranscriptSentence]):
             A list of transcript sentences to run checkworthy on.
+        checkworthy_model (CheckworthyClaimDetector | None):
+            The detector used to score sentences.
+            Defaults to the shared detector from `get_checkworthy_detector`.
+        prefilter (PrefilterMode):
+            Whether to skip sentences with no local keyword match before topic
+            detection. See `TopicKeywordFilter` for the available modes.
+        topic_cache (TieredCache[list[str]] | None):
+            Cache of topics for previously seen sentences, shared between calls.
+        max_chunk_tokens (int | None):
+            If given, long transcripts are split into chunks of about this many
+            tokens for topic detection, which are run concurrently.
+        topic_output (OutputMode):
+            What the LLM returns in topic detection. "indices" asks for sentence
+            numbers rather than sentence text, using far fewer output tokens.
+        cache_scope (str | None):
+            Identifies who the keywords are for, e.g. an organisation and
+            language. If context caching is turned on, prompts cached with older
+            keywords for the same scope are deleted.
+        usage (UsageLedger | None):
+            If given, the estimated LLM tokens used are recorded here, e.g. to
+            report the spend with `usage.summary()`, and its budget applies.
 
     Returns:
         A list of claims contained within the transcript.
@@ -42,62 +207,306 @@ async def get_claims(
         CheckworthyError:
             If something goes wrong during topic detection or
             pastel, the CheckworthyError will say what went wrong.
+        BudgetExceededError:
+            If the budget of `usage`, or of another active ledger, has been used up.
     """
-    try:
-        texts = [sentence.text for sentence in sentences]
+    with track_usage(usage):
+        try:
+            texts = [sentence.text for sentence in sentences]
+
+            topic_filter = TopicKeywordFilter(
+                keywords=keywords,
+                prefilter=prefilter,
+                cache=topic_cache,
+                max_chunk_tokens=max_chunk_tokens,
+                output_mode=topic_output,
+                cache_scope=cache_scope,
+            )
+            with Timer() as topics_timer:
+                topic_keywords = await topic_filter.run_all_for_article(
+                    texts, max_attempts=2
+                )
+
+            have_topic = [
+                sentence for sentence, topics in topic_keywords.items() if topics
+            ]
+            logger.debug(f"{len(have_topic)} sentences have topics.")
+
+            if not have_topic:
+                record_funnel("transcript_inference", input=len(sentences))
+                logger.info(
+                    f"Topics runtime: {topics_timer.elapsed_s:.2f}s | "
+                    "PASTEL runtime: 0.00s | "
+                    "0 sentences checked by PASTEL | "
+                    "0 have nonzero score"
+                )
+                return []
 
-        topics_start_time = time.time()
-        topic_filter = TopicKeywordFilter(keywords=keywords)
-        topic_keywords = await topic_filter.run_all_for_article(texts, max_attempts=2)
+            checkworthy_model = checkworthy_model or get_checkworthy_detector()
 
-        have_topic = [sentence for sentence, topics in topic_keywords.items() if topics]
-        logger.debug(f"{len(have_topic)} sentences have topics.")
+            with Timer() as pastel_timer:
+                all_scores_and_answers = await checkworthy_model.score_sentences(
+                    have_topic, max_attempts=2
+                )
 
-        keywords_runtime = time.time() - topics_start_time
-        if not have_topic:
+            claims = _make_claims(sentences, topic_keywords, all_scores_and_answers)
+
+            record_funnel(
+                "transcript_inference",
+                input=len(sentences),
+                topical=len(have_topic),
+                scored=len(all_scores_and_answers),
+                nonzero=len(claims),
+            )
             logger.info(
-                f"Topics runtime: {keywords_runtime:.2f}s | "
-                "PASTEL runtime: 0.00s | "
-                "0 sentences checked by PASTEL | "
-                "0 have nonzero score"
+                f"Topics runtime: {topics_timer.elapsed_s:.2f}s | "
+                f"PASTEL runtime: {pastel_timer.elapsed_s:.2f}s | "
+                f"{len(have_topic)} sentences checked by PASTEL | "
+                f"{len(claims)} have nonzero score"
             )
-            return []
+            return claims
 
-        pastel_start_time = time.time()
+        except (TopicDetectionError, PastelError) as e:
+            raise CheckworthyError from e
 
-        checkworthy_model = CheckworthyClaimDetector()
 
-        all_scores_and_answers = await checkworthy_model.score_sentences(
-            have_topic, max_attempts=2
-        )
+async def get_claims_batch(
+    keywords: dict[str, list[str]],
+    jobs: Iterable[TranscriptJob] | AsyncIterable[TranscriptJob],
+    checkworthy_model: CheckworthyClaimDetector | None = None,
+    prefilter: PrefilterMode = "off",
+    topic_cache: TieredCache[list[str]] | None = None,
+    max_chunk_tokens: int | None = None,
+    topic_concurrency: int = 8,
+    pastel_concurrency: int = 8,
+    max_videos_in_flight: int = 32,
+    video_token_budget: int | None = None,
+    batch_usage: UsageLedger | None = None,
+    topic_output: OutputMode = "sentences",
+    journal: JobJournal | None = None,
+    pack_topic_tokens: int | None = None,
+    cache_scope: str | None = None,
+) -> AsyncIterator[VideoResult]:
+    """
+    Runs `get_claims` over many videos, with a limit on how many calls each stage
+    can make at once.
+    Results are yielded as each video finishes, so they won't be in the same
+    order as the jobs.
+    If a video fails, its result has an `error` and the rest of the batch carries on.
+    Each result reports the LLM tokens used for that video. Once a budget is used
+    up, videos it applies to stop making LLM calls and fail with a
+    `BudgetExceededError`.
+    With a journal, the topics, PASTEL scores and claims of each video are recorded
+    as they're found, so a batch restarted with the same journal resumes each
+    video from its last finished stage.
+
+    Args:
+        keywords (dict[str, list[str]]):
+            A {topic: keywords} dictionary containing the kw for each topic.
+        jobs (Iterable[TranscriptJob] | AsyncIterable[TranscriptJob]):
+            (video_id, sentences) pairs, one for each video.
+            Jobs are only taken from the iterable when there's room for them, so
+            this can be a lazy generator. Use an async generator if taking a job
+            blocks, e.g. on a job queue, so it doesn't hold up the event loop.
+        checkworthy_model (CheckworthyClaimDetector | None):
+            The detector used to score sentences.
+            Defaults to the shared detector from `get_checkworthy_detector`.
+        prefilter (PrefilterMode):
+            Whether to skip sentences with no local keyword match before topic
+            detection. See `TopicKeywordFilter` for the available modes.
+        topic_cache (TieredCache[list[str]] | None):
+            Cache of topics for previously seen sentences.
+        max_chunk_tokens (int | None):
+            If given, long transcripts are split into chunks of about this many
+            tokens for topic detection, which are run concurrently.
+        topic_concurrency (int):
+            The maximum number of videos in topic detection at once.
+        pastel_concurrency (int):
+            The maximum number of videos being scored by PASTEL at once.
+        max_videos_in_flight (int):
+            The maximum number of videos being processed at once.
+        video_token_budget (int | None):
+            The number of estimated LLM tokens each video may use.
+            No limit if not given.
+        batch_usage (UsageLedger | None):
+            If given, the tokens used by every video are also recorded here, and its
+            budget applies to the batch as a whole.
+        topic_output (OutputMode):
+            What the LLM returns in topic detection. "indices" asks for sentence
+            numbers rather than sentence text, using far fewer output tokens.
+        journal (JobJournal | None):
+            If given, the output of each stage for each video is recorded here.
+            Videos whose claims were already recorded are yielded from the
+            journal without any LLM calls, and failed videos are retried.
+        pack_topic_tokens (int | None):
+            If given, the transcripts of videos in topic detection at the same
+            time are packed into shared prompts of about this many tokens, so the
+            keywords are sent once per prompt rather than once per video. Videos
+            in a prompt which fails are retried in prompts of their own.
+            Shared prompts count towards `batch_usage`, but not the usage or
+            budget of each video.
+        cache_scope (str | None):
+            Identifies who the keywords are for, e.g. an organisation and
+            language. If context caching is turned on, prompts cached with older
+            keywords for the same scope are deleted.
 
-        claims = [
-            VideoClaims(
-                video_id=sentence.video_id,
-                claim=sentence.text,
-                start_time_s=sentence.start_time_s,
-                metadata=(
-                    {
-                        **sentence.metadata,
-                        "score": float(all_scores_and_answers[sentence.text].score),
-                        "topics": topic_keywords[sentence.text],
-                        "answers": all_scores_and_answers[sentence.text].answers,
-                    }
-                ),
+    Yields:
+        VideoResult: The claims, or the error, for each video.
+    """
+    topic_filter = TopicKeywordFilter(
+        keywords=keywords,
+        prefilter=prefilter,
+        cache=topic_cache,
+        max_chunk_tokens=max_chunk_tokens,
+        output_mode=topic_output,
+        cache_scope=cache_scope,
+    )
+    detector = checkworthy_model or get_checkworthy_detector()
+    topic_packer = None
+    if pack_topic_tokens is not None:
+        with track_usage(batch_usage):
+            topic_packer = TopicPacker(
+                topic_filter,
+                pack_topic_tokens,
+                max_attempts=2,
+                allow_partial=journal is None,
             )
-            for sentence in sentences
-            if sentence.text in all_scores_and_answers.keys()
-            and all_scores_and_answers[sentence.text].score > 0
-        ]
-
-        pastel_runtime = time.time() - pastel_start_time
-        logger.info(
-            f"Topics runtime: {keywords_runtime:.2f}s | "
-            f"PASTEL runtime: {pastel_runtime:.2f}s | "
-            f"{len(have_topic)} sentences checked by PASTEL | "
-            f"{len(claims)} have nonzero score"
-        )
-        return claims
+    topic_slots = asyncio.Semaphore(topic_concurrency)
+    pastel_slots = asyncio.Semaphore(pastel_concurrency)
+
+    async def run_job(
+        video_id: UUID, sentences: list[TranscriptSentence]
+    ) -> VideoResult:
+        if journal is not None:
+            # sqlite calls block, so are kept off the event loop
+            recorded = await asyncio.to_thread(journal.get, str(video_id), "claims")
+            if recorded is not None:
+                RESUMED_STAGES.inc(stage="claims")
+                return VideoResult.model_validate_json(recorded)
+        video_usage = UsageLedger(video_token_budget, name=f"video {video_id}")
+        with track_usage(batch_usage), track_usage(video_usage):
+            try:
+                claims = await _find_claims(
+                    topic_filter,
+                    detector,
+                    sentences,
+                    topic_slots,
+                    pastel_slots,
+                    journal,
+                    str(video_id),
+                    topic_packer,
+                )
+                result = VideoResult(
+                    video_id=video_id, claims=claims, usage=video_usage.summary()
+                )
+                if journal is not None:
+                    await asyncio.to_thread(
+                        journal.record,
+                        str(video_id),
+                        "claims",
+                        result.model_dump_json(),
+                    )
+                return result
+            except Exception as exc:
+                logger.warning(
+                    f"Finding claims failed for video {video_id}: {repr(exc)}"
+                )
+                return VideoResult(
+                    video_id=video_id, error=repr(exc), usage=video_usage.summary()
+                )
+
+    async def iterate_jobs() -> AsyncGenerator[TranscriptJob, None]:
+        if isinstance(jobs, AsyncIterable):
+            async for job in jobs:
+                yield job
+        else:
+            for job in jobs:
+                yield job
+
+    job_iterator = iterate_jobs()
+    pending: set[asyncio.Task[VideoResult]] = set()
+    try:
+        while True:
+            while len(pending) < max_videos_in_flight:
+                job = await anext(job_iterator, None)
+                if job is None:
+                    break
+                pending.add(asyncio.create_task(run_job(*job)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        await job_iterator.aclose()
+
 
+async def stream_claims(
+    keywords: dict[str, list[str]],
+    sentences: list[TranscriptSentence],
+    checkworthy_model: CheckworthyClaimDetector | None = None,
+    prefilter: PrefilterMode = "off",
+    topic_cache: TieredCache[list[str]] | None = None,
+    chunk_tokens: int = DEFAULT_STREAM_CHUNK_TOKENS,
+    topic_output: OutputMode = "sentences",
+    cache_scope: str | None = None,
+) -> AsyncIterator[VideoClaims]:
+    """
+    Like `get_claims`, but yields claims as soon as they're found.
+    The transcript is split into chunks of about `chunk_tokens` tokens, which go
+    through topic detection and PASTEL concurrently. The claims from each chunk
+    are yielded as soon as that chunk has been scored, so they may not be in
+    transcript order.
+
+    Args:
+        keywords (dict[str, list[str]]):
+            A {topic: keywords} dictionary containing the kw for each topic.
+        sentences (list[TranscriptSentence]):
+            A list of transcript sentences to run checkworthy on.
+        checkworthy_model (CheckworthyClaimDetector | None):
+            The detector used to score sentences.
+            Defaults to the shared detector from `get_checkworthy_detector`.
+        prefilter (PrefilterMode):
+            Whether to skip sentences with no local keyword match before topic
+            detection. See `TopicKeywordFilter` for the available modes.
+        topic_cache (TieredCache[list[str]] | None):
+            Cache of topics for previously seen sentences, shared between calls.
+        chunk_tokens (int):
+            The estimated number of tokens of transcript in each chunk.
+        topic_output (OutputMode):
+            What the LLM returns in topic detection. "indices" asks for sentence
+            numbers rather than sentence text, using far fewer output tokens.
+        cache_scope (str | None):
+            Identifies who the keywords are for, e.g. an organisation and
+            language. If context caching is turned on, prompts cached with older
+            keywords for the same scope are deleted.
+
+    Yields:
+        VideoClaims: Each claim contained within the transcript.
+
+    Raises:
+        CheckworthyError:
+            If something goes wrong during topic detection or
+            pastel, the CheckworthyError will say what went wrong.
+    """
+    topic_filter = TopicKeywordFilter(
+        keywords=keywords,
+        prefilter=prefilter,
+        cache=topic_cache,
+        output_mode=topic_output,
+        cache_scope=cache_scope,
+    )
+    detector = checkworthy_model or get_checkworthy_detector()
+    chunks = chunk_by_tokens(sentences, lambda sentence: sentence.text, chunk_tokens)
+    try:
+        async for claims in iterate_as_completed(
+            _find_claims(topic_filter, detector, chunk) for chunk in chunks
+        ):
+            for claim in claims:
+                yield claim
     except (TopicDetectionError, PastelError) as e:
         raise CheckworthyError from e
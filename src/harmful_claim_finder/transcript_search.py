@@ -4,8 +4,21 @@ Does not make the assumption that a sentence is a claim.
 Claims can span more than one sentence, or be a span within a sentence.
 """
 
-from harmful_claim_finder.claim_extraction import extract_claims_from_transcript
-from harmful_claim_finder.pastel_inference import CheckworthyClaimDetector
+from typing import AsyncIterator
+
+from harmful_claim_finder.claim_extraction import (
+    DEFAULT_CHUNK_OVERLAP_TOKENS,
+    ClaimDeduplicator,
+    ExtractionMode,
+    extract_claims_from_transcript,
+)
+from harmful_claim_finder.pastel_inference import (
+    CheckworthyClaimDetector,
+    get_checkworthy_detector,
+    score_claims,
+)
+from harmful_claim_finder.utils.chunking import chunk_by_tokens
+from harmful_claim_finder.utils.metrics import record_funnel
 from harmful_claim_finder.utils.models import (
     CheckworthyError,
     ClaimExtractionError,
@@ -13,11 +26,20 @@ from harmful_claim_finder.utils.models import (
     TranscriptSentence,
     VideoClaims,
 )
+from harmful_claim_finder.utils.streaming import iterate_as_completed
+from harmful_claim_finder.utils.usage import UsageLedger, track_usage
+
+DEFAULT_STREAM_CHUNK_TOKENS = 2_000
 
 
 async def get_claims(
     keywords: dict[str, list[str]],
     transcript: list[TranscriptSentence],
+    checkworthy_model: CheckworthyClaimDetector | None = None,
+    max_chunk_tokens: int | None = None,
+    extraction_mode: ExtractionMode = "quotes",
+    cache_scope: str | None = None,
+    usage: UsageLedger | None = None,
 ) -> list[VideoClaims]:
     """
     Retrieve claims from a video transcript.
@@ -34,6 +56,22 @@ async def get_claims(
             ```
         transcript (list[TranscriptSentence]):
             The transcript you want to search for claims.
+        checkworthy_model (CheckworthyClaimDetector | None):
+            The detector used to score claims.
+            Defaults to the shared detector from `get_checkworthy_detector`.
+        max_chunk_tokens (int | None):
+            If given, long transcripts are split into overlapping chunks of about
+            this many tokens, which are searched concurrently.
+        extraction_mode (ExtractionMode):
+            How claims are located in the transcript. "spans" asks for sentence
+            numbers rather than quotes. See `extract_claims_from_transcript`.
+        cache_scope (str | None):
+            Identifies who the keywords are for, e.g. an organisation and
+            language. If context caching is turned on, prompts cached with older
+            keywords for the same scope are deleted.
+        usage (UsageLedger | None):
+            If given, the estimated LLM tokens used are recorded here, e.g. to
+            report the spend with `usage.summary()`, and its budget applies.
 
     Returns:
         list[VideoClaims]:
@@ -43,21 +81,95 @@ async def get_claims(
         CheckworthyError:
             If something goes wrong during claim extraction or
             pastel, the CheckworthyError will say what went wrong.
+        BudgetExceededError:
+            If the budget of `usage`, or of another active ledger, has been used up.
     """
-    try:
-        claims: list[VideoClaims] = await extract_claims_from_transcript(
-            transcript=transcript, keywords=keywords, max_attempts=2
+    with track_usage(usage):
+        try:
+            claims: list[VideoClaims] = await extract_claims_from_transcript(
+                transcript=transcript,
+                keywords=keywords,
+                max_attempts=2,
+                max_chunk_tokens=max_chunk_tokens,
+                mode=extraction_mode,
+                cache_scope=cache_scope,
+            )
+            record_funnel("transcript_search", input=len(transcript))
+            pastel = checkworthy_model or get_checkworthy_detector()
+            return await score_claims(pastel, claims, "transcript_search")
+        except (ClaimExtractionError, PastelError) as exc:
+            raise CheckworthyError from exc
+
+
+async def stream_claims(
+    keywords: dict[str, list[str]],
+    transcript: list[TranscriptSentence],
+    checkworthy_model: CheckworthyClaimDetector | None = None,
+    chunk_tokens: int = DEFAULT_STREAM_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_CHUNK_OVERLAP_TOKENS,
+    extraction_mode: ExtractionMode = "quotes",
+    cache_scope: str | None = None,
+) -> AsyncIterator[VideoClaims]:
+    """
+    Like `get_claims`, but yields claims as soon as they're scored.
+    The transcript is split into overlapping chunks of about `chunk_tokens` tokens,
+    which are searched and scored concurrently. The claims from each chunk are
+    yielded as soon as that chunk has been scored, so they may not be in
+    transcript order. Claims which duplicate one from another chunk, with the same
+    quote or a similar claim at the same time, are skipped before scoring.
+
+    Args:
+        keywords (dict[str, list[str]]):
+            A {topic: keywords} dictionary containing the kw for each topic.
+        transcript (list[TranscriptSentence]):
+            The transcript you want to search for claims.
+        checkworthy_model (CheckworthyClaimDetector | None):
+            The detector used to score claims.
+            Defaults to the shared detector from `get_checkworthy_detector`.
+        chunk_tokens (int):
+            The estimated number of tokens of transcript in each chunk.
+        overlap_tokens (int):
+            The estimated number of tokens to repeat between consecutive chunks.
+        extraction_mode (ExtractionMode):
+            How claims are located in the transcript. "spans" asks for sentence
+            numbers rather than quotes. See `extract_claims_from_transcript`.
+        cache_scope (str | None):
+            Identifies who the keywords are for, e.g. an organisation and
+            language. If context caching is turned on, prompts cached with older
+            keywords for the same scope are deleted.
+
+    Yields:
+        VideoClaims: Each claim, marked up with scores.
+
+    Raises:
+        CheckworthyError:
+            If something goes wrong during claim extraction or
+            pastel, the CheckworthyError will say what went wrong.
+    """
+    pastel = checkworthy_model or get_checkworthy_detector()
+
+    deduplicator = ClaimDeduplicator()
+
+    async def process_chunk(chunk: list[TranscriptSentence]) -> list[VideoClaims]:
+        claims = await extract_claims_from_transcript(
+            transcript=chunk,
+            keywords=keywords,
+            max_attempts=2,
+            mode=extraction_mode,
+            cache_scope=cache_scope,
         )
-        pastel = CheckworthyClaimDetector()
-        claims_text = [claim.claim for claim in claims]
-        scores_and_answers = await pastel.score_sentences(claims_text, max_attempts=2)
-
-        for claim in claims:
-            claim.metadata = {
-                **claim.metadata,
-                "score": scores_and_answers[claim.claim].score,
-                "answers": scores_and_answers[claim.claim].answers,
-            }
-        return claims
+        new_claims = [claim for claim in claims if deduplicator.add(claim)]
+        return await score_claims(pastel, new_claims, "transcript_search")
+
+    chunks = chunk_by_tokens(
+        transcript, lambda sentence: sentence.text, chunk_tokens, overlap_tokens
+    )
+    record_funnel("transcript_search", input=len(transcript))
+    try:
+        async for claims in iterate_as_completed(
+            process_chunk(chunk) for chunk in chunks
+        ):
+            for claim in claims:
+                yield claim
     except (ClaimExtractionError, PastelError) as exc:
         raise CheckworthyError from exc
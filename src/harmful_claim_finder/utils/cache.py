@@ -0,0 +1,306 @@
+"""
+Two-tier caches for LLM results: an in-memory LRU in front of an optional SQLite
+store, which persists entries between processes.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Generic, Iterable, TypeVar
+
+ValueType = TypeVar("ValueType")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalise_sentence(sentence: str) -> str:
+    """
+    Normalises a sentence for use in a cache key, so trivial differences in
+    unicode form, case or whitespace don't cause a cache miss.
+    """
+    sentence = unicodedata.normalize("NFKC", sentence).casefold()
+    return _WHITESPACE.sub(" ", sentence).strip()
+
+
+def text_hash(*parts: str) -> str:
+    """
+    Returns a SHA-256 hex digest of some strings.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def make_fingerprint(*parts: Any) -> str:
+    """
+    Returns a stable hash of some JSON serialisable values.
+    Used to invalidate cached results when the inputs that produced them change.
+    """
+    return text_hash(json.dumps(parts, sort_keys=True, ensure_ascii=False))
+
+
+class LRUCache(Generic[ValueType]):
+    """
+    A thread-safe in-memory cache, which evicts the least recently used entries.
+    """
+
+    def __init__(self, max_entries: int = 10_000) -> None:
+        """
+        Args:
+            max_entries (int):
+                The maximum number of entries to keep.
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, ValueType] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, ValueType]:
+        """
+        Returns the cached values for any of the keys which are in the cache.
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+        return found
+
+    def set_many(self, items: dict[str, ValueType]) -> None:
+        """
+        Adds entries to the cache, evicting the oldest entries if it is full.
+        """
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """
+    A persistent cache of strings, stored in a SQLite database.
+    Entries expire after `ttl_s` seconds, and once there are more than
+    `max_entries` entries in a namespace, the least recently used are deleted.
+    The number of entries is tracked as they're written, so the table is only
+    counted when it may be full, or every `evict_every` writes, when expired
+    entries are deleted too.
+    """
+
+    def __init__(
+        self,
+        db_path: Path | str,
+        namespace: str,
+        ttl_s: float = 7 * 24 * 60 * 60,
+        max_entries: int = 1_000_000,
+        evict_every: int = 100,
+    ) -> None:
+        """
+        Args:
+            db_path (Path | str):
+                Path to the SQLite database. It will be created if needed.
+            namespace (str):
+                Keeps entries from different caches sharing a database apart.
+            ttl_s (float):
+                How long, in seconds, an entry is kept for.
+            max_entries (int):
+                The maximum number of entries to keep in this namespace.
+            evict_every (int):
+                How many writes to make between deleting expired entries.
+                Expired entries are never returned, even before they're deleted.
+        """
+        self.namespace = namespace
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._writes = 0
+        # at least the number of entries, as replaced keys are counted again
+        self._count: int | None = None
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(db_path), check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed "
+            "ON cache (namespace, accessed_at)"
+        )
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, str]:
+        """
+        Returns the unexpired cached values for any of the keys in the cache.
+        """
+        keys = list(keys)
+        found: dict[str, str] = {}
+        now = time.time()
+        with self._lock:
+            # keep well below SQLite's limit on the number of query parameters
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = self._connection.execute(
+                    "SELECT key, value FROM cache WHERE namespace = ? AND created_at > ? "
+                    f"AND key IN ({', '.join('?' * len(batch))})",
+                    [self.namespace, now - self.ttl_s, *batch],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._connection.executemany(
+                    "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    [(now, self.namespace, key) for key in found],
+                )
+        return found
+
+    def set_many(self, items: dict[str, str]) -> None:
+        """
+        Adds entries to the cache, then evicts excess entries, and every
+        `evict_every` writes, expired entries.
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self.namespace, key, value, now, now)
+                    for key, value in items.items()
+                ],
+            )
+            self._writes += 1
+            if self._count is not None:
+                self._count += len(items)
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        if self._count is None or self._writes >= self.evict_every:
+            self._writes = 0
+            self._connection.execute(
+                "DELETE FROM cache WHERE namespace = ? AND created_at <= ?",
+                (self.namespace, now - self.ttl_s),
+            )
+        elif self._count <= self.max_entries:
+            return
+        # other processes sharing the database may have added entries too
+        (count,) = self._connection.execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        if count > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache WHERE namespace = ? "
+                "ORDER BY accessed_at LIMIT ?)",
+                (self.namespace, self.namespace, count - self.max_entries),
+            )
+            count = self.max_entries
+        self._count = count
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM cache WHERE namespace = ?", (self.namespace,)
+            )
+            self._count = 0
+
+
+class TieredCache(Generic[ValueType]):
+    """
+    An in-memory LRU cache, backed by an optional SQLite cache.
+    Values found on disk are promoted into memory.
+    """
+
+    def __init__(
+        self,
+        memory: LRUCache[ValueType] | None = None,
+        disk: SQLiteCache | None = None,
+        encode: Callable[[ValueType], str] = json.dumps,
+        decode: Callable[[str], ValueType] = json.loads,
+    ) -> None:
+        """
+        Args:
+            memory (LRUCache | None):
+                The in-memory tier. A default sized `LRUCache` is used if not given.
+            disk (SQLiteCache | None):
+                The on-disk tier. If not given, only the memory tier is used.
+            encode (Callable[[ValueType], str]):
+                Turns a value into a string to store on disk.
+            decode (Callable[[str], ValueType]):
+                Turns a string stored on disk back into a value.
+        """
+        self.memory: LRUCache[ValueType] = memory or LRUCache()
+        self.disk = disk
+        self.encode = encode
+        self.decode = decode
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, ValueType]:
+        """
+        Returns the cached values for any of the keys which are in either tier.
+        """
+        keys = list(keys)
+        found = self.memory.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if self.disk is not None and missing:
+            from_disk = {
+                key: self.decode(value)
+                for key, value in self.disk.get_many(missing).items()
+            }
+            self.memory.set_many(from_disk)
+            found.update(from_disk)
+        return found
+
+    def set_many(self, items: dict[str, ValueType]) -> None:
+        """
+        Adds entries to both tiers.
+        """
+        self.memory.set_many(items)
+        if self.disk is not None:
+            self.disk.set_many(
+                {key: self.encode(value) for key, value in items.items()}
+            )
+
+    async def get_many_async(self, keys: Iterable[str]) -> dict[str, ValueType]:
+        """
+        Like `get_many`, but reads the disk tier in a worker thread, so async
+        callers don't block the event loop on disk I/O.
+        """
+        keys = list(keys)
+        found = self.memory.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if self.disk is not None and missing:
+            stored = await asyncio.to_thread(self.disk.get_many, missing)
+            from_disk = {key: self.decode(value) for key, value in stored.items()}
+            self.memory.set_many(from_disk)
+            found.update(from_disk)
+        return found
+
+    async def set_many_async(self, items: dict[str, ValueType]) -> None:
+        """
+        Like `set_many`, but writes the disk tier in a worker thread, so async
+        callers don't block the event loop waiting for SQLite's write lock.
+        """
+        self.memory.set_many(items)
+        if self.disk is not None:
+            encoded = {key: self.encode(value) for key, value in items.items()}
+            await asyncio.to_thread(self.disk.set_many, encoded)
@@ -0,0 +1,94 @@
+"""
+Splits long transcripts into overlapping windows, so they can be sent to the LLM
+as several smaller prompts.
+"""
+
+import asyncio
+from itertools import accumulate
+from typing import Awaitable, Callable, Iterable, Sequence, TypeVar
+
+from harmful_claim_finder.utils.tokens import estimate_tokens
+
+ItemType = TypeVar("ItemType")
+ResultType = TypeVar("ResultType")
+
+
+def chunk_by_tokens(
+    items: Sequence[ItemType],
+    text_of: Callable[[ItemType], str],
+    max_tokens: int,
+    overlap_tokens: int = 0,
+) -> list[list[ItemType]]:
+    """
+    Splits items, such as transcript sentences, into windows of consecutive items
+    which each fit within `max_tokens`.
+    Each window starts with up to `overlap_tokens` worth of items from the end of
+    the previous window, so claims spanning a boundary appear whole in one window.
+    Items are never split, so an item bigger than `max_tokens` gets a window
+    to itself.
+
+    Args:
+        items (Sequence[ItemType]):
+            The items to split, in order.
+        text_of (Callable[[ItemType], str]):
+            Gets the text of an item, used to estimate its size.
+        max_tokens (int):
+            The estimated number of tokens to allow in each window.
+        overlap_tokens (int):
+            The estimated number of tokens to repeat between windows.
+
+    Returns:
+        list[list[ItemType]]: The windows, in order.
+    """
+    if not items:
+        return []
+    sizes = [estimate_tokens(text_of(item)) for item in items]
+    # ends[i] is the total size of items[:i]
+    ends = [0, *accumulate(sizes)]
+
+    windows: list[list[ItemType]] = []
+    start = 0
+    while True:
+        end = start + 1
+        while end < len(items) and ends[end + 1] - ends[start] <= max_tokens:
+            end += 1
+        windows.append(list(items[start:end]))
+        if end == len(items):
+            return windows
+
+        next_start = end
+        while (
+            next_start - 1 > start
+            and ends[end] - ends[next_start - 1] <= overlap_tokens
+        ):
+            next_start -= 1
+        start = next_start
+
+
+async def gather_successes(
+    awaitables: Iterable[Awaitable[ResultType]],
+) -> tuple[list[ResultType], list[Exception]]:
+    """
+    Runs awaitables, such as the calls for each chunk, concurrently, collecting
+    the results of those which succeed and the errors of those which fail, so one
+    failed chunk doesn't lose the results of the others.
+
+    Args:
+        awaitables (Iterable[Awaitable[ResultType]]):
+            The awaitables to run.
+
+    Returns:
+        list[ResultType]: The results of the successful awaitables, in order.
+        list[Exception]: The errors raised by the others.
+    """
+    outcomes = await asyncio.gather(*awaitables, return_exceptions=True)
+    results: list[ResultType] = []
+    errors: list[Exception] = []
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            errors.append(outcome)
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            results.append(outcome)
+    return results, errors
@@ -0,0 +1,396 @@
+"""
+Caches the static start of prompts, such as a system instruction and keyword
+section, with Gemini context caching. The prefix is registered once, and later
+calls only send the rest of the prompt along with the name of the cached prefix.
+Cached tokens are billed at a discount.
+
+Prefixes are identified by a fingerprint of the model, system instruction and
+prefix text, so a change to the keywords gives a new prefix. Registering a new
+prefix under the same scope, e.g. an organisation and language, deletes the old one.
+Entries expire after `ttl_s` seconds, and are replaced shortly before they do.
+Replaced and evicted entries are only forgotten, not deleted, as calls already
+using them may still be running, and the backend deletes them once they expire.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+from google import genai
+from google.genai import types
+
+from harmful_claim_finder.utils.cache import make_fingerprint, text_hash
+from harmful_claim_finder.utils.metrics import REGISTRY
+from harmful_claim_finder.utils.rate_limit import DEFAULT_MODEL, get_rate_limiter
+from harmful_claim_finder.utils.single_flight import SingleFlight
+from harmful_claim_finder.utils.tokens import estimate_tokens
+from harmful_claim_finder.utils.usage import record_usage
+
+_logger = logging.getLogger(__name__)
+
+CONTEXT_CACHE_FEATURE = "context_cache"
+
+CONTEXT_CACHE = REGISTRY.counter(
+    "harmful_claim_finder_context_cache_total",
+    "Lookups of cached prompt prefixes, by result.",
+    ["result"],
+)
+
+
+@dataclass(frozen=True)
+class CachedPrefix:
+    """
+    Attributes:
+        name (str):
+            The name the backend gave the cached prefix, used to refer to it.
+        fingerprint (str):
+            Identifies the model, system instruction and prefix text.
+        tokens (int):
+            The estimated number of tokens in the cached prefix.
+        expires_at (float):
+            When the prefix expires, as a `time.monotonic()` time.
+    """
+
+    name: str
+    fingerprint: str
+    tokens: int
+    expires_at: float
+
+
+class PrefixCacheBackend(Protocol):
+    """
+    Stores prompt prefixes, and runs prompts which start with a stored prefix.
+    """
+
+    async def create(
+        self, model: str, system_instruction: str | None, prefix: str, ttl_s: float
+    ) -> str:
+        """Stores a prefix for `ttl_s` seconds, and returns its name."""
+        ...
+
+    async def delete(self, name: str) -> None:
+        """Deletes a stored prefix."""
+        ...
+
+    async def generate(
+        self,
+        name: str,
+        model: str,
+        prompt: str,
+        output_schema: Any = None,
+        video_uri: str | None = None,
+        labels: dict[str, str] | None = None,
+    ) -> str:
+        """Runs the stored prefix followed by `prompt`, and returns the response."""
+        ...
+
+
+class GeminiPrefixCacheBackend:
+    """
+    Stores prefixes as Gemini cached content, using the `google-genai` client.
+    """
+
+    def __init__(
+        self,
+        client: genai.Client | None = None,
+        default_model: str = "gemini-2.5-flash",
+        video_mime_type: str = "video/mp4",
+    ) -> None:
+        """
+        Args:
+            client (genai.Client | None):
+                The client to use. If not given, one is made from the environment
+                when first needed.
+            default_model (str):
+                The model used for calls which don't name one.
+            video_mime_type (str):
+                The type of videos passed by `video_uri`.
+        """
+        self._client = client
+        self.default_model = default_model
+        self.video_mime_type = video_mime_type
+
+    @property
+    def client(self) -> genai.Client:
+        if self._client is None:
+            self._client = genai.Client()
+        return self._client
+
+    def _model(self, model: str) -> str:
+        return self.default_model if model == DEFAULT_MODEL else model
+
+    async def create(
+        self, model: str, system_instruction: str | None, prefix: str, ttl_s: float
+    ) -> str:
+        cached = await self.client.aio.caches.create(
+            model=self._model(model),
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                contents=[types.UserContent(parts=[types.Part.from_text(text=prefix)])],
+                ttl=f"{int(ttl_s)}s",
+            ),
+        )
+        if cached.name is None:
+            raise ValueError("Gemini did not name the cached content.")
+        return cached.name
+
+    async def delete(self, name: str) -> None:
+        await self.client.aio.caches.delete(name=name)
+
+    async def generate(
+        self,
+        name: str,
+        model: str,
+        prompt: str,
+        output_schema: Any = None,
+        video_uri: str | None = None,
+        labels: dict[str, str] | None = None,
+    ) -> str:
+        parts = []
+        if video_uri is not None:
+            parts.append(
+                types.Part.from_uri(file_uri=video_uri, mime_type=self.video_mime_type)
+            )
+        if prompt:
+            parts.append(types.Part.from_text(text=prompt))
+        response = await self.client.aio.models.generate_content(
+            model=self._model(model),
+            contents=[types.UserContent(parts=parts)],
+            config=types.GenerateContentConfig(
+                cached_content=name,
+                response_mime_type="application/json" if output_schema else None,
+                response_schema=output_schema,
+                labels=labels,
+            ),
+        )
+        return response.text or ""
+
+
+def outline_scope(scope: str | None, prompt_outline: str) -> str | None:
+    """
+    Returns the scope to cache the start of a prompt outline under, so prompts
+    using different outlines for the same scope, e.g. an organisation and
+    language, are cached separately. Returns None if `scope` is None.
+    """
+    if scope is None:
+        return None
+    return f"{scope}/{text_hash(prompt_outline)[:12]}"
+
+
+def is_missing_cache_error(exc: BaseException) -> bool:
+    """
+    Returns True if an exception looks like a cached prefix no longer existing,
+    e.g. because it expired early or was deleted elsewhere.
+    """
+    message = str(exc).lower()
+    return getattr(exc, "code", None) == 404 or (
+        "cached" in message and "not found" in message
+    )
+
+
+class PrefixCache:
+    """
+    Registers prompt prefixes with a backend, reusing them until they expire.
+    Prefixes too short for caching to pay off are not cached.
+    """
+
+    def __init__(
+        self,
+        backend: PrefixCacheBackend,
+        ttl_s: float = 60 * 60,
+        refresh_margin_s: float = 60,
+        min_tokens: int = 1024,
+        max_entries: int = 100,
+    ) -> None:
+        """
+        Args:
+            backend (PrefixCacheBackend):
+                Stores the prefixes.
+            ttl_s (float):
+                How long each prefix is stored for.
+            refresh_margin_s (float):
+                Prefixes this close to expiring are replaced rather than reused, so
+                they don't expire while a call is using them.
+            min_tokens (int):
+                The fewest estimated tokens of system instruction and prefix to
+                cache. Gemini won't cache less than its minimum for the model.
+            max_entries (int):
+                The most prefixes to keep. The least recently used are forgotten,
+                and left to expire on the backend.
+        """
+        self.backend = backend
+        self.ttl_s = ttl_s
+        self.refresh_margin_s = refresh_margin_s
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, CachedPrefix] = OrderedDict()
+        self._scopes: dict[str, str] = {}
+        self._creating: SingleFlight[CachedPrefix] = SingleFlight()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    async def get(
+        self,
+        model: str,
+        system_instruction: str | None,
+        prefix: str,
+        scope: str | None = None,
+    ) -> CachedPrefix | None:
+        """
+        Returns the cached prefix for a model, system instruction and prefix text,
+        registering it if it isn't cached or is about to expire.
+
+        Args:
+            model (str):
+                The model the prefix is used with.
+            system_instruction (str | None):
+                The system instruction, cached along with the prefix.
+            prefix (str):
+                The static start of the prompt.
+            scope (str | None):
+                Identifies who the prefix is for, e.g. an organisation and language.
+                A different prefix registered under the same scope, such as one with
+                older keywords, is deleted.
+
+        Returns:
+            CachedPrefix | None:
+                The cached prefix, or None if it is too short to cache.
+        """
+        tokens = estimate_tokens((system_instruction or "") + prefix)
+        if tokens < self.min_tokens:
+            CONTEXT_CACHE.inc(result="too_small")
+            return None
+        fingerprint = make_fingerprint(model, system_instruction, prefix)
+        now = time.monotonic()
+        stale: list[CachedPrefix] = []
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None and entry.expires_at - self.refresh_margin_s <= now:
+                # calls using it may still be running, so leave it to expire
+                CONTEXT_CACHE.inc(result="expired")
+                del self._entries[fingerprint]
+                entry = None
+            if scope is not None:
+                previous = self._scopes.get(scope)
+                if previous is not None and previous != fingerprint:
+                    if previous in self._entries:
+                        CONTEXT_CACHE.inc(result="invalidated")
+                        stale.append(self._entries.pop(previous))
+                self._scopes[scope] = fingerprint
+            if entry is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                CONTEXT_CACHE.inc(result="hit")
+            else:
+                self.misses += 1
+                CONTEXT_CACHE.inc(result="miss")
+        await self._delete(stale)
+        if entry is not None:
+            return entry
+
+        async def create() -> CachedPrefix:
+            return await self._create(model, system_instruction, prefix, fingerprint)
+
+        entry, _ = await self._creating.run(fingerprint, create)
+        return entry
+
+    async def _create(
+        self, model: str, system_instruction: str | None, prefix: str, fingerprint: str
+    ) -> CachedPrefix:
+        async with get_rate_limiter().slot(model, CONTEXT_CACHE_FEATURE):
+            name = await self.backend.create(
+                model, system_instruction, prefix, self.ttl_s
+            )
+        entry = CachedPrefix(
+            name=name,
+            fingerprint=fingerprint,
+            tokens=estimate_tokens((system_instruction or "") + prefix),
+            expires_at=time.monotonic() + self.ttl_s,
+        )
+        with self._lock:
+            # replaced and evicted prefixes are left to expire on the backend
+            self._entries.pop(fingerprint, None)
+            self._entries[fingerprint] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        _logger.debug(f"Cached a prompt prefix of {entry.tokens} tokens as {name}.")
+        # registering the prefix is billed as a prompt of its full length
+        record_usage(CONTEXT_CACHE_FEATURE, entry.tokens, 0)
+        return entry
+
+    def discard(self, entry: CachedPrefix) -> None:
+        """
+        Forgets a cached prefix which the backend no longer has, so the next call
+        registers it again.
+        """
+        with self._lock:
+            if self._entries.get(entry.fingerprint) == entry:
+                del self._entries[entry.fingerprint]
+        CONTEXT_CACHE.inc(result="missing")
+
+    async def invalidate(self, scope: str) -> None:
+        """
+        Deletes the prefix registered under a scope, e.g. when an organisation's
+        keywords are removed.
+        """
+        with self._lock:
+            fingerprint = self._scopes.pop(scope, None)
+            entry = self._entries.pop(fingerprint, None) if fingerprint else None
+        if entry is not None:
+            CONTEXT_CACHE.inc(result="invalidated")
+            await self._delete([entry])
+
+    async def clear(self) -> None:
+        """
+        Deletes every cached prefix.
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._scopes.clear()
+        await self._delete(entries)
+
+    async def _delete(self, entries: list[CachedPrefix]) -> None:
+        for entry in entries:
+            try:
+                await self.backend.delete(entry.name)
+            except Exception as exc:
+                # it will expire anyway, so this only costs storage until then
+                _logger.info(f"Could not delete cached prefix {entry.name}: {exc!r}")
+
+
+_prefix_cache: PrefixCache | None = None
+
+
+def get_prefix_cache() -> PrefixCache | None:
+    """
+    Returns the prefix cache shared by every Gemini call in this process, if
+    context caching is turned on.
+    """
+    return _prefix_cache
+
+
+def set_prefix_cache(cache: PrefixCache | None) -> None:
+    """
+    Turns on context caching for every Gemini call in this process, or off if
+    `cache` is None.
+
+    Example:
+        ```python
+        set_prefix_cache(PrefixCache(GeminiPrefixCacheBackend()))
+        ```
+    """
+    global _prefix_cache
+    _prefix_cache = cache
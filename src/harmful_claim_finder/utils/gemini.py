@@ -0,0 +1,166 @@
+"""
+The entry point for every Gemini call made by the pipelines.
+Identical concurrent calls are coalesced into one, and calls go through the shared
+rate limiter, keyed by model and feature label. Token usage is recorded against
+any active budgets. If context caching is turned on, static prompt prefixes are
+sent once and then referred to by name. If hedging is turned on, a duplicate of an
+unusually slow call is sent.
+"""
+
+import asyncio
+from typing import Any
+
+from genai_utils.gemini import run_prompt_async as _run_prompt_async
+
+from harmful_claim_finder.utils.cache import make_fingerprint
+from harmful_claim_finder.utils.context_cache import (
+    get_prefix_cache,
+    is_missing_cache_error,
+)
+from harmful_claim_finder.utils.hedging import run_hedged
+from harmful_claim_finder.utils.metrics import REGISTRY
+from harmful_claim_finder.utils.rate_limit import DEFAULT_MODEL, get_rate_limiter
+from harmful_claim_finder.utils.single_flight import SingleFlight
+from harmful_claim_finder.utils.tokens import estimate_tokens
+from harmful_claim_finder.utils.usage import check_budgets, record_usage
+
+PASTEL_FEATURE = "pastel"
+
+COALESCED = REGISTRY.counter(
+    "harmful_claim_finder_coalesced_requests_total",
+    "Number of calls which shared an identical call already in flight.",
+    ["feature"],
+)
+
+_prompt_flights: SingleFlight[str] = SingleFlight()
+
+
+def model_key(model_config: Any = None) -> str:
+    """
+    Returns the name of the model used by a call, for keying rate limits.
+    """
+    return str(getattr(model_config, "model_name", None) or DEFAULT_MODEL)
+
+
+def prompt_fingerprint(prompt: str, *args: Any, **kwargs: Any) -> str:
+    """
+    Returns a fingerprint of everything which affects the response to a prompt:
+    the prompt, system instruction, output schema, model and any other arguments.
+    Labels are left out, as they don't change the response.
+    """
+    kwargs = {key: value for key, value in kwargs.items() if key != "labels"}
+    return make_fingerprint(
+        prompt,
+        [repr(arg) for arg in args],
+        {key: repr(value) for key, value in kwargs.items()},
+        model_key(kwargs.get("model_config")),
+    )
+
+
+async def run_prompt_async(
+    prompt: str,
+    *args: Any,
+    labels: dict[str, str] | None = None,
+    cached_prefix: str = "",
+    cache_scope: str | None = None,
+    **kwargs: Any,
+) -> str:
+    """
+    Runs a prompt with `genai_utils.gemini.run_prompt_async`, once the shared rate
+    limiter allows it. Takes the same arguments.
+    If an identical prompt is already in flight, waits for its response instead of
+    sending it again. Only the caller which sent the prompt is charged for it, and
+    for any duplicate sent by the hedger.
+
+    Args:
+        prompt (str):
+            The prompt to run.
+        labels (dict[str, str] | None):
+            Labels for the call. The "feature" label is used to key rate limits.
+        cached_prefix (str):
+            Static text which comes before `prompt`, such as a keyword section.
+            If context caching is turned on, it is cached with the system
+            instruction, and only `prompt` is sent. Otherwise it is sent as the
+            start of the prompt.
+        cache_scope (str | None):
+            Identifies who the prefix is for, e.g. an organisation and language,
+            so the cached prefix is replaced when their keywords change.
+
+    Returns:
+        str: The model's response.
+
+    Raises:
+        BudgetExceededError: If an active token budget has been used up.
+    """
+    check_budgets()
+    feature = (labels or {}).get("feature", "unlabelled")
+    model = model_key(kwargs.get("model_config"))
+    system_instruction = kwargs.get("system_instruction")
+
+    async def call() -> str:
+        prefix_cache = get_prefix_cache()
+        cached = None
+        if cached_prefix and prefix_cache is not None and not args:
+            cached = await prefix_cache.get(
+                model,
+                system_instruction if isinstance(system_instruction, str) else None,
+                cached_prefix,
+                scope=cache_scope,
+            )
+
+        if cached is None:
+            prompt_tokens = estimate_tokens(cached_prefix + prompt)
+            if isinstance(system_instruction, str):
+                prompt_tokens += estimate_tokens(system_instruction)
+            cached_tokens = 0
+        else:
+            prompt_tokens = estimate_tokens(prompt)
+            cached_tokens = cached.tokens
+
+        async def send() -> str:
+            if prefix_cache is None or cached is None:
+                return await _run_prompt_async(
+                    cached_prefix + prompt, *args, labels=labels, **kwargs
+                )
+            try:
+                return await prefix_cache.backend.generate(
+                    cached.name,
+                    model,
+                    prompt,
+                    output_schema=kwargs.get("output_schema"),
+                    video_uri=kwargs.get("video_uri"),
+                    labels=labels,
+                )
+            except Exception as exc:
+                if is_missing_cache_error(exc):
+                    prefix_cache.discard(cached)
+                raise
+
+        async def attempt() -> str:
+            # a duplicate sent by the hedger is checked against budgets and
+            # charged like any other call
+            check_budgets()
+            try:
+                response = await send()
+            except asyncio.CancelledError:
+                # the prompt was sent, so is charged even if the call was cancelled
+                record_usage(feature, prompt_tokens, 0, cached_tokens=cached_tokens)
+                raise
+            record_usage(
+                feature,
+                prompt_tokens,
+                estimate_tokens(response),
+                cached_tokens=cached_tokens,
+            )
+            return response
+
+        return await run_hedged(
+            feature, attempt, slot=lambda: get_rate_limiter().slot(model, feature)
+        )
+
+    response, shared = await _prompt_flights.run(
+        prompt_fingerprint(cached_prefix + prompt, *args, **kwargs), call
+    )
+    if shared:
+        COALESCED.inc(feature=feature)
+    return response
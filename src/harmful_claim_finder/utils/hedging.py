@@ -0,0 +1,266 @@
+"""
+Hedges slow LLM calls: if a call hasn't returned by a high percentile of the
+latency seen for its feature, a duplicate is sent, and whichever returns first is
+used. The other is cancelled.
+
+A few slow calls set the p99 latency of a whole video, and a duplicate of a slow
+call is usually fast. Duplicates are budgeted, so hedging never adds more than a
+set fraction of extra calls.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Awaitable, Callable, TypeVar
+
+from harmful_claim_finder.utils.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+ResultType = TypeVar("ResultType")
+
+# Makes a context which holds a rate limit slot while a call runs
+SlotFactory = Callable[[], AsyncContextManager[None]]
+
+HEDGES = REGISTRY.counter(
+    "harmful_claim_finder_hedged_requests_total",
+    "Duplicate calls for slow calls, by feature and outcome: 'won' or 'lost' against "
+    "the original call, 'failed' if both failed, or 'over_budget' if none was sent.",
+    ["feature", "outcome"],
+)
+CALL_LATENCY = REGISTRY.histogram(
+    "harmful_claim_finder_llm_call_latency_seconds",
+    "Time taken by each LLM call, from getting a rate limit slot until the first of "
+    "it and any duplicate returned.",
+    ["feature"],
+)
+
+
+class RequestHedger:
+    """
+    Sends a duplicate of calls which are slower than usual for their feature, and
+    uses whichever response arrives first.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        max_extra_fraction: float = 0.05,
+        min_samples: int = 20,
+        window: int = 1000,
+        min_delay_s: float = 0.0,
+        features: set[str] | None = None,
+    ) -> None:
+        """
+        Args:
+            percentile (float):
+                The percentile of a feature's recent latencies after which a
+                duplicate is sent.
+            max_extra_fraction (float):
+                The most extra LLM calls to make for duplicates, as a fraction of
+                all calls.
+            min_samples (int):
+                The number of latencies to see for a feature before hedging it.
+            window (int):
+                The number of recent latencies to keep for each feature.
+            min_delay_s (float):
+                The shortest time to wait before sending a duplicate.
+            features (set[str] | None):
+                The features to hedge. If None, every feature is hedged.
+        """
+        self.percentile = percentile
+        self.max_extra_fraction = max_extra_fraction
+        self.min_samples = min_samples
+        self.min_delay_s = min_delay_s
+        self.features = features
+        self.calls = 0
+        self.hedges = 0
+        self._window = window
+        self._latencies: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def delay(self, feature: str) -> float | None:
+        """
+        Returns how long to wait for a call before sending a duplicate, or None if
+        the feature isn't hedged, or not enough calls have been seen for it.
+        """
+        if self.features is not None and feature not in self.features:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(feature, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        index = round(self.percentile / 100 * (len(latencies) - 1))
+        return max(latencies[index], self.min_delay_s)
+
+    def record(self, feature: str, latency_s: float) -> None:
+        """
+        Records the latency of a call which returned.
+        """
+        with self._lock:
+            latencies = self._latencies.get(feature)
+            if latencies is None:
+                latencies = self._latencies[feature] = deque(maxlen=self._window)
+            latencies.append(latency_s)
+
+    def _take_budget(self, cost: int) -> bool:
+        with self._lock:
+            if self.hedges + cost > self.max_extra_fraction * self.calls:
+                return False
+            self.hedges += cost
+            return True
+
+    async def _timed(
+        self,
+        feature: str,
+        make_call: Callable[[], Awaitable[ResultType]],
+        slot: SlotFactory,
+        started: "asyncio.Future[float] | None" = None,
+    ) -> ResultType:
+        async with slot():
+            start = time.monotonic()
+            if started is not None and not started.done():
+                started.set_result(start)
+            result = await make_call()
+            self.record(feature, time.monotonic() - start)
+            return result
+
+    async def run(
+        self,
+        feature: str,
+        make_call: Callable[[], Awaitable[ResultType]],
+        cost: int = 1,
+        slot: SlotFactory | None = None,
+    ) -> ResultType:
+        """
+        Runs `make_call()`, and runs it again if the first call is slow, returning
+        the first result. If one call fails, waits for the other.
+
+        Args:
+            feature (str):
+                The feature label of the call, which latencies are tracked by.
+            make_call (Callable[[], Awaitable[ResultType]]):
+                Makes the call. Called a second time for the duplicate.
+            cost (int):
+                The number of LLM calls `make_call()` makes, e.g. one per sentence
+                for a PASTEL batch, counted against the hedging budget.
+            slot (SlotFactory | None):
+                Makes a context to hold while each call runs, such as a rate limit
+                slot. Calls are only timed once they have their slot, so a call
+                isn't hedged for waiting behind others.
+
+        Returns:
+            ResultType: The result of whichever call returned first.
+        """
+        slot = slot or nullcontext
+        if self.features is not None and feature not in self.features:
+            return await _run_in_slot(feature, make_call, slot)
+        with self._lock:
+            self.calls += cost
+        delay = self.delay(feature)
+        started: asyncio.Future[float] = asyncio.get_running_loop().create_future()
+        first = asyncio.ensure_future(self._timed(feature, make_call, slot, started))
+        try:
+            # latency is measured from when the call gets its slot
+            starting: set[asyncio.Future[Any]] = {first, started}
+            await asyncio.wait(starting, return_when=asyncio.FIRST_COMPLETED)
+            if delay is not None:
+                await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        try:
+            if delay is None or first.done():
+                return await first
+            return await self._hedge(feature, make_call, cost, slot, first, delay)
+        finally:
+            if started.done():
+                CALL_LATENCY.observe(
+                    time.monotonic() - started.result(), feature=feature
+                )
+
+    async def _hedge(
+        self,
+        feature: str,
+        make_call: Callable[[], Awaitable[ResultType]],
+        cost: int,
+        slot: SlotFactory,
+        first: "asyncio.Future[ResultType]",
+        delay: float,
+    ) -> ResultType:
+        if not self._take_budget(cost):
+            HEDGES.inc(feature=feature, outcome="over_budget")
+            return await first
+
+        _logger.debug(f"Sending a duplicate {feature} call after {delay:.2f}s.")
+        second = asyncio.ensure_future(self._timed(feature, make_call, slot))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    winner = second if second in succeeded else first
+                    HEDGES.inc(
+                        feature=feature, outcome="won" if winner is second else "lost"
+                    )
+                    return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        HEDGES.inc(feature=feature, outcome="failed")
+        return first.result()
+
+
+async def _run_in_slot(
+    feature: str, make_call: Callable[[], Awaitable[ResultType]], slot: SlotFactory
+) -> ResultType:
+    async with slot():
+        with CALL_LATENCY.time(feature=feature):
+            return await make_call()
+
+
+_request_hedger: RequestHedger | None = None
+
+
+def get_request_hedger() -> RequestHedger | None:
+    """
+    Returns the hedger shared by every LLM call in this process, if hedging is
+    turned on.
+    """
+    return _request_hedger
+
+
+def set_request_hedger(hedger: RequestHedger | None) -> None:
+    """
+    Turns on hedging for every LLM call in this process, or off if `hedger` is None.
+
+    Example:
+        ```python
+        set_request_hedger(RequestHedger(percentile=95, max_extra_fraction=0.05))
+        ```
+    """
+    global _request_hedger
+    _request_hedger = hedger
+
+
+async def run_hedged(
+    feature: str,
+    make_call: Callable[[], Awaitable[ResultType]],
+    cost: int = 1,
+    slot: SlotFactory | None = None,
+) -> ResultType:
+    """
+    Runs `make_call()` with the shared hedger, if hedging is turned on, and records
+    how long it took once it had its `slot`. `cost` is the number of LLM calls
+    `make_call()` makes.
+    """
+    hedger = get_request_hedger()
+    if hedger is None:
+        return await _run_in_slot(feature, make_call, slot or nullcontext)
+    return await hedger.run(feature, make_call, cost, slot)
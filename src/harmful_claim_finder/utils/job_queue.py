@@ -0,0 +1,209 @@
+"""
+A job queue stored in a local SQLite database, which worker processes on the same
+machine take jobs from.
+
+Workers only claim a job when they have room to start it, so jobs aren't taken by
+one worker while others sit idle, and producers wait while the queue is full.
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from harmful_claim_finder.utils.metrics import REGISTRY
+
+QUEUED_JOBS = REGISTRY.counter(
+    "harmful_claim_finder_queued_jobs_total",
+    "Jobs which reached each status in the local job queue: 'pending', 'claimed', "
+    "'done' or 'failed'.",
+    ["status"],
+)
+
+
+class SQLiteJobQueue:
+    """
+    A queue of jobs, each an id and a string payload, which can be shared by
+    several processes.
+    Each job is 'pending' until a worker claims it, then 'done' or 'failed'.
+    A job released unfinished too many times, e.g. because it crashes the worker
+    running it, is failed rather than put back.
+    """
+
+    def __init__(
+        self,
+        db_path: Path | str,
+        max_pending: int | None = None,
+        poll_interval_s: float = 0.5,
+        max_attempts: int = 3,
+    ) -> None:
+        """
+        Args:
+            db_path (Path | str):
+                Path to the SQLite database. It will be created if needed.
+            max_pending (int | None):
+                The most pending jobs to allow. `put` waits while the queue is full.
+                No limit if not given.
+            poll_interval_s (float):
+                How often to check for space while waiting to add a job.
+            max_attempts (int):
+                The most times a job can be claimed. A job released unfinished
+                after this many claims is failed.
+        """
+        self.max_pending = max_pending
+        self.poll_interval_s = poll_interval_s
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # other processes hold the write lock briefly, so wait for it
+        self._connection = sqlite3.connect(
+            str(db_path), check_same_thread=False, isolation_level=None, timeout=30.0
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL UNIQUE, "
+            "payload TEXT NOT NULL, status TEXT NOT NULL, worker TEXT, "
+            "error TEXT, updated_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq)"
+        )
+
+    def put(self, job_id: str, payload: str) -> bool:
+        """
+        Adds a job, waiting while the queue is full. Adding a job which is already
+        in the queue does nothing.
+
+        Returns:
+            bool: True if the job was added.
+        """
+        while self.max_pending is not None and self.pending() >= self.max_pending:
+            time.sleep(self.poll_interval_s)
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, payload, status, updated_at) "
+                "VALUES (?, ?, 'pending', ?)",
+                (job_id, payload, time.time()),
+            )
+        added = cursor.rowcount > 0
+        if added:
+            QUEUED_JOBS.inc(status="pending")
+        return added
+
+    def claim(self, worker: str) -> tuple[str, str] | None:
+        """
+        Claims the oldest pending job for a worker.
+
+        Returns:
+            tuple[str, str] | None:
+                The (job_id, payload) of the job, or None if no jobs are pending.
+        """
+        with self._lock:
+            # take the write lock first, so two workers can't claim the same job
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT job_id, payload FROM jobs WHERE status = 'pending' "
+                    "ORDER BY seq LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE jobs SET status = 'claimed', worker = ?, "
+                        "attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                        (worker, time.time(), row[0]),
+                    )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        if row is not None:
+            QUEUED_JOBS.inc(status="claimed")
+        return row
+
+    def _finish(self, job_id: str, status: str, error: str | None = None) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ?",
+                (status, error, time.time(), job_id),
+            )
+        QUEUED_JOBS.inc(status=status)
+
+    def complete(self, job_id: str) -> None:
+        """Marks a claimed job as done."""
+        self._finish(job_id, "done")
+
+    def fail(self, job_id: str, error: str) -> None:
+        """Marks a claimed job as failed, with what went wrong."""
+        self._finish(job_id, "failed", error)
+
+    def release_claimed(self, worker: str | None = None) -> int:
+        """
+        Puts claimed jobs back in the queue, e.g. those of a worker which stopped
+        without finishing them. Releases every claimed job if `worker` is None.
+        Jobs which have been claimed `max_attempts` times are failed instead.
+
+        Returns:
+            int: The number of jobs put back in the queue.
+        """
+        condition = "status = 'claimed'"
+        params: tuple[str, ...] = ()
+        if worker is not None:
+            condition += " AND worker = ?"
+            params = (worker,)
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                failed = self._connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+                    f"WHERE {condition} AND attempts >= ?",
+                    (
+                        f"Claimed {self.max_attempts} times without finishing.",
+                        time.time(),
+                        *params,
+                        self.max_attempts,
+                    ),
+                ).rowcount
+                released = self._connection.execute(
+                    "UPDATE jobs SET status = 'pending', worker = NULL, updated_at = ? "
+                    f"WHERE {condition}",
+                    (time.time(), *params),
+                ).rowcount
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        if failed:
+            QUEUED_JOBS.inc(failed, status="failed")
+        return released
+
+    def retry_failed(self) -> int:
+        """
+        Puts failed jobs back in the queue, with all their attempts again.
+
+        Returns:
+            int: The number of jobs put back.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "UPDATE jobs SET status = 'pending', error = NULL, attempts = 0, "
+                "updated_at = ? WHERE status = 'failed'",
+                (time.time(),),
+            ).rowcount
+
+    def counts(self) -> dict[str, int]:
+        """Returns the number of jobs with each status."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def pending(self) -> int:
+        """Returns the number of jobs waiting to be claimed."""
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'pending'"
+            ).fetchone()
+        return count
@@ -0,0 +1,125 @@
+"""
+A persistent journal of the output of each stage for each job in a batch, so an
+interrupted batch can be restarted without repeating the LLM calls which had
+already succeeded.
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+
+from harmful_claim_finder.utils.metrics import REGISTRY
+
+RESUMED_STAGES = REGISTRY.counter(
+    "harmful_claim_finder_resumed_stages_total",
+    "Stages skipped because their output was already in the job journal, by stage.",
+    ["stage"],
+)
+
+
+class JobJournal:
+    """
+    Records the output of each stage of each job in a SQLite database, as soon as
+    the stage finishes. Recording a stage again replaces its output, so writes are
+    idempotent, and a job rerun after an interruption overwrites what it had done.
+    Outputs are kept on disk, rather than in memory, so a batch of any size can be
+    journaled.
+    """
+
+    def __init__(self, db_path: Path | str, batch: str) -> None:
+        """
+        Args:
+            db_path (Path | str):
+                Path to the SQLite database. It will be created if needed.
+            batch (str):
+                The name of the batch. Restarting a batch with the same name
+                resumes it, so use a new name for a new batch, or if the
+                keywords or models have changed.
+        """
+        self.batch = batch
+        self._lock = threading.Lock()
+        # worker processes may share a journal, so wait for each other's writes
+        self._connection = sqlite3.connect(
+            str(db_path), check_same_thread=False, isolation_level=None, timeout=30.0
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "batch TEXT NOT NULL, job_id TEXT NOT NULL, stage TEXT NOT NULL, "
+            "output TEXT NOT NULL, recorded_at REAL NOT NULL, "
+            "PRIMARY KEY (batch, job_id, stage))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS journal_stage ON journal (batch, stage, job_id)"
+        )
+
+    def record(self, job_id: str, stage: str, output: str) -> None:
+        """
+        Records the output of a finished stage of a job.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?, ?)",
+                (self.batch, job_id, stage, output, time.time()),
+            )
+
+    def get(self, job_id: str, stage: str) -> str | None:
+        """
+        Returns the recorded output of a stage of a job, or None if the stage
+        hasn't finished.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT output FROM journal WHERE batch = ? AND job_id = ? AND stage = ?",
+                (self.batch, job_id, stage),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def stages(self, job_id: str) -> dict[str, str]:
+        """
+        Returns the recorded output of every finished stage of a job, by stage.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT stage, output FROM journal WHERE batch = ? AND job_id = ?",
+                (self.batch, job_id),
+            ).fetchall()
+        return dict(rows)
+
+    def outputs(self, stage: str, page_size: int = 500) -> Iterator[tuple[str, str]]:
+        """
+        Yields (job_id, output) for every job which has finished a stage, reading
+        `page_size` jobs from disk at a time.
+        """
+        last_job_id = ""
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT job_id, output FROM journal "
+                    "WHERE batch = ? AND stage = ? AND job_id > ? "
+                    "ORDER BY job_id LIMIT ?",
+                    (self.batch, stage, last_job_id, page_size),
+                ).fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last_job_id = rows[-1][0]
+
+    def count(self, stage: str) -> int:
+        """
+        Returns the number of jobs which have finished a stage.
+        """
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM journal WHERE batch = ? AND stage = ?",
+                (self.batch, stage),
+            ).fetchone()
+        return count
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM journal WHERE batch = ?", (self.batch,)
+            )
@@ -0,0 +1,199 @@
+"""
+Repairs broken JSON from LLM responses locally, before asking the LLM to fix it.
+
+Asking the LLM to fix its output resends the whole broken response, and doubles
+the latency of that call. Most broken responses can be repaired locally instead,
+by trying each of these tiers in turn:
+
+1. "json_repair": fixes syntax slips, like missing commas or unescaped quotes.
+2. "truncated": for an array cut off part way through, keeps every element before
+   the cut.
+3. "elements": keeps every object in the response which parses on its own.
+
+The first tier giving a usable result is used, and the LLM is only asked if none
+do. Responses which are valid JSON, but in the wrong shape, go straight to the LLM.
+The "truncated" and "elements" tiers drop whatever they can't parse, so callers
+which need to know whether a result is complete can check the tier used with
+`parse_with_repair_tier`.
+"""
+
+import json
+import logging
+import re
+import traceback
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+
+import json_repair
+
+from harmful_claim_finder.utils.metrics import REGISTRY, RETRIES, STAGE_LATENCY
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?|```\s*$", re.IGNORECASE)
+
+JSON_REPAIRS = REGISTRY.counter(
+    "harmful_claim_finder_json_repairs_total",
+    "Responses which could not be parsed, by feature and the tier which repaired "
+    "them, or 'failed'.",
+    ["feature", "tier"],
+)
+
+# the repair tiers which may drop part of the response
+PARTIAL_TIERS = frozenset({"truncated", "elements"})
+
+
+def _strip_fences(response: str) -> str:
+    return _CODE_FENCE.sub("", response).strip()
+
+
+def _element_spans(text: str) -> list[tuple[int, int]]:
+    """
+    Returns the start and end of each complete object or array in the top level
+    of `text`, or in the outermost array if `text` is an array.
+    """
+    base = 1 if text.startswith("[") else 0
+    spans = []
+    depth = 0
+    start = 0
+    in_string = False
+    escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            if depth == base:
+                start = i
+            depth += 1
+        elif char in "]}":
+            depth -= 1
+            if depth == base:
+                spans.append((start, i + 1))
+            elif depth < base:
+                # unbalanced brackets, so nothing after this can be trusted
+                break
+    return spans
+
+
+def repair_candidates(response: str) -> Iterator[tuple[str, Any]]:
+    """
+    Yields each tier's repair of a broken response, as (tier, parsed value).
+    Tiers which can't repair the response are skipped.
+    """
+    text = _strip_fences(response)
+    truncated = text.startswith("[") and not text.endswith("]")
+    if not truncated:
+        yield "json_repair", json_repair.loads(text)
+
+    spans = _element_spans(text)
+    if truncated and spans:
+        yield "truncated", json_repair.loads(text[: spans[-1][1]] + "]")
+
+    elements = []
+    for start, end in spans:
+        try:
+            elements.append(json.loads(text[start:end]))
+        except json.JSONDecodeError:
+            continue
+    if elements:
+        yield "elements", elements
+
+
+def _is_json(response: str) -> bool:
+    try:
+        json.loads(_strip_fences(response))
+    except json.JSONDecodeError:
+        return False
+    return True
+
+
+async def parse_with_repair(
+    response: str,
+    parse: Callable[[str], T],
+    fix: Callable[[str], Awaitable[str]],
+    feature: str,
+    errors: tuple[type[Exception], ...] = (ValueError,),
+) -> T:
+    """
+    Parses an LLM response, repairing it locally if it can't be parsed, and only
+    asking the LLM to fix it if nothing usable can be recovered.
+    See `parse_with_repair_tier` for the arguments.
+
+    Returns:
+        T: The parsed response.
+    """
+    result, _ = await parse_with_repair_tier(response, parse, fix, feature, errors)
+    return result
+
+
+async def parse_with_repair_tier(
+    response: str,
+    parse: Callable[[str], T],
+    fix: Callable[[str], Awaitable[str]],
+    feature: str,
+    errors: tuple[type[Exception], ...] = (ValueError,),
+) -> tuple[T, str | None]:
+    """
+    Like `parse_with_repair`, but also returns how the response was repaired.
+
+    Args:
+        response (str):
+            The LLM response.
+        parse (Callable[[str], T]):
+            Parses a response, raising one of `errors` if it can't.
+        fix (Callable[[str], Awaitable[str]]):
+            Asks the LLM to fix a broken response.
+        feature (str):
+            The feature the response is for, used to label the repair metrics.
+        errors (tuple[type[Exception], ...]):
+            The exceptions `parse` raises for responses it can't parse.
+
+    Returns:
+        tuple[T, str | None]:
+            The parsed response, and the tier which repaired it, "llm" if the
+            LLM fixed it, or None if it didn't need repairing. A local repair is
+            only used if it gives a non-empty object or array, and a non-empty
+            result. A tier in `PARTIAL_TIERS` may have dropped part of it.
+
+    Raises:
+        Exception:
+            Whatever `parse` raises for the LLM's fixed response, if that can't be
+            parsed either.
+    """
+    try:
+        return parse(response), None
+    except errors:
+        _logger.info(f"Parsing error: {traceback.format_exc()}")
+
+    if not _is_json(response):
+        for tier, value in repair_candidates(response):
+            # e.g. json_repair gives "" for a refusal, which some parsers accept
+            if not isinstance(value, (dict, list)) or not value:
+                continue
+            try:
+                result = parse(json.dumps(value, ensure_ascii=False))
+            except errors:
+                continue
+            if result:
+                _logger.info(f"Repaired the response for {feature} with {tier}.")
+                JSON_REPAIRS.inc(feature=feature, tier=tier)
+                return result, tier
+
+    RETRIES.inc(stage="fix_json")
+    with STAGE_LATENCY.time(stage="fix_json"):
+        fixed_response = await fix(response)
+    try:
+        result = parse(fixed_response)
+    except errors:
+        JSON_REPAIRS.inc(feature=feature, tier="failed")
+        raise
+    JSON_REPAIRS.inc(feature=feature, tier="llm")
+    return result, "llm"
@@ -0,0 +1,379 @@
+"""
+A small metrics registry shared by all the pipelines, so we can see where time is
+spent, how many sentences make it through each step, and how often calls are
+retried.
+
+Metrics can be exported in the Prometheus text format, either to a file for the
+node exporter's textfile collector, or over HTTP.
+"""
+
+import math
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, Sequence
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)  # fmt: skip
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str, quotes: bool = True) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    metric_type = ""
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"{self.name} expects labels {self.label_names}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {_escape(self.documentation, quotes=False)}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """Returns the metric in the Prometheus text format, one line per item."""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Clears every recorded value."""
+
+
+class Counter(_Metric):
+    """
+    A value which only goes up, such as the number of retries.
+    """
+
+    metric_type = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """
+        Adds `amount` to the counter with the given labels.
+        """
+        if amount < 0:
+            raise ValueError("Counters can only be increased.")
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """
+        Returns the current value of the counter with the given labels.
+        """
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Timer:
+    """
+    Measures the time taken by a block of code.
+
+    Example:
+        ```python
+        with Timer() as timer:
+            ...
+        print(timer.elapsed_s)
+        ```
+    """
+
+    def __init__(self) -> None:
+        self._start = 0.0
+        self.elapsed_s = 0.0
+
+    def __enter__(self) -> "Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.elapsed_s = time.perf_counter() - self._start
+
+
+class Histogram(_Metric):
+    """
+    Counts observations, such as latencies, into buckets.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # the last bucket counts observations above every bound, i.e. +Inf
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Records one observation with the given labels.
+        """
+        key = self._label_values(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[Timer]:
+        """
+        Times a block of code, and records the time taken in seconds, even if it
+        raises.
+        """
+        timer = Timer()
+        try:
+            with timer:
+                yield timer
+        finally:
+            self.observe(timer.elapsed_s, **labels)
+
+    def count(self, **labels: str) -> int:
+        """
+        Returns the number of observations with the given labels.
+        """
+        with self._lock:
+            return sum(self._counts.get(self._label_values(labels), []))
+
+    def sum(self, **labels: str) -> float:
+        """
+        Returns the total of the observations with the given labels.
+        """
+        with self._lock:
+            return self._sums.get(self._label_values(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            counts = {key: list(value) for key, value in self._counts.items()}
+            sums = dict(self._sums)
+        names = (*self.label_names, "le")
+        lines = self._header()
+        for key in sorted(counts):
+            cumulative = 0
+            for bound, bucket_count in zip(
+                (*self.buckets, math.inf), counts[key], strict=True
+            ):
+                cumulative += bucket_count
+                labels = _format_labels(names, (*key, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._sums.clear()
+
+
+class MetricsRegistry:
+    """
+    Holds a set of named metrics, and exports them in the Prometheus text format.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is None:
+                self._metrics[metric.name] = metric
+                return metric
+        if (
+            type(existing) is not type(metric)
+            or existing.label_names != metric.label_names
+        ):
+            raise ValueError(f"Metric {metric.name} is already registered differently.")
+        return existing
+
+    def counter(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> Counter:
+        """
+        Returns the counter called `name`, creating it if needed.
+        """
+        metric = self._register(Counter(name, documentation, label_names))
+        assert isinstance(metric, Counter)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        """
+        Returns the histogram called `name`, creating it if needed.
+        """
+        metric = self._register(Histogram(name, documentation, label_names, buckets))
+        assert isinstance(metric, Histogram)
+        return metric
+
+    def reset(self) -> None:
+        """
+        Clears the values of every metric, keeping the metrics registered.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def to_prometheus_text(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        return "".join(line + "\n" for metric in metrics for line in metric.samples())
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "harmful_claim_finder_stage_latency_seconds",
+    "Time taken by each stage of the pipelines.",
+    ["stage"],
+)
+FUNNEL = REGISTRY.counter(
+    "harmful_claim_finder_sentences_total",
+    "Number of sentences reaching each step of the pipelines.",
+    ["pipeline", "step"],
+)
+RETRIES = REGISTRY.counter(
+    "harmful_claim_finder_retries_total",
+    "Number of times a stage was retried after a failed attempt.",
+    ["stage"],
+)
+REJECTED_ITEMS = REGISTRY.counter(
+    "harmful_claim_finder_rejected_items_total",
+    "Number of items in LLM output which failed validation and were skipped.",
+    ["feature"],
+)
+
+
+def record_funnel(pipeline: str, **step_counts: int) -> None:
+    """
+    Adds to the number of sentences reaching each step of a pipeline, e.g.
+    `record_funnel("transcript_inference", input=10, topical=4)`.
+    """
+    for step, count in step_counts.items():
+        FUNNEL.inc(count, pipeline=pipeline, step=step)
+
+
+def write_prometheus_file(
+    path: Path | str, registry: MetricsRegistry = REGISTRY
+) -> None:
+    """
+    Writes the metrics to a file in the Prometheus text format.
+    The file is replaced atomically, so a collector never reads half a file.
+
+    Args:
+        path (Path | str):
+            The file to write, e.g. in the node exporter's textfile directory.
+        registry (MetricsRegistry):
+            The metrics to write. Defaults to the shared registry.
+    """
+    path = Path(path)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, prefix=f".{path.name}.", delete=False
+    ) as tmp_file:
+        tmp_file.write(registry.to_prometheus_text())
+    os.replace(tmp_file.name, path)
+
+
+def start_metrics_server(
+    port: int, addr: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY
+) -> ThreadingHTTPServer:
+    """
+    Serves the metrics in the Prometheus text format from a background thread.
+
+    Args:
+        port (int):
+            The port to listen on. Use 0 to pick a free port.
+        addr (str):
+            The address to listen on.
+        registry (MetricsRegistry):
+            The metrics to serve. Defaults to the shared registry.
+
+    Returns:
+        ThreadingHTTPServer: The running server. Call `shutdown()` to stop it.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            body = registry.to_prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
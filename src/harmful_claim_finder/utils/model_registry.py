@@ -0,0 +1,107 @@
+"""
+A process-wide registry for models which are loaded from a file.
+Each model is loaded once per process, and reloaded when its file changes.
+"""
+
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Generic, TypeVar
+
+_logger = logging.getLogger(__name__)
+
+ModelType = TypeVar("ModelType")
+
+
+def file_hash(path: Path | str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+
+    Args:
+        path (Path | str):
+            The file to hash.
+
+    Returns:
+        str: The hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class _RegistryEntry(Generic[ModelType]):
+    model: ModelType
+    file_hash: str
+    stat_key: tuple[int, int]
+
+
+class ModelRegistry(Generic[ModelType]):
+    """
+    Loads models from files, keeping one instance per model path and file hash.
+
+    Every call to `get` checks the file's modification time and size.
+    If either has changed, the file is re-hashed, and the model is reloaded only if
+    the contents have actually changed.
+    Access is guarded by a lock, so the registry can be shared by threads and by
+    concurrent tasks on an event loop.
+    """
+
+    def __init__(self, loader: Callable[[Path], ModelType]) -> None:
+        """
+        Args:
+            loader (Callable[[Path], ModelType]):
+                Function which builds a model from a model file.
+        """
+        self._loader = loader
+        self._entries: dict[Path, _RegistryEntry[ModelType]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_file: Path | str) -> ModelType:
+        """
+        Returns the model for a file, loading it if it isn't loaded or has changed.
+
+        Args:
+            model_file (Path | str):
+                Path to the model file.
+
+        Returns:
+            ModelType: The loaded model.
+        """
+        path = Path(model_file).resolve()
+        with self._lock:
+            stat = path.stat()
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+            entry = self._entries.get(path)
+            if entry is not None and entry.stat_key == stat_key:
+                return entry.model
+
+            current_hash = file_hash(path)
+            if entry is not None and entry.file_hash == current_hash:
+                entry.stat_key = stat_key
+                return entry.model
+
+            if entry is not None:
+                _logger.info(f"Model file {path} has changed, reloading.")
+            model = self._loader(path)
+            self._entries[path] = _RegistryEntry(model, current_hash, stat_key)
+            return model
+
+    def model_hash(self, model_file: Path | str) -> str | None:
+        """
+        Returns the file hash of the currently loaded model for a file, if any.
+        """
+        with self._lock:
+            entry = self._entries.get(Path(model_file).resolve())
+            return entry.file_hash if entry else None
+
+    def clear(self) -> None:
+        """
+        Drops all loaded models, so they are reloaded on the next `get`.
+        """
+        with self._lock:
+            self._entries.clear()
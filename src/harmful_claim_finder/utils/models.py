@@ -34,6 +34,12 @@ class ParsingError(Exception):
     """
 
 
+class BudgetExceededError(Exception):
+    """
+    Raised before an LLM call if a token budget has already been used up.
+    """
+
+
 class CheckworthyResult(TypedDict):
     score: float
     topics: list[str]
@@ -46,6 +52,31 @@ class VideoClaims(BaseModel):
     metadata: dict[str, Any] = {}  # Additional metadata about the claim
 
 
+class TokenCount(BaseModel):
+    calls: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0  # Prompt tokens read from a context cache
+
+
+class TokenUsage(TokenCount):
+    cost_usd: float = 0.0  # Estimated from the token counts
+    by_feature: dict[str, TokenCount] = {}  # Keyed by the "feature" label of calls
+
+
+class VideoResult(BaseModel):
+    video_id: UUID
+    claims: list[VideoClaims] = []  # The claims found, if processing succeeded
+    error: str | None = None  # What went wrong, if processing failed
+    usage: TokenUsage | None = None  # The LLM tokens used for this video
+
+
+class TranscriptFragment(TypedDict):
+    text: str  # Part of a caption line, not necessarily a whole sentence
+    start: float  # Start time in seconds
+    duration: float  # How long the fragment is shown for, in seconds
+
+
 class TranscriptSentence(BaseModel):
     id: UUID = Field(default_factory=uuid4)
     video_id: UUID
@@ -0,0 +1,86 @@
+"""
+An index of near-duplicate sentences, so sentences which only differ in
+punctuation, case or a filler word can share one result.
+
+Sentences are normalised by removing case, punctuation and filler words, and
+sentences with the same normalised form are duplicates. They must contain exactly
+the same words in the same order, so sentences which differ by a "not", a number or
+who did what to whom never match.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Generic, TypeVar
+
+from harmful_claim_finder.utils.cache import normalise_sentence
+
+ValueType = TypeVar("ValueType")
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+# Words which are often dropped or added when the same thing is said twice.
+# Sentences can be in any language, so these must not be words in other languages,
+# e.g. "er" ("he" in German) or "um" ("around" in German).
+FILLER_WORDS = frozenset({"umm", "uh", "uhh", "erm", "hmm"})
+
+
+def normalise_for_matching(sentence: str) -> str:
+    """
+    Normalises a sentence for near-duplicate matching, removing case, punctuation
+    and filler words.
+    """
+    words = _NON_WORD.sub(" ", normalise_sentence(sentence)).split()
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+class NearDuplicateIndex(Generic[ValueType]):
+    """
+    Maps sentences to values, and finds the value of a stored sentence which is the
+    same once case, punctuation and filler words are removed.
+    Once the index is full, the least recently used sentences are evicted.
+    """
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        """
+        Args:
+            max_entries (int):
+                The maximum number of sentences to keep.
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[str, ValueType]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, sentence: str) -> tuple[str, ValueType] | None:
+        """
+        Finds a stored sentence which is a near duplicate of `sentence`.
+
+        Returns:
+            tuple[str, ValueType] | None:
+                The matching sentence and its value, or None if there is no match.
+        """
+        key = normalise_for_matching(sentence)
+        with self._lock:
+            match = self._entries.get(key)
+            if match is not None:
+                self._entries.move_to_end(key)
+            return match
+
+    def add(self, sentence: str, value: ValueType) -> None:
+        """
+        Stores a sentence and its value, replacing any near duplicate of it, and
+        evicting the least recently used sentences if the index is full.
+        """
+        key = normalise_for_matching(sentence)
+        with self._lock:
+            self._entries[key] = (sentence, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,122 @@
+"""
+Links quotes to the transcript sentences they came from, without comparing every
+quote with every sentence.
+
+An inverted index of word n-grams is built over the sentences once. Each quote is
+then only scored against the sentences sharing the most n-grams with it, and the
+sentence before each of those, in case the quote starts part way through it.
+Candidates are scored just as `genai_utils.sentence_linking.link_quotes_and_sentences`
+scores every sentence, with `fuzz.partial_ratio` against each sentence on its own,
+so a quote is linked to the same sentence whichever is used. The candidates for a
+quote are scored together with `rapidfuzz.process.cdist`.
+"""
+
+import re
+from collections import Counter, defaultdict
+
+from rapidfuzz import fuzz, process, utils
+
+_NON_WORD = re.compile(r"\W+")
+
+DEFAULT_MIN_SCORE = 80.0
+
+
+def _words(text: str) -> list[str]:
+    return _NON_WORD.sub(" ", text.casefold()).split()
+
+
+def _ngrams(words: list[str], size: int) -> set[tuple[str, ...]]:
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+class QuoteLinker:
+    """
+    Finds the sentence which best matches each quote. Build one per transcript, and
+    reuse it for all the quotes from that transcript.
+    """
+
+    def __init__(
+        self,
+        sentences: list[str],
+        ngram_size: int = 2,
+        max_candidates: int | None = 20,
+        min_score: float = DEFAULT_MIN_SCORE,
+    ) -> None:
+        """
+        Args:
+            sentences (list[str]):
+                The transcript sentences, in order.
+            ngram_size (int):
+                The number of words in each indexed n-gram.
+            max_candidates (int | None):
+                The number of sentences sharing the most n-grams with a quote to
+                score it against. If None, every sentence is scored, which gives
+                the same results as comparing every quote with every sentence.
+            min_score (float):
+                The lowest `fuzz.partial_ratio` score, out of 100, to link a quote.
+        """
+        self.sentences = sentences
+        self.ngram_size = ngram_size
+        self.max_candidates = max_candidates
+        self.min_score = min_score
+        self._processed = [utils.default_process(sentence) for sentence in sentences]
+        self._index: defaultdict[tuple[str, ...], list[int]] = defaultdict(list)
+        for i, sentence in enumerate(sentences):
+            for gram in _ngrams(_words(sentence), ngram_size):
+                self._index[gram].append(i)
+
+    def candidates(self, quote: str) -> list[int]:
+        """
+        Returns the sentences which could match a quote, in order.
+        Quotes too short to have an n-gram, or sharing none with the transcript,
+        are checked against every sentence.
+        """
+        if self.max_candidates is None:
+            return list(range(len(self.sentences)))
+        counts: Counter[int] = Counter()
+        for gram in _ngrams(_words(quote), self.ngram_size):
+            counts.update(self._index.get(gram, ()))
+        if not counts:
+            return list(range(len(self.sentences)))
+        starts: set[int] = set()
+        for i, _ in counts.most_common(self.max_candidates):
+            starts.update([i - 1, i] if i else [i])
+        return sorted(starts)
+
+    def link(self, quotes: list[str]) -> list[tuple[int, int, float]]:
+        """
+        Links each quote to the sentence it matches best, the first if several
+        match equally well. A quote spanning sentences is linked to whichever of
+        them matches best, as `link_quotes_and_sentences` does.
+
+        Args:
+            quotes (list[str]):
+                The quotes to link.
+
+        Returns:
+            list[tuple[int, int, float]]:
+                (quote index, sentence index, score) for each quote which scored
+                at least `min_score`, in the same format as
+                `genai_utils.sentence_linking.link_quotes_and_sentences`.
+        """
+        links = []
+        for quote_idx, quote in enumerate(quotes):
+            processed = utils.default_process(quote)
+            if not processed or not self.sentences:
+                continue
+            candidates = self.candidates(quote)
+            scores = process.cdist(
+                [processed],
+                [self._processed[i] for i in candidates],
+                scorer=fuzz.partial_ratio,
+                processor=None,
+                score_cutoff=self.min_score,
+            )[0]
+            best = max(
+                range(len(candidates)), key=lambda k: (scores[k], -candidates[k])
+            )
+            score = float(scores[best])
+            if score < self.min_score:
+                continue
+            links.append((quote_idx, candidates[best], score))
+        return links
@@ -0,0 +1,306 @@
+"""
+A process-wide rate limiter for calls to Gemini, so topic detection, claim
+extraction, JSON repair and PASTEL don't all run into the same quota at once.
+
+Each (model, feature) pair gets a token bucket, which limits the rate of calls,
+and an adaptive concurrency limit. When a call is rejected for exceeding a quota,
+the concurrency limit is halved and the bucket pauses for a while. Each successful
+call then raises the limit slowly back towards its maximum.
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from harmful_claim_finder.utils.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+# The key used for calls which don't name a model
+DEFAULT_MODEL = "default"
+
+THROTTLED = REGISTRY.counter(
+    "harmful_claim_finder_throttled_total",
+    "Number of calls rejected for exceeding a quota.",
+    ["model", "feature"],
+)
+
+# other errors can mention a quota, e.g. for a file too large to upload, so only
+# match the status of a rejected call
+_QUOTA_MESSAGE = re.compile(r"\b429\b|resource[_ ]exhausted", re.IGNORECASE)
+
+
+def is_quota_error(exc: BaseException) -> bool:
+    """
+    Returns True if an exception, or any exception it was raised from, looks like a
+    rejection for exceeding a quota (HTTP 429 / RESOURCE_EXHAUSTED).
+    """
+    seen: set[int] = set()
+    current: BaseException | None = exc
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if getattr(current, "code", None) == 429:
+            return True
+        if getattr(current, "status_code", None) == 429:
+            return True
+        if _QUOTA_MESSAGE.search(str(current)):
+            return True
+        current = current.__cause__ or current.__context__
+    return False
+
+
+def _wake(waiter: "asyncio.Future[None]") -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class _TokenBucket:
+    """
+    Allows `rate` calls per second on average, with bursts of up to `burst` calls.
+    If `rate` is None, calls are only held back while paused.
+    """
+
+    def __init__(self, rate: float | None, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int = 1) -> float:
+        """
+        Takes `tokens` tokens, returning how many seconds to wait before using them.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.rate is None:
+                return self._paused_until - now
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops handing out tokens for `seconds`, and drops any saved up burst.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+
+class _AdaptiveConcurrency:
+    """
+    Limits the number of calls in flight, with a limit which can change while
+    calls are waiting.
+    Waiters are woken with thread-safe callbacks, so one limiter can be shared by
+    event loops in different threads.
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int) -> None:
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self, slots: int = 1) -> int:
+        """
+        Waits for `slots` slots, or every slot if the limit is lower, and returns
+        the number taken, to be passed to `release`.
+        """
+        while True:
+            with self._lock:
+                taken = min(slots, max(int(self.limit), 1))
+                if self.in_flight + taken <= int(self.limit):
+                    self.in_flight += taken
+                    return taken
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    else:
+                        # we were woken, so pass the free slot on
+                        self._wake_waiters()
+                raise
+
+    def release(self, slots: int = 1) -> None:
+        with self._lock:
+            self.in_flight -= slots
+            self._wake_waiters()
+
+    def set_limit(self, limit: float) -> None:
+        with self._lock:
+            self.limit = min(max(limit, self.min_concurrency), self.max_concurrency)
+            self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            try:
+                waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # the waiter's event loop has closed
+                continue
+            free -= 1
+
+
+class AdaptiveRateLimiter:
+    """
+    Limits the rate and concurrency of calls for each (model, feature) pair, backing
+    off when calls are rejected for exceeding a quota.
+
+    Example:
+        ```python
+        async with limiter.slot("gemini-2.5-flash", "run_all_for_article"):
+            response = await call_gemini()
+        ```
+    """
+
+    def __init__(
+        self,
+        requests_per_s: float | None = 10.0,
+        burst: float = 20.0,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        backoff_factor: float = 0.5,
+        cooldown_s: float = 2.0,
+    ) -> None:
+        """
+        Args:
+            requests_per_s (float | None):
+                The average number of calls per second allowed for each key.
+                If None, only the concurrency is limited.
+            burst (float):
+                The number of calls which can be made at once after a quiet period.
+            max_concurrency (int):
+                The most calls allowed in flight for each key.
+            min_concurrency (int):
+                The concurrency limit never backs off below this.
+            backoff_factor (float):
+                The concurrency limit is multiplied by this after a quota error.
+            cooldown_s (float):
+                How long to stop making calls after a quota error. Further quota
+                errors within this time don't reduce the limit again.
+        """
+        self.requests_per_s = requests_per_s
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.backoff_factor = backoff_factor
+        self.cooldown_s = cooldown_s
+        self._buckets: dict[tuple[str, str], _TokenBucket] = {}
+        self._concurrency: dict[tuple[str, str], _AdaptiveConcurrency] = {}
+        self._last_backoff: dict[tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key: tuple[str, str]) -> tuple[_TokenBucket, _AdaptiveConcurrency]:
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = _TokenBucket(self.requests_per_s, self.burst)
+                self._concurrency[key] = _AdaptiveConcurrency(
+                    self.max_concurrency, self.min_concurrency
+                )
+            return self._buckets[key], self._concurrency[key]
+
+    def concurrency_limit(self, model: str, feature: str) -> int:
+        """
+        Returns the current concurrency limit for a key.
+        """
+        return int(self._state((model, feature))[1].limit)
+
+    def _on_success(self, key: tuple[str, str]) -> None:
+        _, concurrency = self._state(key)
+        if concurrency.limit < self.max_concurrency:
+            # additive increase: about one extra slot per limit's worth of successes
+            concurrency.set_limit(concurrency.limit + 1 / concurrency.limit)
+
+    def _on_throttled(self, key: tuple[str, str]) -> None:
+        model, feature = key
+        THROTTLED.inc(model=model, feature=feature)
+        bucket, concurrency = self._state(key)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_backoff.get(key, -self.cooldown_s) < self.cooldown_s:
+                return
+            self._last_backoff[key] = now
+        bucket.pause(self.cooldown_s)
+        concurrency.set_limit(concurrency.limit * self.backoff_factor)
+        _logger.info(
+            f"Quota exceeded for {model} / {feature}, "
+            f"reducing concurrency to {int(concurrency.limit)}."
+        )
+
+    @asynccontextmanager
+    async def slot(
+        self, model: str, feature: str, cost: int = 1
+    ) -> AsyncIterator[None]:
+        """
+        Waits until a call can be made for a key, then holds a slot while the call
+        runs. Quota errors raised by the call are recorded, then re-raised.
+
+        Args:
+            model (str):
+                The model being called.
+            feature (str):
+                The feature label of the call.
+            cost (int):
+                The number of LLM calls made while holding the slot, e.g. one per
+                sentence for a PASTEL batch. Each counts against the rate, and
+                takes a slot of the concurrency limit, up to the whole limit.
+        """
+        key = (model, feature)
+        bucket, concurrency = self._state(key)
+        taken = await concurrency.acquire(cost)
+        try:
+            wait = bucket.reserve(cost)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                yield
+            except Exception as exc:
+                if is_quota_error(exc):
+                    self._on_throttled(key)
+                raise
+            self._on_success(key)
+        finally:
+            concurrency.release(taken)
+
+
+# only backs off on quota errors until limits are set for the quota being used
+_rate_limiter = AdaptiveRateLimiter(requests_per_s=None)
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """
+    Returns the rate limiter shared by every Gemini call in this process. By
+    default, it doesn't limit the rate of calls, but still reduces the concurrency
+    when calls are rejected for exceeding a quota.
+    """
+    return _rate_limiter
+
+
+def set_rate_limiter(limiter: AdaptiveRateLimiter) -> None:
+    """
+    Replaces the shared rate limiter, e.g. to change the limits for a quota.
+    """
+    global _rate_limiter
+    _rate_limiter = limiter
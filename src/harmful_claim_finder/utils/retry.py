@@ -0,0 +1,193 @@
+"""
+Retry policies for the pipeline stages: which errors are worth retrying, how many
+attempts to make, how long to back off between them, and an overall deadline.
+
+Retrying straight away after a rate limit error or an overloaded model usually
+fails again, so attempts are spaced out with exponential backoff. The backoff is
+jittered, so calls which failed together don't all retry together.
+"""
+
+import asyncio
+import dataclasses
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+from tenacity import (
+    AsyncRetrying,
+    RetryCallState,
+    retry_if_exception,
+    stop_after_attempt,
+    stop_before_delay,
+    wait_random_exponential,
+)
+
+from harmful_claim_finder.utils.metrics import RETRIES
+from harmful_claim_finder.utils.models import BudgetExceededError, ParsingError
+from harmful_claim_finder.utils.rate_limit import is_quota_error
+
+_logger = logging.getLogger(__name__)
+
+ResultType = TypeVar("ResultType")
+
+# like quota errors, only match the status of a failed call
+_SERVER_ERROR_MESSAGE = re.compile(
+    r"\b50[0-4]\b|service[_ ]unavailable|deadline[_ ]exceeded|internal[_ ]error",
+    re.IGNORECASE,
+)
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    Returns True if an exception, or any exception it was raised from, looks like a
+    failure which another attempt could get past: a quota error, a server error
+    (HTTP 5xx), a timeout or a dropped connection.
+    """
+    if is_quota_error(exc):
+        return True
+    seen: set[int] = set()
+    current: BaseException | None = exc
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, (TimeoutError, ConnectionError)):
+            return True
+        for status in [
+            getattr(current, "code", None),
+            getattr(current, "status_code", None),
+        ]:
+            if isinstance(status, int) and 500 <= status < 600:
+                return True
+        if _SERVER_ERROR_MESSAGE.search(str(current)):
+            return True
+        current = current.__cause__ or current.__context__
+    return False
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    How a stage is retried when an attempt fails.
+
+    Attributes:
+        max_attempts (int):
+            The number of attempts to make. Ignored if there is a deadline.
+        initial_backoff_s (float):
+            The longest wait before the first retry. The longest wait doubles for
+            each retry after that, and the actual wait is a random time up to it.
+        max_backoff_s (float):
+            The longest wait before any retry.
+        deadline_s (float | None):
+            The total time allowed for every attempt and wait. If set, attempts are
+            made until it passes, rather than `max_attempts` times, and an attempt
+            still running when it passes is cancelled.
+        retry_on (tuple[type[Exception], ...]):
+            Errors which are always worth retrying. By default, the LLM output
+            couldn't be parsed or validated, and another response might be fine.
+        retry_if (Callable[[BaseException], bool]):
+            Decides whether any other error is worth retrying. By default, only
+            errors found by `is_transient_error`. Anything else is raised straight
+            away, as is `BudgetExceededError`, which another attempt can't fix.
+    """
+
+    max_attempts: int = 3
+    initial_backoff_s: float = 0.5
+    max_backoff_s: float = 20.0
+    deadline_s: float | None = None
+    retry_on: tuple[type[Exception], ...] = (ParsingError, ValueError)
+    retry_if: Callable[[BaseException], bool] = is_transient_error
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, BudgetExceededError):
+            return False
+        return isinstance(error, self.retry_on) or self.retry_if(error)
+
+    async def run(
+        self, stage: str, make_call: Callable[[], Awaitable[ResultType]]
+    ) -> ResultType:
+        """
+        Runs `make_call()`, calling it again after a backoff each time it raises a
+        retryable error, until it succeeds or the policy gives up.
+
+        Args:
+            stage (str):
+                The stage being run, used to label the retry metrics and logs.
+            make_call (Callable[[], Awaitable[ResultType]]):
+                Makes one attempt.
+
+        Returns:
+            ResultType: The result of the first successful attempt.
+
+        Raises:
+            Exception:
+                The error from the last attempt, or `TimeoutError` if the deadline
+                passed during it.
+        """
+        start = time.monotonic()
+
+        async def attempt() -> ResultType:
+            if self.deadline_s is None:
+                return await make_call()
+            remaining = self.deadline_s - (time.monotonic() - start)
+            return await asyncio.wait_for(make_call(), max(remaining, 0.0))
+
+        def before_sleep(retry_state: RetryCallState) -> None:
+            RETRIES.inc(stage=stage)
+            assert retry_state.outcome is not None
+            _logger.info(
+                f"Error raised while running {stage}: "
+                f"{repr(retry_state.outcome.exception())}. "
+                f"Retrying in {retry_state.upcoming_sleep:.2f}s."
+            )
+
+        retrying = AsyncRetrying(
+            stop=(
+                stop_after_attempt(self.max_attempts)
+                if self.deadline_s is None
+                else stop_before_delay(self.deadline_s)
+            ),
+            wait=wait_random_exponential(
+                multiplier=self.initial_backoff_s, max=self.max_backoff_s
+            ),
+            retry=retry_if_exception(self.is_retryable),
+            before_sleep=before_sleep,
+            reraise=True,
+        )
+        return await retrying(attempt)
+
+    def with_attempts(self, max_attempts: int) -> "RetryPolicy":
+        """Returns a copy of the policy, making `max_attempts` attempts."""
+        return dataclasses.replace(self, max_attempts=max_attempts)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+_retry_policies: dict[str, RetryPolicy] = {}
+
+
+def get_retry_policy(
+    stage: str, max_attempts: int, default: RetryPolicy = DEFAULT_RETRY_POLICY
+) -> RetryPolicy:
+    """
+    Returns the retry policy set for a stage, or `default`, making `max_attempts`
+    attempts, as asked for by the caller of the stage.
+    """
+    return _retry_policies.get(stage, default).with_attempts(max_attempts)
+
+
+def set_retry_policy(stage: str, policy: RetryPolicy | None) -> None:
+    """
+    Sets the retry policy for every run of a stage in this process, or goes back to
+    the default if `policy` is None. The number of attempts is still set by each
+    call to the stage.
+
+    Example:
+        ```python
+        set_retry_policy("claim_extraction", RetryPolicy(deadline_s=120))
+        ```
+    """
+    if policy is None:
+        _retry_policies.pop(stage, None)
+    else:
+        _retry_policies[stage] = policy
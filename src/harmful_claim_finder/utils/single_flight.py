@@ -0,0 +1,114 @@
+"""
+Coalesces identical concurrent calls, so when the same video is processed several
+times at once, each prompt is only sent to the LLM once.
+"""
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Generic, TypeVar
+
+ResultType = TypeVar("ResultType")
+
+
+class _Flight(Generic[ResultType]):
+    def __init__(self, task: "asyncio.Task[ResultType]") -> None:
+        self.task = task
+        self.waiters = 0
+        self.abandoned = False
+
+
+class SingleFlight(Generic[ResultType]):
+    """
+    Runs at most one call per key at a time. Callers asking for a key which is
+    already in flight wait for the same result, or the same exception.
+
+    The call runs in its own task, so one caller being cancelled doesn't cancel the
+    call for the others. The call is only cancelled if every caller waiting for it
+    is cancelled, and callers arriving after that start a new call.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[
+            tuple[asyncio.AbstractEventLoop, str], _Flight[ResultType]
+        ] = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self) -> int:
+        """
+        Returns the number of calls currently running.
+        """
+        return len(self._flights)
+
+    async def run(
+        self, key: str, make_call: Callable[[], Awaitable[ResultType]]
+    ) -> tuple[ResultType, bool]:
+        """
+        Runs `make_call()`, unless a call with the same key is already running, in
+        which case waits for that call instead.
+
+        Args:
+            key (str):
+                Identifies calls which would give the same result.
+            make_call (Callable[[], Awaitable[ResultType]]):
+                Makes the call. Only used if no call with this key is running.
+
+        Returns:
+            ResultType: The result of the call.
+            bool: True if this caller shared a call which was already running.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        while True:
+            with self._lock:
+                flight = self._flights.get(flight_key)
+                shared = flight is not None
+                if flight is None:
+                    flight = self._start(flight_key, loop, make_call)
+                flight.waiters += 1
+
+            try:
+                return await asyncio.shield(flight.task), shared
+            except asyncio.CancelledError:
+                current = asyncio.current_task()
+                if flight.abandoned and not (current and current.cancelling()):
+                    # every caller before this one was cancelled, taking the call
+                    # with them, but this caller still wants the result
+                    continue
+                if not flight.task.done():
+                    with self._lock:
+                        flight.waiters -= 1
+                        flight.abandoned = flight.waiters == 0
+                        if flight.abandoned and self._flights.get(flight_key) is flight:
+                            # so callers arriving while it's cancelled start a new call
+                            del self._flights[flight_key]
+                    if flight.abandoned:
+                        flight.task.cancel()
+                raise
+
+    def _start(
+        self,
+        flight_key: tuple[asyncio.AbstractEventLoop, str],
+        loop: asyncio.AbstractEventLoop,
+        make_call: Callable[[], Awaitable[ResultType]],
+    ) -> _Flight[ResultType]:
+        flight = _Flight(loop.create_task(_await(make_call)))
+        self._flights[flight_key] = flight
+        flight.task.add_done_callback(lambda _: self._finish(flight_key, flight))
+        return flight
+
+    def _finish(
+        self,
+        flight_key: tuple[asyncio.AbstractEventLoop, str],
+        flight: _Flight[ResultType],
+    ) -> None:
+        with self._lock:
+            if self._flights.get(flight_key) is flight:
+                del self._flights[flight_key]
+        if not flight.task.cancelled():
+            # stop asyncio warning about an exception never retrieved, when every
+            # caller was cancelled before the call failed
+            flight.task.exception()
+
+
+async def _await(make_call: Callable[[], Awaitable[ResultType]]) -> ResultType:
+    return await make_call()
@@ -0,0 +1,31 @@
+"""
+Helpers for streaming results out of concurrent work as soon as they're ready.
+"""
+
+import asyncio
+from typing import AsyncIterator, Awaitable, Iterable, TypeVar
+
+ResultType = TypeVar("ResultType")
+
+
+async def iterate_as_completed(
+    awaitables: Iterable[Awaitable[ResultType]],
+) -> AsyncIterator[ResultType]:
+    """
+    Runs awaitables concurrently, yielding each result as soon as it's ready.
+    If one fails, or the consumer stops iterating early, the rest are cancelled.
+
+    Args:
+        awaitables (Iterable[Awaitable[ResultType]]):
+            The awaitables to run.
+
+    Yields:
+        ResultType: The result of each awaitable, in the order they finish.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
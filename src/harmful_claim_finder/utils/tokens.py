@@ -0,0 +1,23 @@
+"""
+Rough token counting, for sizing prompts without calling the model's tokenizer.
+"""
+
+import math
+
+# Gemini averages about 4 characters per token for English text.
+# Other languages tend to use more tokens, so budgets should leave some headroom.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates how many tokens some text will use in a prompt.
+
+    Args:
+        text (str):
+            The text to estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
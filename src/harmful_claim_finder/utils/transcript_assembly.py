@@ -0,0 +1,128 @@
+"""
+Assembles raw caption fragments, like those in `data/example_transcripts`, into
+sentences.
+
+Caption fragments are partial lines, such as "the greatest perpetrator of", and
+rolling captions often repeat the end of one fragment at the start of the next.
+Treating each fragment as a sentence inflates the number of sentences sent to the
+LLM, and makes it harder to match the LLM's output back to the transcript.
+"""
+
+import re
+from collections import deque
+from typing import Iterable, Iterator
+from uuid import UUID
+
+from harmful_claim_finder.utils.models import TranscriptFragment, TranscriptSentence
+
+_ANNOTATION = re.compile(r"\[[^\]]*\]")
+_WHITESPACE = re.compile(r"\s+")
+_NON_WORD = re.compile(r"\W+")
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*$")
+
+
+def _clean(text: str) -> str:
+    """Removes annotations like "[Music]", and normalises whitespace."""
+    return _WHITESPACE.sub(" ", _ANNOTATION.sub(" ", text)).strip()
+
+
+def _overlap(
+    previous: deque[str], words: list[str], min_words: int, max_words: int
+) -> int:
+    """
+    Returns the number of words at the start of `words` which repeat the end of
+    `previous`. Only the last `max_words` words are compared, so this takes constant
+    time per fragment.
+    """
+    tail = list(previous)
+    for size in range(min(len(tail), len(words), max_words), min_words - 1, -1):
+        if tail[-size:] == words[:size]:
+            return size
+    return 0
+
+
+def assemble_sentences(
+    fragments: Iterable[TranscriptFragment],
+    video_id: UUID,
+    source: str = "captions",
+    max_words: int = 40,
+    max_gap_s: float = 2.0,
+    min_overlap_words: int = 2,
+    max_overlap_words: int = 12,
+) -> Iterator[TranscriptSentence]:
+    """
+    Merges caption fragments into sentences, as a stream.
+    Text repeated between consecutive fragments is only kept once.
+    A sentence ends at sentence-ending punctuation, before a pause of more than
+    `max_gap_s`, or at the end of the first fragment which takes it past `max_words`
+    words, as automatic captions often have no punctuation.
+    Start times are interpolated within each fragment by word position.
+
+    Fragments are processed one at a time in constant time, so this can be used
+    on very long transcripts, or on fragments as they arrive.
+
+    Args:
+        fragments (Iterable[TranscriptFragment]):
+            The caption fragments, in order.
+        video_id (UUID):
+            The id of the video the captions are from.
+        source (str):
+            The source of the captions, stored on each sentence.
+        max_words (int):
+            The number of words after which a sentence with no punctuation is ended.
+        max_gap_s (float):
+            A silence longer than this between fragments ends a sentence.
+        min_overlap_words (int):
+            The fewest repeated words treated as overlapping caption text, so a
+            word genuinely said twice, like "that that", is kept.
+        max_overlap_words (int):
+            The most repeated words to look for between fragments.
+
+    Yields:
+        TranscriptSentence:
+            Each sentence, with its end time in `metadata["end_time_s"]`.
+    """
+    words: list[str] = []
+    start_time_s = 0.0
+    end_time_s = 0.0
+    previous_end_s: float | None = None
+    recent: deque[str] = deque(maxlen=max_overlap_words)
+
+    def flush() -> TranscriptSentence:
+        sentence = TranscriptSentence(
+            video_id=video_id,
+            source=source,
+            text=" ".join(words),
+            start_time_s=start_time_s,
+            metadata={"end_time_s": end_time_s},
+        )
+        words.clear()
+        return sentence
+
+    for fragment in fragments:
+        fragment_words = _clean(fragment["text"]).split()
+        start = float(fragment["start"])
+        duration = float(fragment.get("duration", 0.0))
+        if not fragment_words:
+            continue
+        if words and previous_end_s is not None and start - previous_end_s > max_gap_s:
+            yield flush()
+        previous_end_s = start + duration
+
+        normalised = [_NON_WORD.sub("", word.casefold()) for word in fragment_words]
+        skip = _overlap(recent, normalised, min_overlap_words, max_overlap_words)
+        word_duration = duration / len(fragment_words)
+        for i in range(skip, len(fragment_words)):
+            word_start = start + i * word_duration
+            if not words:
+                start_time_s = word_start
+            words.append(fragment_words[i])
+            recent.append(normalised[i])
+            end_time_s = word_start + word_duration
+            if _SENTENCE_END.search(fragment_words[i]):
+                yield flush()
+        if len(words) >= max_words:
+            yield flush()
+
+    if words:
+        yield flush()
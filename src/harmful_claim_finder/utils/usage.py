@@ -0,0 +1,192 @@
+"""
+Accounting for the LLM tokens used by the pipelines, grouped by the "feature" label
+of each call, with optional budgets.
+
+Calls are recorded in every ledger made active with `track_usage`. Ledgers are held
+in a context variable, so they follow a video through any tasks it starts.
+`genai_utils` only returns the response text, so token counts are estimated from
+the length of the prompt, system instruction and response. Prompt tokens read from
+a context cache are counted separately, as they are billed at a discount.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator
+
+from harmful_claim_finder.utils.metrics import REGISTRY
+from harmful_claim_finder.utils.models import (
+    BudgetExceededError,
+    TokenCount,
+    TokenUsage,
+)
+
+TOKENS = REGISTRY.counter(
+    "harmful_claim_finder_llm_tokens_total",
+    "Estimated number of LLM tokens used, by feature and direction.",
+    ["feature", "direction"],
+)
+
+
+@dataclass(frozen=True)
+class TokenPrices:
+    """
+    Prices used to estimate spend, in US dollars per million tokens.
+    """
+
+    prompt_per_million_usd: float = 0.30
+    output_per_million_usd: float = 2.50
+    cached_per_million_usd: float = 0.075
+
+    def cost(
+        self, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0
+    ) -> float:
+        return (
+            prompt_tokens * self.prompt_per_million_usd
+            + output_tokens * self.output_per_million_usd
+            + cached_tokens * self.cached_per_million_usd
+        ) / 1e6
+
+
+DEFAULT_PRICES = TokenPrices()
+
+
+class UsageLedger:
+    """
+    Totals the tokens used by LLM calls, such as those for one video or one batch.
+    If it has a budget, further calls are refused once the budget is used up.
+    """
+
+    def __init__(
+        self,
+        budget_tokens: int | None = None,
+        name: str = "",
+        prices: TokenPrices = DEFAULT_PRICES,
+    ) -> None:
+        """
+        Args:
+            budget_tokens (int | None):
+                The number of prompt, cached and output tokens allowed. No limit if
+                not given.
+            name (str):
+                Describes what the ledger is for, e.g. a video id, in error messages.
+            prices (TokenPrices):
+                Prices used to estimate spend.
+        """
+        self.budget_tokens = budget_tokens
+        self.name = name
+        self.prices = prices
+        self._by_feature: dict[str, TokenCount] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens(self) -> int:
+        with self._lock:
+            return sum(
+                count.prompt_tokens + count.output_tokens + count.cached_tokens
+                for count in self._by_feature.values()
+            )
+
+    def record(
+        self,
+        feature: str,
+        prompt_tokens: int,
+        output_tokens: int,
+        cached_tokens: int = 0,
+    ) -> None:
+        """
+        Adds one call to the totals for a feature.
+        """
+        with self._lock:
+            count = self._by_feature.setdefault(feature, TokenCount())
+            count.calls += 1
+            count.prompt_tokens += prompt_tokens
+            count.output_tokens += output_tokens
+            count.cached_tokens += cached_tokens
+
+    def check_budget(self) -> None:
+        """
+        Raises:
+            BudgetExceededError: If the budget has been used up.
+        """
+        if self.budget_tokens is not None and self.total_tokens >= self.budget_tokens:
+            raise BudgetExceededError(
+                f"Token budget of {self.budget_tokens} used up"
+                + (f" for {self.name}." if self.name else ".")
+            )
+
+    def summary(self) -> TokenUsage:
+        """
+        Returns the totals so far, overall and for each feature.
+        """
+        with self._lock:
+            by_feature = {
+                feature: count.model_copy()
+                for feature, count in sorted(self._by_feature.items())
+            }
+        prompt_tokens = sum(count.prompt_tokens for count in by_feature.values())
+        output_tokens = sum(count.output_tokens for count in by_feature.values())
+        cached_tokens = sum(count.cached_tokens for count in by_feature.values())
+        return TokenUsage(
+            calls=sum(count.calls for count in by_feature.values()),
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            cached_tokens=cached_tokens,
+            cost_usd=self.prices.cost(prompt_tokens, output_tokens, cached_tokens),
+            by_feature=by_feature,
+        )
+
+
+_active_ledgers: ContextVar[tuple[UsageLedger, ...]] = ContextVar(
+    "active_ledgers", default=()
+)
+
+
+@contextmanager
+def track_usage(ledger: UsageLedger | None) -> Iterator[UsageLedger | None]:
+    """
+    Records the LLM calls made inside the block, including in tasks started inside
+    it, in `ledger`, as well as any ledgers already active.
+    Does nothing if `ledger` is None.
+
+    Example:
+        ```python
+        with track_usage(UsageLedger(budget_tokens=50_000)) as ledger:
+            claims = await get_claims(keywords, sentences)
+        print(ledger.summary())
+        ```
+    """
+    if ledger is None:
+        yield None
+        return
+    token = _active_ledgers.set((*_active_ledgers.get(), ledger))
+    try:
+        yield ledger
+    finally:
+        _active_ledgers.reset(token)
+
+
+def check_budgets() -> None:
+    """
+    Checks the budgets of every active ledger, before an LLM call.
+
+    Raises:
+        BudgetExceededError: If any active budget has been used up.
+    """
+    for ledger in _active_ledgers.get():
+        ledger.check_budget()
+
+
+def record_usage(
+    feature: str, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0
+) -> None:
+    """
+    Records an LLM call in the metrics and every active ledger.
+    """
+    TOKENS.inc(prompt_tokens, feature=feature, direction="prompt")
+    TOKENS.inc(output_tokens, feature=feature, direction="output")
+    if cached_tokens:
+        TOKENS.inc(cached_tokens, feature=feature, direction="cached")
+    for ledger in _active_ledgers.get():
+        ledger.record(feature, prompt_tokens, output_tokens, cached_tokens)
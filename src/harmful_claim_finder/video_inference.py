@@ -2,17 +2,29 @@
 Code for extracting claims from a provided short form video
 """
 
+from typing import AsyncIterator
 from uuid import UUID
 
 from harmful_claim_finder.claim_extraction import extract_claims_from_video
-from harmful_claim_finder.pastel_inference import CheckworthyClaimDetector
+from harmful_claim_finder.pastel_inference import (
+    CheckworthyClaimDetector,
+    get_checkworthy_detector,
+    score_claims,
+)
 from harmful_claim_finder.utils.models import VideoClaims
+from harmful_claim_finder.utils.streaming import iterate_as_completed
+from harmful_claim_finder.utils.usage import UsageLedger, track_usage
+
+DEFAULT_PASTEL_BATCH_SIZE = 5
 
 
 async def get_claims(
     video_id: UUID,
     video_uri: str,
     keywords: dict[str, list[str]],
+    checkworthy_model: CheckworthyClaimDetector | None = None,
+    cache_scope: str | None = None,
+    usage: UsageLedger | None = None,
 ) -> list[VideoClaims]:
     """
     Retrieve claims from a video directly.
@@ -31,22 +43,82 @@ async def get_claims(
                 "health": ["doctor", "hospital"],
             }
             ```
+        checkworthy_model (CheckworthyClaimDetector | None):
+            The detector used to score claims.
+            Defaults to the shared detector from `get_checkworthy_detector`.
+        cache_scope (str | None):
+            Identifies who the keywords are for, e.g. an organisation and
+            language. If context caching is turned on, prompts cached with older
+            keywords for the same scope are deleted.
+        usage (UsageLedger | None):
+            If given, the estimated LLM tokens used are recorded here, e.g. to
+            report the spend with `usage.summary()`, and its budget applies.
 
     Returns:
         list[VideoClaims]:
             A list of claims, marked up with scores.
+
+    Raises:
+        ClaimExtractionError:
+            If claim extraction fails on every attempt.
+        PastelError:
+            If PASTEL fails on every attempt.
+        BudgetExceededError:
+            If the budget of `usage`, or of another active ledger, has been used up.
+    """
+    with track_usage(usage):
+        claims: list[VideoClaims] = await extract_claims_from_video(
+            video_id, video_uri, keywords, cache_scope=cache_scope
+        )
+        pastel = checkworthy_model or get_checkworthy_detector()
+        return await score_claims(pastel, claims, "video_inference")
+
+
+async def stream_claims(
+    video_id: UUID,
+    video_uri: str,
+    keywords: dict[str, list[str]],
+    checkworthy_model: CheckworthyClaimDetector | None = None,
+    pastel_batch_size: int = DEFAULT_PASTEL_BATCH_SIZE,
+    cache_scope: str | None = None,
+) -> AsyncIterator[VideoClaims]:
+    """
+    Like `get_claims`, but yields claims as soon as they're scored.
+    Claims are extracted from the whole video at once, then scored by PASTEL in
+    concurrent batches of `pastel_batch_size`. The claims in each batch are yielded
+    as soon as that batch has been scored, so they may not be in video order.
+
+    Args:
+        video_id (UUID):
+            The id of the video being processed.
+        video_uri (str):
+            A URI to a video in a Google Cloud Bucket.
+            The file should be an mp4.
+        keywords (dict[str, list[str]]):
+            A {topic: keywords} dictionary containing the kw for each topic.
+        checkworthy_model (CheckworthyClaimDetector | None):
+            The detector used to score claims.
+            Defaults to the shared detector from `get_checkworthy_detector`.
+        pastel_batch_size (int):
+            The number of claims to score in each PASTEL call.
+        cache_scope (str | None):
+            Identifies who the keywords are for, e.g. an organisation and
+            language. If context caching is turned on, prompts cached with older
+            keywords for the same scope are deleted.
+
+    Yields:
+        VideoClaims: Each claim, marked up with scores.
     """
     claims: list[VideoClaims] = await extract_claims_from_video(
-        video_id, video_uri, keywords
+        video_id, video_uri, keywords, cache_scope=cache_scope
     )
-    pastel = CheckworthyClaimDetector()
-    claims_text = [claim.claim for claim in claims]
-    scores_and_answers = await pastel.score_sentences(claims_text, max_attempts=2)
-
-    for claim in claims:
-        claim.metadata = {
-            **claim.metadata,
-            "score": scores_and_answers[claim.claim].score,
-            "answers": scores_and_answers[claim.claim].answers,
-        }
-    return claims
+    pastel = checkworthy_model or get_checkworthy_detector()
+    batches = [
+        claims[start : start + pastel_batch_size]
+        for start in range(0, len(claims), pastel_batch_size)
+    ]
+    async for scored_claims in iterate_as_completed(
+        score_claims(pastel, batch, "video_inference") for batch in batches
+    ):
+        for claim in scored_claims:
+            yield claim
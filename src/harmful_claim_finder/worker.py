@@ -0,0 +1,372 @@
+"""
+Runs the transcript pipeline in several worker processes, each with its own event
+loop, taking videos from a local job queue.
+
+The parsing and linking work around each LLM call fills one core long before the
+API limits are reached, so one event loop can't use the whole quota. Each worker
+claims a video from the queue only when it has room to start it, and gets an equal
+share of the rate limits. Claims are written to a `JobJournal`, so a stopped batch
+can be restarted without repeating finished work.
+
+Usage:
+    python -m harmful_claim_finder.worker enqueue --queue jobs.db \\
+        data/example_transcripts/*.json
+    python -m harmful_claim_finder.worker run --queue jobs.db --journal claims.db \\
+        --batch my-batch --keywords keywords.json --processes 4
+    python -m harmful_claim_finder.worker export --journal claims.db \\
+        --batch my-batch > claims.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.synchronize
+import signal
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Iterable, Iterator
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+from harmful_claim_finder.transcript_inference import TranscriptJob, get_claims_batch
+from harmful_claim_finder.utils.job_queue import SQLiteJobQueue
+from harmful_claim_finder.utils.journal import JobJournal
+from harmful_claim_finder.utils.models import TranscriptSentence
+from harmful_claim_finder.utils.rate_limit import AdaptiveRateLimiter, set_rate_limiter
+from harmful_claim_finder.utils.transcript_assembly import assemble_sentences
+
+_logger = logging.getLogger(__name__)
+
+StopEvent = threading.Event | multiprocessing.synchronize.Event
+
+
+@dataclass(frozen=True)
+class WorkerConfig:
+    """
+    Settings for the worker processes. These are sent to each new process, so
+    must be picklable.
+
+    Attributes:
+        queue_path (str):
+            The SQLite job queue to take videos from.
+        journal_path (str):
+            The SQLite journal to write the claims for each video to.
+        batch (str):
+            The name of the batch in the journal.
+        keywords (dict[str, list[str]]):
+            A {topic: keywords} dictionary containing the kw for each topic.
+        processes (int):
+            The number of worker processes.
+        max_videos_in_flight (int):
+            The most videos each worker processes at once.
+        topic_concurrency (int):
+            The most videos in topic detection at once in each worker.
+        pastel_concurrency (int):
+            The most videos being scored by PASTEL at once in each worker.
+        requests_per_s (float):
+            The rate limit for each model and feature, shared by all the workers.
+        burst (float):
+            The burst allowed for each model and feature, shared by all the workers.
+        max_concurrency (int):
+            The most calls in flight for each model and feature, shared by all the
+            workers.
+        max_attempts (int):
+            The most times a video can be claimed. A video whose worker crashed
+            after this many claims is failed rather than put back in the queue.
+        wait_for_jobs (bool):
+            If True, workers wait for more jobs when the queue is empty, until
+            stopped. Otherwise they stop once the queue is empty.
+        poll_interval_s (float):
+            How often to check an empty queue for jobs, if waiting for them.
+        pack_topic_tokens (int | None):
+            If given, each worker packs the transcripts of videos in topic
+            detection at the same time into shared prompts of about this many
+            tokens. See `get_claims_batch`.
+    """
+
+    queue_path: str
+    journal_path: str
+    batch: str
+    keywords: dict[str, list[str]]
+    processes: int = 1
+    max_videos_in_flight: int = 8
+    topic_concurrency: int = 4
+    pastel_concurrency: int = 4
+    requests_per_s: float = 10.0
+    burst: float = 20.0
+    max_concurrency: int = 32
+    max_attempts: int = 3
+    wait_for_jobs: bool = False
+    poll_interval_s: float = 1.0
+    pack_topic_tokens: int | None = None
+
+    def rate_limiter(self) -> AdaptiveRateLimiter:
+        """
+        Returns a rate limiter with one worker's share of the limits.
+        """
+        return AdaptiveRateLimiter(
+            requests_per_s=self.requests_per_s / self.processes,
+            burst=max(self.burst / self.processes, 1.0),
+            max_concurrency=max(self.max_concurrency // self.processes, 1),
+        )
+
+
+def encode_job(video_id: UUID, sentences: list[TranscriptSentence]) -> str:
+    """Serialises a transcript job so it can be stored in a job queue."""
+    return json.dumps(
+        {
+            "video_id": str(video_id),
+            "sentences": [sentence.model_dump(mode="json") for sentence in sentences],
+        },
+        ensure_ascii=False,
+    )
+
+
+def decode_job(payload: str) -> TranscriptJob:
+    """Deserialises a transcript job stored by `encode_job`."""
+    decoded = json.loads(payload)
+    return UUID(decoded["video_id"]), [
+        TranscriptSentence.model_validate(sentence) for sentence in decoded["sentences"]
+    ]
+
+
+def enqueue_transcripts(queue: SQLiteJobQueue, jobs: Iterable[TranscriptJob]) -> int:
+    """
+    Adds transcript jobs to a queue, waiting while it's full. Videos already in the
+    queue are skipped.
+
+    Returns:
+        int: The number of jobs added.
+    """
+    return sum(
+        queue.put(str(video_id), encode_job(video_id, sentences))
+        for video_id, sentences in jobs
+    )
+
+
+async def run_worker(config: WorkerConfig, name: str, stop: StopEvent) -> int:
+    """
+    Takes videos from the queue and finds their claims, until the queue is empty
+    or `stop` is set. Once stopped, no more videos are claimed, and the videos
+    already claimed are finished.
+
+    Args:
+        config (WorkerConfig):
+            The worker settings.
+        name (str):
+            The name of the worker, recorded against the jobs it claims.
+        stop (StopEvent):
+            Set to stop the worker.
+
+    Returns:
+        int: The number of videos finished.
+    """
+    queue = SQLiteJobQueue(config.queue_path, max_attempts=config.max_attempts)
+    journal = JobJournal(config.journal_path, config.batch)
+
+    async def claim_jobs() -> AsyncIterator[TranscriptJob]:
+        while not stop.is_set():
+            # claiming waits for the queue's write lock, so keep it off the loop
+            claimed = await asyncio.to_thread(queue.claim, name)
+            if claimed is None:
+                return
+            yield decode_job(claimed[1])
+
+    finished = 0
+    while not stop.is_set():
+        async for result in get_claims_batch(
+            config.keywords,
+            claim_jobs(),
+            topic_concurrency=config.topic_concurrency,
+            pastel_concurrency=config.pastel_concurrency,
+            max_videos_in_flight=config.max_videos_in_flight,
+            journal=journal,
+            pack_topic_tokens=config.pack_topic_tokens,
+        ):
+            if result.error is None:
+                await asyncio.to_thread(queue.complete, str(result.video_id))
+            else:
+                await asyncio.to_thread(queue.fail, str(result.video_id), result.error)
+            finished += 1
+        if not config.wait_for_jobs:
+            break
+        await asyncio.sleep(config.poll_interval_s)
+    _logger.info(f"{name} finished {finished} videos.")
+    return finished
+
+
+def _worker_main(config: WorkerConfig, name: str, stop: StopEvent) -> None:
+    # the supervisor handles ctrl-c, and tells the workers when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    set_rate_limiter(config.rate_limiter())
+    asyncio.run(run_worker(config, name, stop))
+
+
+def run_workers(config: WorkerConfig, max_restarts: int = 10) -> dict[str, int]:
+    """
+    Runs `config.processes` worker processes until the queue is empty, or until
+    SIGINT or SIGTERM, when the workers stop claiming videos and finish those they
+    have. Workers which crash are restarted, and their videos put back in the
+    queue, unless a video has been claimed `config.max_attempts` times, when it
+    is failed, so one video which keeps crashing workers can't use up the restarts.
+
+    Args:
+        config (WorkerConfig):
+            The worker settings.
+        max_restarts (int):
+            The most times to restart crashed workers, in total.
+
+    Returns:
+        dict[str, int]: The number of jobs in the queue with each status.
+    """
+    queue = SQLiteJobQueue(config.queue_path, max_attempts=config.max_attempts)
+    # no workers are running, so claimed jobs were left by a run which was killed
+    if released := queue.release_claimed():
+        _logger.info(f"Put {released} unfinished jobs back in the queue.")
+
+    # workers start from a fresh interpreter, rather than a fork of this one and
+    # any threads it has
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+
+    def start(name: str) -> multiprocessing.process.BaseProcess:
+        process = context.Process(
+            target=_worker_main, args=(config, name, stop), name=name
+        )
+        process.start()
+        return process
+
+    previous_handlers = {
+        sig: signal.signal(sig, lambda *_: stop.set())
+        for sig in (signal.SIGINT, signal.SIGTERM)
+    }
+    workers = [start(f"worker-{i}") for i in range(config.processes)]
+    restarts = 0
+    try:
+        while workers:
+            multiprocessing.connection.wait(
+                [process.sentinel for process in workers], timeout=1.0
+            )
+            for process in [process for process in workers if not process.is_alive()]:
+                workers.remove(process)
+                if process.exitcode == 0:
+                    continue
+                released = queue.release_claimed(process.name)
+                _logger.warning(
+                    f"{process.name} exited with code {process.exitcode}, "
+                    f"so its {released} unfinished jobs were put back in the queue, "
+                    "and any claimed too many times were failed."
+                )
+                if not stop.is_set() and restarts < max_restarts:
+                    restarts += 1
+                    workers.append(start(str(process.name)))
+    finally:
+        stop.set()
+        for process in workers:
+            process.join()
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+    return queue.counts()
+
+
+def _enqueue(args: argparse.Namespace) -> None:
+    queue = SQLiteJobQueue(args.queue, max_pending=args.max_pending)
+
+    def jobs() -> Iterator[TranscriptJob]:
+        for path in args.transcripts:
+            # the same file always gets the same id, so it's only queued once
+            video_id = uuid5(NAMESPACE_URL, Path(path).stem)
+            fragments = json.loads(Path(path).read_text())
+            yield video_id, list(assemble_sentences(fragments, video_id))
+
+    added = enqueue_transcripts(queue, jobs())
+    print(f"Added {added} of {len(args.transcripts)} transcripts to the queue.")
+
+
+def _run(args: argparse.Namespace) -> None:
+    config = WorkerConfig(
+        queue_path=args.queue,
+        journal_path=args.journal,
+        batch=args.batch,
+        keywords=json.loads(Path(args.keywords).read_text()),
+        processes=args.processes,
+        max_videos_in_flight=args.max_videos_in_flight,
+        requests_per_s=args.requests_per_s,
+        max_concurrency=args.max_concurrency,
+        max_attempts=args.max_attempts,
+        wait_for_jobs=args.wait,
+        pack_topic_tokens=args.pack_topic_tokens,
+    )
+    counts = run_workers(config)
+    print(json.dumps(counts))
+
+
+def _retry(args: argparse.Namespace) -> None:
+    queue = SQLiteJobQueue(args.queue)
+    print(f"Put {queue.retry_failed()} failed transcripts back in the queue.")
+
+
+def _export(args: argparse.Namespace) -> None:
+    journal = JobJournal(args.journal, args.batch)
+    for _, result in journal.outputs("claims"):
+        print(result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(required=True)
+
+    enqueue = subparsers.add_parser("enqueue", help="Add caption files to the queue.")
+    enqueue.add_argument("--queue", required=True)
+    enqueue.add_argument("--max-pending", type=int, default=None)
+    enqueue.add_argument("transcripts", nargs="+")
+    enqueue.set_defaults(command=_enqueue)
+
+    run = subparsers.add_parser("run", help="Run workers until the queue is empty.")
+    run.add_argument("--queue", required=True)
+    run.add_argument("--journal", required=True)
+    run.add_argument("--batch", required=True)
+    run.add_argument("--keywords", required=True, help="A {topic: keywords} file.")
+    run.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    run.add_argument("--max-videos-in-flight", type=int, default=8)
+    run.add_argument("--requests-per-s", type=float, default=10.0)
+    run.add_argument("--max-concurrency", type=int, default=32)
+    run.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="Fail videos claimed this many times by workers which crashed.",
+    )
+    run.add_argument(
+        "--wait", action="store_true", help="Wait for more jobs until stopped."
+    )
+    run.add_argument(
+        "--pack-topic-tokens",
+        type=int,
+        default=None,
+        help="Pack transcripts into shared topic prompts of about this many tokens.",
+    )
+    run.set_defaults(command=_run)
+
+    retry = subparsers.add_parser(
+        "retry", help="Put failed videos back in the queue, with all their attempts."
+    )
+    retry.add_argument("--queue", required=True)
+    retry.set_defaults(command=_retry)
+
+    export = subparsers.add_parser("export", help="Print the claims as JSON lines.")
+    export.add_argument("--journal", required=True)
+    export.add_argument("--batch", required=True)
+    export.set_defaults(command=_export)
+
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+    args.command(args)
+
+
+if __name__ == "__main__":
+    main()
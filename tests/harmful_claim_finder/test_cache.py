@@ -0,0 +1,93 @@
+import threading
+import time
+
+from harmful_claim_finder.utils.cache import (
+    LRUCache,
+    SQLiteCache,
+    TieredCache,
+    normalise_sentence,
+)
+
+
+def test_normalise_sentence():
+    assert normalise_sentence("  The  NHS\tis\nbroken ") == "the nhs is broken"
+
+
+def test_lru_eviction():
+    cache: LRUCache[int] = LRUCache(max_entries=2)
+    cache.set_many({"a": 1, "b": 2})
+    assert cache.get_many(["a"]) == {"a": 1}
+    cache.set_many({"c": 3})
+    assert cache.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+
+
+def test_sqlite_ttl(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.db", "test", ttl_s=0.05)
+    cache.set_many({"a": "1"})
+    assert cache.get_many(["a"]) == {"a": "1"}
+    time.sleep(0.1)
+    assert cache.get_many(["a"]) == {}
+
+
+def test_sqlite_size_eviction(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.db", "test", max_entries=2)
+    cache.set_many({"a": "1"})
+    cache.set_many({"b": "2"})
+    cache.get_many(["a"])
+    cache.set_many({"c": "3"})
+    assert cache.get_many(["a", "b", "c"]) == {"a": "1", "c": "3"}
+
+
+def test_sqlite_counts_only_when_full(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.db", "test", max_entries=3)
+    cache.set_many({"a": "1"})
+    statements: list[str] = []
+    cache._connection.set_trace_callback(statements.append)
+    cache.set_many({"b": "2"})
+    cache.set_many({"c": "3"})
+    assert not any("COUNT" in statement for statement in statements)
+
+    cache.set_many({"d": "4"})
+    assert any("COUNT" in statement for statement in statements)
+    assert cache.get_many(["a", "b", "c", "d"]) == {"b": "2", "c": "3", "d": "4"}
+
+
+def test_sqlite_namespaces(tmp_path):
+    first = SQLiteCache(tmp_path / "cache.db", "first")
+    second = SQLiteCache(tmp_path / "cache.db", "second")
+    first.set_many({"a": "1"})
+    assert second.get_many(["a"]) == {}
+
+
+def test_tiered_cache_persists(tmp_path):
+    cache: TieredCache[list[str]] = TieredCache(
+        disk=SQLiteCache(tmp_path / "cache.db", "topics")
+    )
+    cache.set_many({"a": ["1", "2"]})
+
+    reopened: TieredCache[list[str]] = TieredCache(
+        disk=SQLiteCache(tmp_path / "cache.db", "topics")
+    )
+    assert reopened.get_many(["a", "b"]) == {"a": ["1", "2"]}
+    assert reopened.memory.get_many(["a"]) == {"a": ["1", "2"]}
+
+
+async def test_tiered_cache_disk_off_event_loop(tmp_path):
+    disk = SQLiteCache(tmp_path / "cache.db", "topics")
+    threads = []
+    for name in ["get_many", "set_many"]:
+        method = getattr(disk, name)
+
+        def record_thread(*args, method=method):
+            threads.append(threading.current_thread())
+            return method(*args)
+
+        setattr(disk, name, record_thread)
+    cache: TieredCache[list[str]] = TieredCache(disk=disk)
+
+    await cache.set_many_async({"a": ["1"]})
+    cache.memory.clear()
+    assert await cache.get_many_async(["a", "b"]) == {"a": ["1"]}
+
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
@@ -0,0 +1,42 @@
+from pytest import mark, param, raises
+
+from harmful_claim_finder.utils.chunking import chunk_by_tokens, gather_successes
+
+# each of these is 10 tokens long
+items = [f"{i}" * 40 for i in range(10)]
+
+
+@mark.parametrize(
+    "max_tokens,overlap_tokens,expected",
+    [
+        param(1000, 0, [list(range(10))], id="one chunk"),
+        param(35, 0, [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]], id="no overlap"),
+        param(
+            35, 15, [[0, 1, 2], [2, 3, 4], [4, 5, 6], [6, 7, 8], [8, 9]], id="overlap"
+        ),
+        param(5, 15, [[i] for i in range(10)], id="items bigger than chunk"),
+    ],
+)
+def test_chunk_by_tokens(max_tokens, overlap_tokens, expected):
+    chunks = chunk_by_tokens(
+        list(range(10)), lambda i: items[i], max_tokens, overlap_tokens
+    )
+    assert chunks == expected
+
+
+def test_chunk_empty():
+    assert chunk_by_tokens([], str, 10) == []
+
+
+async def test_gather_successes():
+    async def succeed(i: int) -> int:
+        return i
+
+    async def fail() -> int:
+        raise ValueError("failed")
+
+    results, errors = await gather_successes([succeed(1), fail(), succeed(2)])
+    assert results == [1, 2]
+    assert len(errors) == 1
+    with raises(ValueError):
+        raise errors[0]
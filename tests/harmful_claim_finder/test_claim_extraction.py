@@ -113,6 +113,29 @@ async def test_text_extraction(mock_run_prompt):
     assert claims == expected
 
 
+@patch("harmful_claim_finder.claim_extraction.run_prompt_async", return_value="[]")
+async def test_cache_scope_kept_across_keyword_changes(mock_run_prompt):
+    transcript = [
+        TranscriptSentence(video_id=fake_id, source="", text="a", start_time_s=0)
+    ]
+    for keywords in [{"health": ["doctor"]}, {"health": ["nurse"]}]:
+        await extract_claims_from_transcript(
+            transcript, keywords, cache_scope="fullfact/en"
+        )
+    await extract_claims_from_video(
+        fake_id,
+        "gs://bucket/video.mp4",
+        {"health": ["nurse"]},
+        cache_scope="fullfact/en",
+    )
+
+    scopes = [call.kwargs["cache_scope"] for call in mock_run_prompt.call_args_list]
+    # new keywords replace the old prefix, but the video prompt is cached apart
+    assert scopes[0] == scopes[1]
+    assert scopes[0].startswith("fullfact/en/")
+    assert scopes[2].startswith("fullfact/en/") and scopes[2] != scopes[0]
+
+
 @patch("harmful_claim_finder.claim_extraction.run_prompt_async")
 async def test_video_extraction(mock_run_prompt):
     dummy_claims = [
@@ -343,3 +366,200 @@ async def test_video_retries(mock_run_prompt):
         assert True
 
     assert mock_run_prompt.call_count == 6
+
+
+def make_video_claims(count: int) -> list[dict]:
+    return [
+        {
+            "language": "English",
+            "claim": f"claim {i}",
+            "original_text": f"quote {i}",
+            "timestamp": i,
+            "duration": 1,
+            "topics": ["topic"],
+            "claim_type": "SPOKEN",
+            "reasoning": None,
+        }
+        for i in range(count)
+    ]
+
+
+@patch("harmful_claim_finder.claim_extraction.run_prompt_async")
+async def test_truncated_video_output_repaired_locally(mock_run_prompt):
+    kw = {"topic": ["keyword"]}
+    mock_run_prompt.return_value = json.dumps(make_video_claims(3))[:-40]
+    claims = await _get_video_claims(fake_id, "video_uri", kw)
+
+    assert mock_run_prompt.call_count == 1
+    assert [claim.claim for claim in claims] == ["claim 0", "claim 1"]
+
+
+@patch("harmful_claim_finder.claim_extraction.run_prompt_async")
+async def test_invalid_video_claims_skipped(mock_run_prompt):
+    dummy_claims = make_video_claims(3)
+    del dummy_claims[1]["duration"]
+    mock_run_prompt.return_value = json.dumps(dummy_claims)
+    claims = await extract_claims_from_video(fake_id, "video_uri", {"topic": []})
+
+    assert mock_run_prompt.call_count == 1
+    assert [claim.claim for claim in claims] == ["claim 0", "claim 2"]
+
+
+@patch("harmful_claim_finder.claim_extraction.run_prompt_async")
+async def test_incomplete_video_claims_fixed_without_rerunning_video(
+    mock_run_prompt,
+):
+    broken_claims = make_video_claims(3)
+    for claim in broken_claims[1:]:
+        claim["timestamp"] = "near the end"
+    mock_run_prompt.side_effect = [
+        json.dumps(broken_claims),
+        json.dumps(make_video_claims(3)),
+    ]
+    claims = await extract_claims_from_video(
+        fake_id, "video_uri", {"topic": []}, min_completeness=0.5
+    )
+
+    assert len(claims) == 3
+    features = [call.kwargs["labels"]["feature"] for call in mock_run_prompt.mock_calls]
+    assert features == ["get_video_claims", "get_video_claims/fix_json"]
+
+
+@patch("harmful_claim_finder.claim_extraction.run_prompt_async")
+async def test_valid_video_claims_kept_if_fix_fails(mock_run_prompt):
+    broken_claims = make_video_claims(3)
+    for claim in broken_claims[1:]:
+        claim["timestamp"] = "near the end"
+    mock_run_prompt.return_value = json.dumps(broken_claims)
+    claims = await extract_claims_from_video(fake_id, "video_uri", {"topic": []})
+
+    assert mock_run_prompt.call_count == 2
+    assert [claim.claim for claim in claims] == ["claim 0"]
+
+
+@patch("harmful_claim_finder.claim_extraction.run_prompt_async")
+async def test_chunked_transcript_extraction(mock_run_prompt):
+    transcript = [
+        TranscriptSentence(
+            video_id=fake_id,
+            source="",
+            text=f"sentence number {i} of a long transcript",
+            start_time_s=i * 10,
+        )
+        for i in range(6)
+    ]
+
+    async def fake_extraction(prompt, **kwargs):
+        if "sentence number 5" in prompt:
+            raise ValueError("Gemini failed")
+        # each chunk finds a claim in every even numbered sentence it contains
+        quotes = [s.text for s in transcript[::2] if s.text in prompt]
+        return json.dumps(
+            [
+                {
+                    "language": "English",
+                    "claim": f"claim about {quote}",
+                    "original_text": quote,
+                    "topics": ["topic"],
+                }
+                for quote in quotes
+            ]
+        )
+
+    mock_run_prompt.side_effect = fake_extraction
+    claims = await extract_claims_from_transcript(
+        transcript, {"topic": ["keyword"]}, max_chunk_tokens=25, overlap_tokens=10
+    )
+
+    # the last chunk fails, but the claims from the others are kept,
+    # with duplicates from overlapping chunks removed
+    assert [claim.start_time_s for claim in claims] == [0, 20, 40]
+    assert [claim.metadata["quote"] for claim in claims] == [
+        transcript[0].text,
+        transcript[2].text,
+        transcript[4].text,
+    ]
+
+
+@patch("harmful_claim_finder.claim_extraction.run_prompt_async")
+async def test_span_extraction(mock_run_prompt):
+    transcript = [
+        TranscriptSentence(video_id=fake_id, source="", text=text, start_time_s=i * 10)
+        for i, text in enumerate(
+            [
+                "Castor oil penetrates very deep.",
+                "It cures arthritis",
+                "in a week.",
+                "Thanks for watching.",
+            ]
+        )
+    ]
+    dummy_claims = [
+        {
+            "language": "English",
+            "claim": "Castor oil cures arthritis in a week.",
+            "first_sentence": 2,
+            "last_sentence": 1,
+            "topics": ["health"],
+        },
+        {
+            "language": "English",
+            "claim": "Castor oil penetrates deep into the skin.",
+            "first_sentence": 0,
+            "last_sentence": 0,
+            "topics": ["health"],
+        },
+        {
+            "language": "English",
+            "claim": "Not in the transcript.",
+            "first_sentence": 3,
+            "last_sentence": 9,
+            "topics": ["health"],
+        },
+        {"language": "English", "claim": "Missing sentence numbers."},
+    ]
+    mock_run_prompt.return_value = json.dumps(dummy_claims)
+    claims = await extract_claims_from_transcript(
+        transcript, {"health": ["oil"]}, mode="spans"
+    )
+
+    prompt = mock_run_prompt.call_args.args[0]
+    assert "1: It cures arthritis\n2: in a week." in prompt
+    assert claims == [
+        VideoClaims(
+            video_id=fake_id,
+            claim="Castor oil cures arthritis in a week.",
+            start_time_s=10,
+            metadata={"quote": "It cures arthritis in a week.", "topics": ["health"]},
+        ),
+        VideoClaims(
+            video_id=fake_id,
+            claim="Castor oil penetrates deep into the skin.",
+            start_time_s=0,
+            metadata={
+                "quote": "Castor oil penetrates very deep.",
+                "topics": ["health"],
+            },
+        ),
+    ]
+
+
+@patch("harmful_claim_finder.claim_extraction.run_prompt_async")
+async def test_span_extraction_fixes_json(mock_run_prompt):
+    transcript = [
+        TranscriptSentence(video_id=fake_id, source="", text="A claim.", start_time_s=5)
+    ]
+    fixed = [
+        {
+            "language": "English",
+            "claim": "A claim.",
+            "first_sentence": 0,
+            "last_sentence": 0,
+            "topics": ["topic"],
+        }
+    ]
+    mock_run_prompt.side_effect = ['"not a list"', json.dumps(fixed)]
+    claims = await _get_transcript_claims(transcript, {"topic": []}, mode="spans")
+
+    assert mock_run_prompt.call_count == 2
+    assert [claim.start_time_s for claim in claims] == [5]
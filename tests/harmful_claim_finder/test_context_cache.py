@@ -0,0 +1,159 @@
+import asyncio
+from typing import Any
+
+from harmful_claim_finder.utils.context_cache import PrefixCache
+from harmful_claim_finder.utils.usage import UsageLedger, track_usage
+
+
+class FakeBackend:
+    def __init__(self) -> None:
+        self.stored: dict[str, str] = {}
+        self.created = 0
+        self.deleted: list[str] = []
+
+    async def create(
+        self, model: str, system_instruction: str | None, prefix: str, ttl_s: float
+    ) -> str:
+        await asyncio.sleep(0.01)
+        self.created += 1
+        name = f"cachedContents/{self.created}"
+        self.stored[name] = (system_instruction or "") + prefix
+        return name
+
+    async def delete(self, name: str) -> None:
+        self.deleted.append(name)
+        del self.stored[name]
+
+    async def generate(
+        self,
+        name: str,
+        model: str,
+        prompt: str,
+        output_schema: Any = None,
+        video_uri: str | None = None,
+        labels: dict[str, str] | None = None,
+    ) -> str:
+        return self.stored[name] + prompt
+
+
+KEYWORDS_V1 = "Topic '1' is defined by the terms [vaccine, vaxxer]\n" * 20
+KEYWORDS_V2 = "Topic '1' is defined by the terms [vaccine, miracle cure]\n" * 20
+
+
+async def test_prefix_registered_once():
+    backend = FakeBackend()
+    cache = PrefixCache(backend, min_tokens=10)
+
+    entries = await asyncio.gather(
+        *(cache.get("flash", "Find claims.", KEYWORDS_V1) for _ in range(5))
+    )
+    entries.append(await cache.get("flash", "Find claims.", KEYWORDS_V1))
+
+    assert backend.created == 1
+    assert len({entry.name for entry in entries if entry}) == 1
+    assert cache.hits == 1
+    assert cache.misses == 5
+    other = await cache.get("flash", "Find video claims.", KEYWORDS_V1)
+    assert other is not None and other.name != entries[0].name
+
+
+async def test_hit_rate():
+    backend = FakeBackend()
+    cache = PrefixCache(backend, min_tokens=10)
+
+    for _ in range(10):
+        entry = await cache.get("flash", None, KEYWORDS_V1)
+        assert entry is not None
+        assert await backend.generate(entry.name, "flash", "text") == (
+            KEYWORDS_V1 + "text"
+        )
+
+    assert backend.created == 1
+    assert cache.hit_rate == 0.9
+
+
+async def test_registration_recorded_in_usage():
+    cache = PrefixCache(FakeBackend(), min_tokens=10)
+    ledger = UsageLedger()
+
+    with track_usage(ledger):
+        entry = await cache.get("flash", None, KEYWORDS_V1)
+        await cache.get("flash", None, KEYWORDS_V1)
+
+    assert entry is not None
+    usage = ledger.summary().by_feature["context_cache"]
+    assert usage.calls == 1
+    assert usage.prompt_tokens == entry.tokens
+
+
+async def test_short_prefix_not_cached():
+    backend = FakeBackend()
+    cache = PrefixCache(backend, min_tokens=1024)
+
+    assert await cache.get("flash", None, KEYWORDS_V1) is None
+    assert backend.created == 0
+
+
+async def test_expired_prefix_replaced():
+    backend = FakeBackend()
+    cache = PrefixCache(backend, ttl_s=0.05, refresh_margin_s=0.0, min_tokens=10)
+
+    first = await cache.get("flash", None, KEYWORDS_V1)
+    await asyncio.sleep(0.06)
+    second = await cache.get("flash", None, KEYWORDS_V1)
+
+    assert first is not None and second is not None
+    assert first.name != second.name
+    # calls may still be using the old prefix, so it's left to expire
+    assert backend.deleted == []
+    assert len(cache) == 1
+
+
+async def test_keyword_change_invalidates_scope():
+    backend = FakeBackend()
+    cache = PrefixCache(backend, min_tokens=10)
+
+    old = await cache.get("flash", None, KEYWORDS_V1, scope="org-a/en")
+    other_org = await cache.get("flash", None, KEYWORDS_V1, scope="org-b/en")
+    new = await cache.get("flash", None, KEYWORDS_V2, scope="org-a/en")
+
+    assert old is not None and new is not None and other_org == old
+    # org-b still uses the old keywords, but only the latest prefix for each
+    # scope is kept
+    assert backend.deleted == [old.name]
+    assert len(cache) == 1
+
+    await cache.invalidate("org-a/en")
+    assert backend.deleted == [old.name, new.name]
+    assert len(cache) == 0
+
+
+async def test_least_recently_used_evicted():
+    backend = FakeBackend()
+    cache = PrefixCache(backend, min_tokens=10, max_entries=2)
+
+    first = await cache.get("flash", "one", KEYWORDS_V1)
+    await cache.get("flash", "two", KEYWORDS_V1)
+    await cache.get("flash", "one", KEYWORDS_V1)
+    await cache.get("flash", "three", KEYWORDS_V1)
+
+    assert first is not None
+    assert backend.deleted == []
+    assert len(cache) == 2
+    # the least recently used prefix is registered again when next needed
+    assert backend.created == 3
+    await cache.get("flash", "two", KEYWORDS_V1)
+    await cache.get("flash", "one", KEYWORDS_V1)
+    assert backend.created == 5
+
+
+async def test_discarded_prefix_registered_again():
+    backend = FakeBackend()
+    cache = PrefixCache(backend, min_tokens=10)
+
+    first = await cache.get("flash", None, KEYWORDS_V1)
+    assert first is not None
+    cache.discard(first)
+    second = await cache.get("flash", None, KEYWORDS_V1)
+
+    assert second is not None and second.name != first.name
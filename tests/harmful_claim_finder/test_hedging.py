@@ -0,0 +1,154 @@
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+
+from pytest import raises
+
+from harmful_claim_finder.utils.gemini import run_prompt_async
+from harmful_claim_finder.utils.hedging import (
+    HEDGES,
+    RequestHedger,
+    set_request_hedger,
+)
+from harmful_claim_finder.utils.usage import UsageLedger, track_usage
+
+
+def warmed_up_hedger(**kwargs) -> RequestHedger:
+    hedger = RequestHedger(min_samples=10, **kwargs)
+    for _ in range(10):
+        hedger.record("feature", 0.01)
+    return hedger
+
+
+class SlowThenFast:
+    def __init__(self, delays: list[float]) -> None:
+        self.delays = delays
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self) -> int:
+        call = self.started
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delays[call])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return call
+
+
+async def test_slow_call_hedged():
+    hedger = warmed_up_hedger(max_extra_fraction=1.0)
+    call = SlowThenFast([1.0, 0.01])
+    won = HEDGES.value(feature="feature", outcome="won")
+
+    result = await asyncio.wait_for(hedger.run("feature", call), timeout=0.5)
+
+    assert result == 1
+    assert call.started == 2
+    await asyncio.sleep(0)
+    assert call.cancelled == 1
+    assert HEDGES.value(feature="feature", outcome="won") == won + 1
+
+
+async def test_fast_call_not_hedged():
+    hedger = warmed_up_hedger(max_extra_fraction=1.0)
+    call = SlowThenFast([0.0])
+
+    assert await hedger.run("feature", call) == 0
+    assert call.started == 1
+
+
+async def test_not_hedged_until_latency_known():
+    hedger = RequestHedger(min_samples=10, max_extra_fraction=1.0)
+    call = SlowThenFast([0.05])
+
+    assert hedger.delay("feature") is None
+    assert await hedger.run("feature", call) == 0
+    assert call.started == 1
+
+
+async def test_hedges_budgeted():
+    hedger = warmed_up_hedger(max_extra_fraction=0.25)
+    calls = [SlowThenFast([0.05, 0.0]) for _ in range(8)]
+
+    await asyncio.gather(*(hedger.run("feature", call) for call in calls))
+
+    assert hedger.hedges == 2
+    assert sum(call.started for call in calls) == 10
+
+
+async def test_failed_call_falls_back_to_duplicate():
+    hedger = warmed_up_hedger(max_extra_fraction=1.0)
+    started = 0
+
+    async def call() -> str:
+        nonlocal started
+        started += 1
+        if started == 1:
+            await asyncio.sleep(0.05)
+            raise ValueError("Gemini failed")
+        await asyncio.sleep(0.1)
+        return "response"
+
+    assert await hedger.run("feature", call) == "response"
+
+
+async def test_both_calls_failed():
+    hedger = warmed_up_hedger(max_extra_fraction=1.0)
+
+    async def call() -> str:
+        await asyncio.sleep(0.05)
+        raise ValueError("Gemini failed")
+
+    with raises(ValueError):
+        await hedger.run("feature", call)
+
+
+async def test_only_chosen_features_hedged():
+    hedger = warmed_up_hedger(max_extra_fraction=1.0, features={"pastel"})
+    call = SlowThenFast([0.05, 0.0])
+
+    assert await hedger.run("feature", call) == 0
+    assert call.started == 1
+
+
+async def test_wait_for_slot_not_hedged():
+    hedger = warmed_up_hedger(max_extra_fraction=1.0)
+    call = SlowThenFast([0.0, 0.0])
+
+    @asynccontextmanager
+    async def busy_slot():
+        await asyncio.sleep(0.05)
+        yield
+
+    assert await hedger.run("feature", call, slot=busy_slot) == 0
+    assert call.started == 1
+    assert hedger.delay("feature") < 0.05
+
+
+async def test_duplicates_charged():
+    delays = iter([1.0, 0.0])
+
+    async def fake_gemini(prompt, *args, **kwargs) -> str:
+        await asyncio.sleep(next(delays))
+        return "response"
+
+    set_request_hedger(warmed_up_hedger(max_extra_fraction=1.0))
+    try:
+        with (
+            patch(
+                "harmful_claim_finder.utils.gemini._run_prompt_async",
+                side_effect=fake_gemini,
+            ),
+            track_usage(UsageLedger()) as ledger,
+        ):
+            response = await run_prompt_async("prompt", labels={"feature": "feature"})
+            # let the cancelled call finish
+            await asyncio.sleep(0.01)
+    finally:
+        set_request_hedger(None)
+
+    assert response == "response"
+    assert ledger is not None
+    assert ledger.summary().calls == 2
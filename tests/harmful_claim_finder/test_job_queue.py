@@ -0,0 +1,84 @@
+import threading
+
+from harmful_claim_finder.utils.job_queue import SQLiteJobQueue
+
+
+def test_jobs_claimed_in_order(tmp_path):
+    queue = SQLiteJobQueue(tmp_path / "queue.db")
+    assert queue.put("a", "first")
+    assert queue.put("b", "second")
+    assert not queue.put("a", "again")
+
+    assert queue.claim("worker-0") == ("a", "first")
+    assert queue.claim("worker-1") == ("b", "second")
+    assert queue.claim("worker-0") is None
+    assert queue.counts() == {"claimed": 2}
+
+
+def test_each_job_claimed_once(tmp_path):
+    SQLiteJobQueue(tmp_path / "queue.db")
+    queues = [SQLiteJobQueue(tmp_path / "queue.db") for _ in range(4)]
+    for i in range(100):
+        queues[0].put(str(i), "")
+    claimed: list[str] = []
+
+    def work(queue: SQLiteJobQueue, name: str) -> None:
+        while (job := queue.claim(name)) is not None:
+            claimed.append(job[0])
+
+    threads = [
+        threading.Thread(target=work, args=(queue, f"worker-{i}"))
+        for i, queue in enumerate(queues)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed, key=int) == [str(i) for i in range(100)]
+
+
+def test_unfinished_jobs_released(tmp_path):
+    queue = SQLiteJobQueue(tmp_path / "queue.db")
+    for job_id in "abc":
+        queue.put(job_id, "")
+    queue.claim("worker-0")
+    queue.claim("worker-1")
+    queue.complete("a")
+    queue.claim("worker-1")
+    queue.fail("c", "error")
+
+    assert queue.release_claimed("worker-1") == 1
+    assert queue.claim("worker-2") == ("b", "")
+    assert queue.retry_failed() == 1
+    assert queue.counts() == {"done": 1, "claimed": 1, "pending": 1}
+
+
+def test_job_failed_after_max_attempts(tmp_path):
+    queue = SQLiteJobQueue(tmp_path / "queue.db", max_attempts=2)
+    queue.put("a", "")
+    queue.put("b", "")
+    assert queue.claim("worker-0") == ("a", "")
+    assert queue.release_claimed() == 1
+    assert queue.claim("worker-0") == ("a", "")
+    assert queue.claim("worker-1") == ("b", "")
+
+    assert queue.release_claimed() == 1
+    assert queue.counts() == {"failed": 1, "pending": 1}
+    assert queue.claim("worker-0") == ("b", "")
+
+    queue.complete("b")
+    assert queue.retry_failed() == 1
+    assert queue.claim("worker-0") == ("a", "")
+
+
+def test_put_waits_while_full(tmp_path):
+    queue = SQLiteJobQueue(tmp_path / "queue.db", max_pending=1, poll_interval_s=0.01)
+    queue.put("a", "")
+    claimer = threading.Timer(0.1, queue.claim, args=("worker-0",))
+    claimer.start()
+
+    queue.put("b", "")
+
+    claimer.join()
+    assert queue.counts() == {"claimed": 1, "pending": 1}
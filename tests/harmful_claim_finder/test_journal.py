@@ -0,0 +1,43 @@
+from harmful_claim_finder.utils.journal import JobJournal
+
+
+def test_stages_persist(tmp_path):
+    journal = JobJournal(tmp_path / "journal.db", "batch")
+    journal.record("video 1", "topics", '{"a": ["health"]}')
+    journal.record("video 1", "scores", "{}")
+
+    reopened = JobJournal(tmp_path / "journal.db", "batch")
+
+    assert reopened.get("video 1", "topics") == '{"a": ["health"]}'
+    assert reopened.get("video 1", "claims") is None
+    assert reopened.stages("video 1") == {"topics": '{"a": ["health"]}', "scores": "{}"}
+
+
+def test_record_is_idempotent(tmp_path):
+    journal = JobJournal(tmp_path / "journal.db", "batch")
+    journal.record("video 1", "claims", "first")
+    journal.record("video 1", "claims", "second")
+
+    assert journal.get("video 1", "claims") == "second"
+    assert journal.count("claims") == 1
+
+
+def test_batches_kept_apart(tmp_path):
+    first = JobJournal(tmp_path / "journal.db", "first")
+    second = JobJournal(tmp_path / "journal.db", "second")
+    first.record("video 1", "claims", "[]")
+
+    assert second.get("video 1", "claims") is None
+    second.clear()
+    assert first.get("video 1", "claims") == "[]"
+
+
+def test_outputs_read_in_pages(tmp_path):
+    journal = JobJournal(tmp_path / "journal.db", "batch")
+    for i in range(7):
+        journal.record(f"video {i}", "claims", str(i))
+    journal.record("video 0", "topics", "{}")
+
+    outputs = list(journal.outputs("claims", page_size=3))
+
+    assert outputs == [(f"video {i}", str(i)) for i in range(7)]
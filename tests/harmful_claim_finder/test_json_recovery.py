@@ -0,0 +1,111 @@
+import json
+from unittest.mock import AsyncMock
+
+from pytest import raises
+
+from harmful_claim_finder.utils.json_recovery import (
+    JSON_REPAIRS,
+    parse_with_repair,
+    parse_with_repair_tier,
+    repair_candidates,
+)
+
+CLAIMS = [
+    {"claim": "first", "original_text": "quote 1"},
+    {"claim": "second", "original_text": "quote 2"},
+    {"claim": "third", "original_text": "quote {3}"},
+]
+
+
+def parse_claims(text: str) -> list[dict[str, str]]:
+    parsed = json.loads(text)
+    if not isinstance(parsed, list) or not all(
+        isinstance(claim, dict) and set(claim) == {"claim", "original_text"}
+        for claim in parsed
+    ):
+        raise ValueError("Not a list of claims")
+    return parsed
+
+
+def test_json_repair_tier():
+    response = '```json\n[{"claim": "first", "original_text": "quote 1"}\n {"claim": "second", "original_text": "quote 2"},]\n```'
+
+    tier, value = next(repair_candidates(response))
+
+    assert tier == "json_repair"
+    assert value == CLAIMS[:2]
+
+
+def test_truncated_tier():
+    response = json.dumps(CLAIMS)[:-20]
+
+    candidates = dict(repair_candidates(response))
+
+    assert "json_repair" not in candidates
+    assert candidates["truncated"] == CLAIMS[:2]
+
+
+def test_elements_tier():
+    response = (
+        "Here are the claims:\n"
+        + json.dumps(CLAIMS[0])
+        + "\nand also\n"
+        + json.dumps(CLAIMS[2])
+    )
+
+    candidates = dict(repair_candidates(response))
+
+    assert candidates["elements"] == [CLAIMS[0], CLAIMS[2]]
+
+
+async def test_truncated_response_repaired_locally():
+    fix = AsyncMock()
+    before = JSON_REPAIRS.value(feature="test", tier="truncated")
+
+    claims, tier = await parse_with_repair_tier(
+        json.dumps(CLAIMS)[:-20], parse_claims, fix, feature="test"
+    )
+
+    assert claims == CLAIMS[:2]
+    assert tier == "truncated"
+    fix.assert_not_called()
+    assert JSON_REPAIRS.value(feature="test", tier="truncated") == before + 1
+
+
+async def test_unrecoverable_response_fixed_by_llm():
+    fix = AsyncMock(return_value=json.dumps(CLAIMS))
+    before = JSON_REPAIRS.value(feature="test", tier="llm")
+
+    claims = await parse_with_repair("no JSON here", parse_claims, fix, feature="test")
+
+    assert claims == CLAIMS
+    fix.assert_awaited_once_with("no JSON here")
+    assert JSON_REPAIRS.value(feature="test", tier="llm") == before + 1
+
+
+async def test_valid_json_in_wrong_shape_fixed_by_llm():
+    fix = AsyncMock(return_value='"still wrong"')
+    before = JSON_REPAIRS.value(feature="test", tier="failed")
+
+    with raises(ValueError):
+        await parse_with_repair(
+            json.dumps({"claims": CLAIMS}), parse_claims, fix, feature="test"
+        )
+
+    fix.assert_awaited_once()
+    assert JSON_REPAIRS.value(feature="test", tier="failed") == before + 1
+
+
+async def test_refusal_fixed_by_llm():
+    fix = AsyncMock(return_value=json.dumps(CLAIMS))
+
+    def parse_anything(text: str) -> dict[str, object]:
+        # like `format_results`, which lists every sentence whatever it's given
+        return {"parsed": json.loads(text)}
+
+    result = await parse_with_repair(
+        "Sorry, I cannot help with that", parse_anything, fix, feature="test"
+    )
+
+    fix.assert_awaited_once()
+    assert result == {"parsed": CLAIMS}
@@ -0,0 +1,48 @@
+from pytest import mark, param
+
+from harmful_claim_finder.keyword_filter.keyword_matcher import (
+    MAX_CACHED_MATCHERS,
+    fold_text,
+    get_keyword_matcher,
+)
+
+keywords = {
+    "migration": ["Small boat crossings", "migration"],
+    "health": ["vacunas", "Impfverweigerer", "NHS"],
+    "war": ["war"],
+}
+
+
+def test_fold_text():
+    assert fold_text("Inmigración ÇOĞU Straße") == "inmigracion cogu strasse"
+
+
+@mark.parametrize(
+    "text,expected",
+    [
+        param("Migrants arrived by SMALL BOATS crossing", {"migration"}, id="variants"),
+        param("La vacunación es segura", {"health"}, id="accents and stemming"),
+        param("Die Impfverweigerer sind laut", {"health"}, id="german"),
+        param("nhs waiting lists", {"health"}, id="short keyword"),
+        param("the war is over", {"war"}, id="whole word"),
+        param("warm weather in the warehouse", set(), id="short keyword prefix"),
+        param("migration and war", {"migration", "war"}, id="several topics"),
+        param("nothing to see here", set(), id="no match"),
+    ],
+)
+def test_match(text, expected):
+    matcher = get_keyword_matcher(keywords)
+    assert matcher.match(text) == expected
+
+
+def test_matcher_compiled_once():
+    assert get_keyword_matcher(dict(keywords)) is get_keyword_matcher(keywords)
+    assert get_keyword_matcher(keywords, "en") is not get_keyword_matcher(keywords)
+
+
+def test_least_recently_used_matchers_evicted():
+    first = get_keyword_matcher({"topic": ["keyword 0"]})
+    for i in range(1, MAX_CACHED_MATCHERS + 1):
+        get_keyword_matcher({"topic": [f"keyword {i}"]})
+
+    assert get_keyword_matcher({"topic": ["keyword 0"]}) is not first
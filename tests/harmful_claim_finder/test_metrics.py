@@ -0,0 +1,79 @@
+import urllib.request
+
+import pytest
+
+from harmful_claim_finder.utils.metrics import (
+    MetricsRegistry,
+    start_metrics_server,
+    write_prometheus_file,
+)
+
+
+def test_counter_export():
+    registry = MetricsRegistry()
+    retries = registry.counter("retries_total", "Retries.", ["stage"])
+    retries.inc(stage="pastel")
+    retries.inc(2, stage="pastel")
+    retries.inc(stage='say "hi"')
+
+    assert retries.value(stage="pastel") == 3
+    assert registry.to_prometheus_text() == (
+        "# HELP retries_total Retries.\n"
+        "# TYPE retries_total counter\n"
+        'retries_total{stage="pastel"} 3.0\n'
+        'retries_total{stage="say \\"hi\\""} 1.0\n'
+    )
+
+
+def test_histogram_export():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", ["stage"], [0.1, 1])
+    latency.observe(0.05, stage="topic_filter")
+    latency.observe(0.5, stage="topic_filter")
+    latency.observe(5, stage="topic_filter")
+
+    assert latency.count(stage="topic_filter") == 3
+    assert latency.sum(stage="topic_filter") == pytest.approx(5.55)
+    lines = registry.to_prometheus_text().splitlines()
+    assert 'latency_seconds_bucket{stage="topic_filter",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="topic_filter",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{stage="topic_filter",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="topic_filter"} 3' in lines
+
+
+def test_histogram_times_failures():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", ["stage"])
+    with pytest.raises(ValueError):
+        with latency.time(stage="pastel"):
+            raise ValueError()
+    assert latency.count(stage="pastel") == 1
+
+
+def test_metrics_registered_once():
+    registry = MetricsRegistry()
+    counter = registry.counter("calls_total", "Calls.", ["stage"])
+    assert registry.counter("calls_total", "Calls.", ["stage"]) is counter
+    with pytest.raises(ValueError):
+        registry.histogram("calls_total", "Calls.", ["stage"])
+    with pytest.raises(ValueError):
+        counter.inc(feature="wrong label")
+
+
+def test_exporters(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("calls_total", "Calls.").inc()
+    expected = registry.to_prometheus_text()
+
+    metrics_file = tmp_path / "metrics.prom"
+    write_prometheus_file(metrics_file, registry)
+    assert metrics_file.read_text() == expected
+
+    server = start_metrics_server(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.read().decode() == expected
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,64 @@
+import os
+import threading
+from pathlib import Path
+
+from harmful_claim_finder.utils.model_registry import ModelRegistry, file_hash
+
+
+def _write(path: Path, text: str, mtime_ns: int) -> None:
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_model_loaded_once(tmp_path):
+    model_file = tmp_path / "model.json"
+    _write(model_file, "model 1", 1_000)
+    loads = []
+
+    def loader(path: Path) -> str:
+        loads.append(path)
+        return path.read_text()
+
+    registry = ModelRegistry(loader)
+    assert registry.get(model_file) == "model 1"
+    assert registry.get(str(model_file)) == "model 1"
+    assert len(loads) == 1
+    assert registry.model_hash(model_file) == file_hash(model_file)
+
+
+def test_model_reloaded_when_file_changes(tmp_path):
+    model_file = tmp_path / "model.json"
+    _write(model_file, "model 1", 1_000)
+    registry = ModelRegistry(lambda path: path.read_text())
+    first = registry.get(model_file)
+
+    # touching the file without changing contents shouldn't reload
+    _write(model_file, "model 1", 2_000)
+    assert registry.get(model_file) is first
+
+    _write(model_file, "model 2", 3_000)
+    assert registry.get(model_file) == "model 2"
+
+
+def test_concurrent_gets_load_once(tmp_path):
+    model_file = tmp_path / "model.json"
+    _write(model_file, "model", 1_000)
+    loads = []
+
+    def loader(path: Path) -> object:
+        loads.append(path)
+        return object()
+
+    registry = ModelRegistry(loader)
+    results: list[object] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get(model_file)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert all(result is results[0] for result in results)
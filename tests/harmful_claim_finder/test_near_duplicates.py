@@ -0,0 +1,66 @@
+from harmful_claim_finder.utils.near_duplicates import (
+    NearDuplicateIndex,
+    normalise_for_matching,
+)
+
+
+def test_normalise_for_matching():
+    assert (
+        normalise_for_matching("Uh, castor oil  PENETRATES very deep!")
+        == "castor oil penetrates very deep"
+    )
+
+
+def test_near_duplicates_found():
+    index: NearDuplicateIndex[float] = NearDuplicateIndex()
+    index.add("Castor oil penetrates very deep into the skin.", 4.0)
+
+    assert index.get("castor oil, erm, penetrates very deep into the skin") == (
+        "Castor oil penetrates very deep into the skin.",
+        4.0,
+    )
+    assert index.get("Castor oil penetrates very deep into the skin!!")
+    assert index.get("Olive oil is good for cooking at low temperatures.") is None
+
+
+def test_reordered_words_not_matched():
+    index: NearDuplicateIndex[int] = NearDuplicateIndex()
+    index.add("The vaccine was tested on forty thousand people.", 1)
+
+    assert index.get("On forty thousand people, the vaccine was tested.") is None
+    index.add("The dog bit the man.", 2)
+    assert index.get("The man bit the dog.") is None
+
+
+def test_words_from_other_languages_kept():
+    assert normalise_for_matching("Er sagt, um 8 Uhr.") == "er sagt um 8 uhr"
+
+
+def test_old_entries_evicted():
+    index: NearDuplicateIndex[int] = NearDuplicateIndex(max_entries=2)
+    index.add("The first sentence about vaccines.", 1)
+    index.add("A second sentence about the economy.", 2)
+    # using the first sentence makes the second the oldest
+    assert index.get("The first sentence about vaccines") is not None
+    index.add("A third sentence about immigration.", 3)
+
+    assert len(index) == 2
+    assert index.get("A second sentence about the economy.") is None
+    assert index.get("The first sentence about vaccines.") is not None
+
+
+def test_negations_not_matched():
+    index: NearDuplicateIndex[float] = NearDuplicateIndex()
+    index.add("The vaccine is safe for children.", 4.0)
+
+    assert index.get("The vaccine is not safe for children.") is None
+    assert index.get("The vaccine isn't safe for children.") is None
+
+
+def test_changed_numbers_not_matched():
+    index: NearDuplicateIndex[float] = NearDuplicateIndex()
+    index.add("Inflation rose by 3% in 2023.", 4.0)
+
+    assert index.get("Inflation rose by 8% in 2023.") is None
+    assert index.get("Inflation rose by 3% in 2024.") is None
+    assert index.get("inflation rose by 3% in 2023") is not None
@@ -0,0 +1,184 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from pastel.models import ScoreAndAnswers, Sentence
+from pytest import raises
+
+from harmful_claim_finder.pastel_inference import (
+    CheckworthyClaimDetector,
+    decode_score,
+    encode_score,
+    get_checkworthy_detector,
+    make_score_cache,
+    set_score_cache,
+)
+from harmful_claim_finder.utils.cache import SQLiteCache
+from harmful_claim_finder.utils.gemini import PASTEL_FEATURE
+from harmful_claim_finder.utils.hedging import RequestHedger, set_request_hedger
+from harmful_claim_finder.utils.models import PastelError
+from harmful_claim_finder.utils.near_duplicates import NearDuplicateIndex
+from harmful_claim_finder.utils.tokens import estimate_tokens
+from harmful_claim_finder.utils.usage import UsageLedger, track_usage
+
+
+def _fake_predictions(sentences: list[Sentence]) -> dict[Sentence, ScoreAndAnswers]:
+    return {
+        sentence: ScoreAndAnswers(
+            sentence=sentence, score=float(len(sentence.sentence_text)), answers={}
+        )
+        for sentence in sentences
+    }
+
+
+def test_shared_detector():
+    assert get_checkworthy_detector() is get_checkworthy_detector()
+
+
+def test_shared_detector_cache(tmp_path):
+    assert get_checkworthy_detector().cache is not None
+    cache = make_score_cache(disk=SQLiteCache(tmp_path / "cache.db", "pastel"))
+    try:
+        set_score_cache(cache)
+        assert get_checkworthy_detector().cache is cache
+        set_score_cache(None)
+        assert get_checkworthy_detector().cache is None
+    finally:
+        set_score_cache(make_score_cache())
+
+
+def test_score_round_trip():
+    result = ScoreAndAnswers(sentence=Sentence("s", ()), score=2.5, answers={"q": 1.0})
+    decoded = decode_score(encode_score(result))
+    assert decoded.score == 2.5
+    assert decoded.answers == {"q": 1.0}
+
+
+async def test_score_cache(tmp_path):
+    cache = make_score_cache(disk=SQLiteCache(tmp_path / "cache.db", "pastel"))
+    detector = CheckworthyClaimDetector(cache=cache)
+    with patch.object(
+        detector.pastel, "make_predictions", AsyncMock(side_effect=_fake_predictions)
+    ) as mock_predictions:
+        await detector.score_sentences(["one", "three"])
+        scores = await detector.score_sentences(["One ", "three", "eleven"])
+
+    sent = [s.sentence_text for s in mock_predictions.call_args.args[0]]
+    assert sent == ["eleven"]
+    assert {s: result.score for s, result in scores.items()} == {
+        "One ": 3.0,
+        "three": 5.0,
+        "eleven": 6.0,
+    }
+    assert all(result.sentence.sentence_text == s for s, result in scores.items())
+
+    # a new process only has the disk tier
+    detector = CheckworthyClaimDetector(
+        cache=make_score_cache(disk=SQLiteCache(tmp_path / "cache.db", "pastel"))
+    )
+    scores = await detector.score_sentences(["three"])
+    assert scores["three"].sentence.sentence_text == "three"
+    assert scores["three"].score == 5.0
+
+
+async def test_score_retries():
+    detector = CheckworthyClaimDetector()
+    with patch.object(
+        detector.pastel, "make_predictions", AsyncMock(side_effect=ValueError)
+    ) as mock_predictions:
+        with raises(PastelError):
+            await detector.score_sentences(["one"], max_attempts=3)
+
+    assert mock_predictions.call_count == 3
+
+
+async def test_scored_batches_kept_if_one_fails():
+    cache = make_score_cache()
+    detector = CheckworthyClaimDetector(cache=cache)
+
+    async def fail_second_batch(sentences: list[Sentence]):
+        if sentences[0].sentence_text == "three":
+            raise ValueError("Gemini failed")
+        return _fake_predictions(sentences)
+
+    with patch.object(
+        detector.pastel, "make_predictions", AsyncMock(side_effect=fail_second_batch)
+    ):
+        with raises(PastelError):
+            await detector.score_sentences(
+                ["one", "two", "three"], max_attempts=2, batch_size=2
+            )
+
+    with patch.object(
+        detector.pastel, "make_predictions", AsyncMock(side_effect=_fake_predictions)
+    ) as mock_predictions:
+        scores = await detector.score_sentences(["one", "two", "three"])
+
+    sent = [s.sentence_text for s in mock_predictions.call_args.args[0]]
+    assert sent == ["three"]
+    assert set(scores) == {"one", "two", "three"}
+
+
+async def test_near_duplicates_share_scores():
+    detector = CheckworthyClaimDetector(near_duplicates=NearDuplicateIndex())
+    with patch.object(
+        detector.pastel, "make_predictions", AsyncMock(side_effect=_fake_predictions)
+    ) as mock_predictions:
+        first = await detector.score_sentences(
+            ["Castor oil cures cancer.", "Uh, castor oil cures cancer!"]
+        )
+        second = await detector.score_sentences(["castor oil cures CANCER"])
+
+    assert mock_predictions.call_count == 1
+    sent = [s.sentence_text for s in mock_predictions.call_args.args[0]]
+    assert sent == ["Castor oil cures cancer."]
+    assert first["Uh, castor oil cures cancer!"].score == 24.0
+    assert second["castor oil cures CANCER"].score == 24.0
+
+
+async def test_usage_counts_every_question():
+    detector = CheckworthyClaimDetector()
+    with (
+        patch.object(
+            detector.pastel,
+            "make_predictions",
+            AsyncMock(side_effect=_fake_predictions),
+        ),
+        track_usage(UsageLedger()) as ledger,
+    ):
+        await detector.score_sentences(["one", "three"])
+
+    assert ledger is not None
+    usage = ledger.summary()
+    assert usage.calls == 2
+    question_tokens = sum(estimate_tokens(q) for q in detector.questions)
+    assert usage.prompt_tokens > 2 * question_tokens
+    assert usage.output_tokens >= 2 * len(detector.questions)
+
+
+async def test_hedged_batches_charged():
+    detector = CheckworthyClaimDetector()
+    delays = iter([1.0, 0.0])
+
+    async def slow_then_fast(sentences):
+        await asyncio.sleep(next(delays))
+        return _fake_predictions(sentences)
+
+    hedger = RequestHedger(min_samples=1, max_extra_fraction=1.0)
+    hedger.record(PASTEL_FEATURE, 0.01)
+    set_request_hedger(hedger)
+    try:
+        with (
+            patch.object(
+                detector.pastel, "make_predictions", side_effect=slow_then_fast
+            ),
+            track_usage(UsageLedger()) as ledger,
+        ):
+            scores = await detector.score_sentences(["one"])
+            # let the cancelled batch finish
+            await asyncio.sleep(0.01)
+    finally:
+        set_request_hedger(None)
+
+    assert scores["one"].score == 3.0
+    assert ledger is not None
+    assert ledger.summary().calls == 2
@@ -0,0 +1,100 @@
+import random
+import string
+
+from genai_utils.sentence_linking import link_quotes_and_sentences
+
+from harmful_claim_finder.utils.quote_linking import QuoteLinker
+
+SENTENCES = [
+    "Welcome back to the channel everyone.",
+    "Today we are talking about castor oil.",
+    "Castor oil penetrates very deep into the scalp.",
+    "It helps the hair grow back in a week.",
+    "Doctors don't want you to know this.",
+    "Thanks for watching, see you next time.",
+]
+
+
+def make_transcript(n_sentences: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    # distinct words, as words like "word1" and "word2" score highly against each
+    # other with `partial_ratio`, so quotes match unrelated sentences
+    vocabulary = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+        for _ in range(500)
+    ]
+    return [
+        " ".join(rng.choices(vocabulary, k=rng.randint(5, 15))) + "."
+        for _ in range(n_sentences)
+    ]
+
+
+def test_link_single_sentence_quotes():
+    linker = QuoteLinker(SENTENCES)
+
+    links = linker.link(
+        ["castor oil penetrates very deep", "doctors dont want you to know"]
+    )
+
+    assert [(q, s) for q, s, _ in links] == [(0, 2), (1, 4)]
+    assert all(score >= 90 for _, _, score in links)
+
+
+def test_link_quote_spanning_sentences():
+    linker = QuoteLinker(SENTENCES)
+    quotes = [
+        "into the scalp. It helps the hair grow back in a week.",
+        "Castor oil penetrates very deep into the scalp. It helps the hair grow",
+    ]
+
+    links = linker.link(quotes)
+
+    # linked to the sentence matching the most of each quote
+    assert [(q, s) for q, s, _ in links] == [(0, 3), (1, 2)]
+    assert [(q, s) for q, s, _ in links] == [
+        (q, s) for q, s, _ in link_quotes_and_sentences(quotes, SENTENCES)
+    ]
+
+
+def test_unmatched_quote_not_linked():
+    linker = QuoteLinker(SENTENCES)
+
+    assert linker.link(["the moon landing was staged in a studio"]) == []
+    assert linker.link([""]) == []
+    assert QuoteLinker([]).link(["castor oil"]) == []
+
+
+def test_matches_today_linking():
+    sentences = make_transcript(2000)
+    rng = random.Random(1)
+    quotes = []
+    for _ in range(50):
+        start = rng.randrange(len(sentences) - 3)
+        words = " ".join(sentences[start : start + 3]).split()
+        offset = rng.randrange(5)
+        quote = words[offset : offset + rng.randint(4, 20)]
+        if rng.random() < 0.5:
+            # the LLM sometimes changes a word when quoting
+            quote[rng.randrange(len(quote))] = "changed"
+        quotes.append(" ".join(quote))
+
+    indexed = QuoteLinker(sentences).link(quotes)
+    all_pairs = QuoteLinker(sentences, max_candidates=None).link(quotes)
+    today = link_quotes_and_sentences(quotes, sentences)
+
+    assert len(indexed) > 35
+    # a quote across sentences is linked to whichever matches it best, like today
+    assert [(q, s) for q, s, _ in indexed] == [(q, s) for q, s, _ in today]
+    assert [(q, s) for q, s, _ in all_pairs] == [(q, s) for q, s, _ in today]
+
+
+def test_candidates_pruned():
+    sentences = make_transcript(2000)
+    linker = QuoteLinker(sentences, max_candidates=5)
+
+    candidates = linker.candidates(sentences[1000])
+
+    assert 1000 in candidates and 999 in candidates
+    assert len(candidates) <= 10
+    # no shared n-grams, so every sentence is checked
+    assert len(linker.candidates("nothing like this")) == len(sentences)
@@ -0,0 +1,133 @@
+import asyncio
+from contextlib import nullcontext
+
+import pytest
+
+from harmful_claim_finder.utils.rate_limit import AdaptiveRateLimiter, is_quota_error
+
+
+class QuotaExceeded(Exception):
+    code = 429
+
+
+class FakeQuotaService:
+    """
+    Stands in for Gemini with a quota of `capacity` calls in flight at once.
+    """
+
+    def __init__(self, capacity: int, latency_s: float = 0.01) -> None:
+        self.capacity = capacity
+        self.latency_s = latency_s
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def call(self) -> str:
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise QuotaExceeded("429 RESOURCE_EXHAUSTED")
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.latency_s)
+            return "ok"
+        finally:
+            self.in_flight -= 1
+
+
+async def run_jobs(
+    service: FakeQuotaService,
+    limiter: AdaptiveRateLimiter | None,
+    n_jobs: int,
+    max_attempts: int,
+) -> int:
+    """
+    Runs jobs with the same blind retry loop as the pipelines, returning the number
+    which succeeded.
+    """
+
+    async def job() -> bool:
+        for _ in range(max_attempts):
+            slot = limiter.slot("model", "feature") if limiter else nullcontext()
+            try:
+                async with slot:
+                    await service.call()
+                return True
+            except QuotaExceeded:
+                pass
+        return False
+
+    results = await asyncio.gather(*(job() for _ in range(n_jobs)))
+    return sum(results)
+
+
+async def test_limiter_improves_throughput_under_quota():
+    unlimited_service = FakeQuotaService(capacity=4)
+    unlimited = await run_jobs(unlimited_service, None, n_jobs=40, max_attempts=3)
+
+    limited_service = FakeQuotaService(capacity=4)
+    limiter = AdaptiveRateLimiter(
+        requests_per_s=1_000, burst=40, max_concurrency=16, cooldown_s=0.01
+    )
+    limited = await run_jobs(limited_service, limiter, n_jobs=40, max_attempts=3)
+
+    assert limited == 40
+    assert unlimited < limited
+    assert limited_service.rejected < unlimited_service.rejected
+    assert limiter.concurrency_limit("model", "feature") < 16
+
+
+async def test_concurrency_recovers_after_backoff():
+    limiter = AdaptiveRateLimiter(
+        requests_per_s=1_000, burst=100, max_concurrency=8, cooldown_s=0.0
+    )
+    with pytest.raises(QuotaExceeded):
+        async with limiter.slot("model", "feature"):
+            raise QuotaExceeded()
+    assert limiter.concurrency_limit("model", "feature") == 4
+
+    # additive increase needs about 4 + 5 + 6 + 7 successes to get back to 8
+    for _ in range(25):
+        async with limiter.slot("model", "feature"):
+            pass
+    assert limiter.concurrency_limit("model", "feature") == 8
+
+
+async def test_token_bucket_limits_rate():
+    limiter = AdaptiveRateLimiter(requests_per_s=100, burst=1)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for _ in range(6):
+        async with limiter.slot("model", "feature"):
+            pass
+    # the first call uses the burst, the other 5 wait 10ms each
+    assert loop.time() - start >= 0.04
+
+
+async def test_weighted_slot_counts_each_call():
+    limiter = AdaptiveRateLimiter(requests_per_s=100, burst=1, max_concurrency=8)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    async with limiter.slot("model", "feature", cost=5):
+        # three slots are left for other calls, so a cost of 2 fits but 4 doesn't
+        async with limiter.slot("model", "feature", cost=2):
+            pass
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.05):
+                async with limiter.slot("model", "feature", cost=4):
+                    pass
+    # one call uses the burst, the other 6 of the first 7 wait 10ms each
+    assert loop.time() - start >= 0.06
+
+
+def test_is_quota_error():
+    assert is_quota_error(QuotaExceeded())
+    assert is_quota_error(ValueError("429 RESOURCE_EXHAUSTED"))
+    try:
+        try:
+            raise QuotaExceeded()
+        except QuotaExceeded as exc:
+            raise RuntimeError("Gemini failed") from exc
+    except RuntimeError as wrapped:
+        assert is_quota_error(wrapped)
+    assert not is_quota_error(ValueError("bad json"))
+    assert not is_quota_error(ValueError("File is over the upload quota."))
+    assert not is_quota_error(ValueError("Sentence 14290 not found."))
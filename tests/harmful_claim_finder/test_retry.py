@@ -0,0 +1,116 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+from pytest import raises
+
+from harmful_claim_finder.utils.metrics import RETRIES
+from harmful_claim_finder.utils.models import BudgetExceededError, ParsingError
+from harmful_claim_finder.utils.retry import (
+    DEFAULT_RETRY_POLICY,
+    RetryPolicy,
+    get_retry_policy,
+    is_transient_error,
+    set_retry_policy,
+)
+
+FAST = RetryPolicy(initial_backoff_s=0.01, max_backoff_s=0.01)
+
+
+async def test_retries_until_success():
+    call = AsyncMock(side_effect=[ValueError("one"), ValueError("two"), "result"])
+    retries = RETRIES.value(stage="test")
+
+    assert await FAST.run("test", call) == "result"
+
+    assert call.call_count == 3
+    assert RETRIES.value(stage="test") == retries + 2
+
+
+async def test_last_error_raised():
+    call = AsyncMock(side_effect=[ValueError("one"), KeyError("two")])
+
+    with raises(KeyError):
+        await FAST.with_attempts(2).run("test", call)
+
+
+async def test_only_retryable_errors_retried():
+    policy = RetryPolicy(initial_backoff_s=0.01, retry_on=(ValueError,))
+    call = AsyncMock(side_effect=TypeError("not retryable"))
+
+    with raises(TypeError):
+        await policy.run("test", call)
+
+    assert call.call_count == 1
+
+
+class StatusError(Exception):
+    def __init__(self, code: int) -> None:
+        super().__init__(f"Request failed with status {code}.")
+        self.code = code
+
+
+def test_transient_errors():
+    assert is_transient_error(StatusError(429))
+    assert is_transient_error(StatusError(503))
+    assert is_transient_error(RuntimeError("503 UNAVAILABLE"))
+    assert is_transient_error(asyncio.TimeoutError())
+    assert not is_transient_error(StatusError(400))
+    assert not is_transient_error(KeyError("claim"))
+
+    try:
+        raise RuntimeError("Gemini call failed") from StatusError(500)
+    except RuntimeError as exc:
+        assert is_transient_error(exc)
+
+
+async def test_default_policy_retries_transient_and_parsing_errors():
+    retried = [StatusError(429), StatusError(500), ParsingError("bad json")]
+    call = AsyncMock(side_effect=[*retried, "result"])
+
+    assert await FAST.with_attempts(4).run("test", call) == "result"
+
+    for error in [StatusError(400), TypeError("bug")]:
+        call = AsyncMock(side_effect=error)
+        with raises(type(error)):
+            await FAST.run("test", call)
+        assert call.call_count == 1
+
+
+async def test_budget_errors_not_retried():
+    call = AsyncMock(side_effect=BudgetExceededError("over budget"))
+
+    with raises(BudgetExceededError):
+        await FAST.run("test", call)
+
+    assert call.call_count == 1
+
+
+async def test_deadline_overrides_attempts():
+    policy = RetryPolicy(
+        max_attempts=1, initial_backoff_s=0.01, max_backoff_s=0.01, deadline_s=0.2
+    )
+    call = AsyncMock(side_effect=[ValueError("one"), ValueError("two"), "result"])
+
+    assert await policy.run("test", call) == "result"
+    assert call.call_count == 3
+
+
+async def test_slow_attempt_cancelled_at_deadline():
+    policy = RetryPolicy(initial_backoff_s=0.01, deadline_s=0.05)
+
+    async def slow() -> str:
+        await asyncio.sleep(1)
+        return "result"
+
+    with raises(asyncio.TimeoutError):
+        await asyncio.wait_for(policy.run("test", slow), timeout=0.5)
+
+
+def test_policy_set_per_stage():
+    set_retry_policy("test", FAST)
+    try:
+        assert get_retry_policy("test", 5) == FAST.with_attempts(5)
+        assert get_retry_policy("other", 5) == DEFAULT_RETRY_POLICY.with_attempts(5)
+    finally:
+        set_retry_policy("test", None)
+    assert get_retry_policy("test", 5) == DEFAULT_RETRY_POLICY.with_attempts(5)
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from harmful_claim_finder.utils.single_flight import SingleFlight
+
+
+async def test_identical_calls_share_one_call():
+    flights: SingleFlight[str] = SingleFlight()
+    calls = []
+
+    async def call() -> str:
+        calls.append(True)
+        await asyncio.sleep(0.01)
+        return "response"
+
+    results = await asyncio.gather(
+        *(flights.run("prompt", call) for _ in range(5)),
+        flights.run("other prompt", call),
+    )
+
+    assert len(calls) == 2
+    assert [response for response, _ in results] == ["response"] * 6
+    assert [shared for _, shared in results] == [False, True, True, True, True, False]
+    assert flights.in_flight() == 0
+
+
+async def test_errors_reach_every_caller():
+    flights: SingleFlight[str] = SingleFlight()
+
+    async def call() -> str:
+        await asyncio.sleep(0.01)
+        raise ValueError("bad response")
+
+    results = await asyncio.gather(
+        *(flights.run("prompt", call) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+    # a failed call isn't remembered
+    async def retry() -> str:
+        return "fixed"
+
+    assert await flights.run("prompt", retry) == ("fixed", False)
+
+
+async def test_cancelling_one_caller_keeps_call_running():
+    flights: SingleFlight[str] = SingleFlight()
+    finished = asyncio.Event()
+
+    async def call() -> str:
+        await finished.wait()
+        return "response"
+
+    first = asyncio.create_task(flights.run("prompt", call))
+    second = asyncio.create_task(flights.run("prompt", call))
+    await asyncio.sleep(0)
+    first.cancel()
+    finished.set()
+
+    assert await second == ("response", True)
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+async def test_call_cancelled_when_every_caller_cancelled():
+    flights: SingleFlight[str] = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def call() -> str:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "response"
+
+    callers = [asyncio.create_task(flights.run("prompt", call)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.wait_for(cancelled.wait(), 1)
+    await asyncio.sleep(0.01)
+    assert flights.in_flight() == 0
+
+
+async def test_caller_joining_abandoned_call_starts_new_call():
+    flights: SingleFlight[str] = SingleFlight()
+    calls = 0
+
+    async def call() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "response"
+
+    first = asyncio.create_task(flights.run("prompt", call))
+    await asyncio.sleep(0)
+    first.cancel()
+    # joins before the cancelled call has finished
+    second = asyncio.create_task(flights.run("prompt", call))
+
+    assert await second == ("response", False)
+    assert calls == 2
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert flights.in_flight() == 0
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from harmful_claim_finder.utils.streaming import iterate_as_completed
+
+
+async def test_results_yielded_as_completed():
+    async def finish_after(delay: float) -> float:
+        await asyncio.sleep(delay)
+        return delay
+
+    results = [
+        result
+        async for result in iterate_as_completed(
+            finish_after(delay) for delay in [0.03, 0.01, 0.02]
+        )
+    ]
+    assert results == [0.01, 0.02, 0.03]
+
+
+async def test_remaining_tasks_cancelled_on_error():
+    cancelled = []
+
+    async def slow() -> None:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def fail() -> None:
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        async for _ in iterate_as_completed([slow(), fail()]):
+            pass
+    await asyncio.sleep(0)
+    assert cancelled == [True]
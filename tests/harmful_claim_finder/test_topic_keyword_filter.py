@@ -1,14 +1,16 @@
 from collections import Counter
 from unittest.mock import patch
 
-from pytest import mark, param
+from pytest import mark, param, raises
 from test_data.dummy_keywords import test_keywords as big_test_keywords
 
 from harmful_claim_finder.keyword_filter.topic_keyword_filter import (
     AllKeywordsType,
     TopicKeywordFilter,
 )
+from harmful_claim_finder.utils.cache import TieredCache
 from harmful_claim_finder.utils.models import ParsingError, TopicDetectionError
+from harmful_claim_finder.utils.tokens import estimate_tokens
 
 tiny_test_keywords: AllKeywordsType = {
     "test": {
@@ -48,6 +50,20 @@ def test_make_keyword_prompt(test_keywords, org) -> None:
     assert str(test_article) in prompt
 
 
+def test_split_prompt_for_caching() -> None:
+    filter = TopicKeywordFilter(tiny_test_keywords["test"], cache_scope="test/en")
+    prefix, rest = filter.split_prompt(filter.prompt_outline, str(test_article))
+
+    assert prefix + rest == filter.make_keyword_prompt(test_article)
+    assert filter.make_keyword_block() in prefix
+    assert str(test_article) not in prefix
+    assert str(test_article) in rest
+    # the single and packed prompts are cached separately
+    assert filter.prefix_scope(filter.prompt_outline) != filter.prefix_scope(
+        filter.packed_prompt_outline
+    )
+
+
 @mark.parametrize(
     "input,expected_output",
     [
@@ -274,3 +290,327 @@ async def test_fix_json(mocked_format, mocked_run_prompt):
 
     # if formatting and prompt running were done twice, we know it retried to fix json
     assert mocked_format.call_count == 2 and mocked_run_prompt.call_count == 2
+
+
+@mark.parametrize(
+    "mode,expected_sent",
+    [
+        param("off", test_article, id="off"),
+        param(
+            "strict",
+            [
+                "Here's a sentence about crime.",
+                "Here's another sentence about something crime.",
+            ],
+            id="strict",
+        ),
+        param("context", test_article[:3], id="context"),
+    ],
+)
+@patch(
+    "harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async",
+    return_value='{"1": ["Here\'s a sentence about crime."]}',
+)
+async def test_prefilter_modes(mocked_run_prompt, mode, expected_sent):
+    filter = TopicKeywordFilter({"crime": ["crimes"]}, test_prompt, prefilter=mode)
+    result = await filter.run_all_for_article(test_article, 1)
+
+    assert str(expected_sent) in mocked_run_prompt.call_args.args[0]
+    assert result == {
+        "Here's a sentence about crime.": ["crime"],
+        "Here's another sentence about something crime.": [],
+        "This could be a sentence about education.": [],
+        "More importantly, let's talk about Severence.": [],
+    }
+
+
+@patch("harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async")
+async def test_prefilter_skips_article_without_keywords(mocked_run_prompt):
+    filter = TopicKeywordFilter(
+        {"health": ["vaccines"]}, test_prompt, prefilter="strict"
+    )
+    result = await filter.run_all_for_article(test_article, 1)
+
+    mocked_run_prompt.assert_not_called()
+    assert result == {sentence: [] for sentence in test_article}
+
+
+@patch(
+    "harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async",
+    return_value='{"1": ["sentence2"], "2": ["sentence3"]}',
+)
+async def test_topic_cache(mocked_run_prompt):
+    cache: TieredCache[list[str]] = TieredCache()
+    keywords = {"health": ["doctor"], "business": ["briefcase"]}
+    filter = TopicKeywordFilter(keywords, cache=cache)
+    await filter.run_all_for_article(["sentence1", "sentence2"], 1)
+
+    # only the uncached sentence should be sent, and results keep article order
+    filter = TopicKeywordFilter(keywords, cache=cache)
+    result = await filter.run_all_for_article(["sentence3", "SENTENCE2 "], 1)
+    assert "sentence1" not in mocked_run_prompt.call_args.args[0]
+    assert str(["sentence3"]) in mocked_run_prompt.call_args.args[0]
+    assert list(result.items()) == [
+        ("sentence3", ["business"]),
+        ("SENTENCE2 ", ["health"]),
+    ]
+
+    # changing the keywords invalidates the cache
+    filter = TopicKeywordFilter({"health": ["nurse"]}, cache=cache)
+    await filter.run_all_for_article(["sentence2"], 1)
+    assert mocked_run_prompt.call_count == 3
+
+
+@mark.parametrize(
+    "response,expected_calls",
+    [
+        param('{"1": ["sentence2"]}', 1, id="all matched"),
+        param('{"1": ["sentence 2"]}', 2, id="some dropped"),
+    ],
+)
+@patch("harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async")
+async def test_dropped_sentences_not_cached(
+    mocked_run_prompt, response, expected_calls
+):
+    mocked_run_prompt.return_value = response
+    filter = TopicKeywordFilter({"health": ["doctor"]}, cache=TieredCache())
+    await filter.run_all_for_article(["sentence1", "sentence2"], 1)
+    await filter.run_all_for_article(["sentence1", "sentence2"], 1)
+    assert mocked_run_prompt.call_count == expected_calls
+
+
+@mark.parametrize(
+    "token_budget,expected_calls",
+    [
+        param(100_000, 1, id="all in one prompt"),
+        param(1, 3, id="one prompt per article"),
+    ],
+)
+@patch("harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async")
+async def test_packed_articles(mocked_run_prompt, token_budget, expected_calls):
+    mocked_run_prompt.return_value = '{"1": ["video 1 sentence 1", "video 3 sentence 1"], "2": ["video 2 sentence 2"]}'
+    filter = TopicKeywordFilter({"health": ["doctor"], "business": ["briefcase"]})
+    articles = [
+        ["video 1 sentence 1", "video 1 sentence 2"],
+        ["video 2 sentence 1", "video 2 sentence 2"],
+        ["video 3 sentence 1"],
+    ]
+    results = await filter.run_all_for_articles(articles, token_budget, 1)
+
+    assert mocked_run_prompt.call_count == expected_calls
+    assert "### Transcript 1" in mocked_run_prompt.call_args_list[0].args[0]
+    assert results == [
+        {"video 1 sentence 1": ["health"], "video 1 sentence 2": []},
+        {"video 2 sentence 1": [], "video 2 sentence 2": ["business"]},
+        {"video 3 sentence 1": ["health"]},
+    ]
+
+
+async def test_failed_chunk():
+    async def fake_run_prompt(prompt, *args, **kwargs):
+        if "broken" in prompt:
+            raise ValueError("bad response")
+        return '{"1": ["sentence one"]}'
+
+    filter = TopicKeywordFilter(
+        {"health": ["doctor"]}, max_chunk_tokens=5, chunk_overlap_tokens=0
+    )
+    article = ["sentence one", "broken sentence"]
+    with patch(
+        "harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async",
+        side_effect=fake_run_prompt,
+    ):
+        assert await filter.run_all_for_article(article, 1) == {
+            "sentence one": ["health"],
+            "broken sentence": [],
+        }
+        with raises(TopicDetectionError):
+            await filter.run_all_for_article(article, 1, allow_partial=False)
+
+
+async def test_failed_pack_retried_per_article():
+    async def fake_run_prompt(prompt, *args, **kwargs):
+        if "### Transcript" in prompt or "broken" in prompt:
+            raise ValueError("bad response")
+        return '{"1": ["video 1 sentence 1"]}'
+
+    filter = TopicKeywordFilter({"health": ["doctor"]})
+    articles = [["video 1 sentence 1"], ["broken"], ["video 3 sentence 1"]]
+    with patch(
+        "harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async",
+        side_effect=fake_run_prompt,
+    ) as mocked_run_prompt:
+        results = await filter.run_all_for_articles(
+            articles, 100_000, 1, return_exceptions=True
+        )
+        # one packed prompt, then one prompt per article
+        assert mocked_run_prompt.call_count == 4
+
+        assert results[0] == {"video 1 sentence 1": ["health"]}
+        assert isinstance(results[1], TopicDetectionError)
+        assert results[2] == {"video 3 sentence 1": []}
+
+        with raises(TopicDetectionError):
+            await filter.run_all_for_articles(articles, 100_000, 1)
+
+
+@patch(
+    "harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async",
+    return_value='[{"topic": "1", "sentence_ids": [0]}, {"topic": "2", "sent',
+)
+async def test_cut_off_output_not_cached(mocked_run_prompt):
+    keywords = {"health": ["doctor"], "business": ["briefcase"]}
+    filter = TopicKeywordFilter(keywords, output_mode="indices", cache=TieredCache())
+    article = ["Doctors are striking.", "Castor oil cures cancer."]
+
+    result = await filter.run_all_for_article(article, 1)
+    assert result == {article[0]: ["health"], article[1]: []}
+    assert mocked_run_prompt.call_count == 1
+
+    # the sentence dropped by the repair wasn't cached as having no topics
+    await filter.run_all_for_article(article, 1)
+    assert mocked_run_prompt.call_count == 2
+    assert article[1] in mocked_run_prompt.call_args.args[0]
+    assert article[0] not in mocked_run_prompt.call_args.args[0]
+
+    # and if partial results aren't allowed, the prompt is tried again
+    with raises(TopicDetectionError):
+        await filter.run_all_for_article(["Doctors say so."], 2, allow_partial=False)
+    assert mocked_run_prompt.call_count == 4
+
+
+@patch(
+    "harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async",
+    return_value="{}",
+)
+async def test_packs_fit_budget(mocked_run_prompt):
+    filter = TopicKeywordFilter({"health": ["doctor"]}, output_mode="indices")
+    articles = [[f"video {i} sentence {j}" for j in range(20)] for i in range(3)]
+    # the numbers of the second article's sentences start from 20 in a pack
+    token_budget = estimate_tokens(filter.make_packed_prompt(articles[:2])) - 1
+
+    await filter.run_all_for_articles(articles, token_budget, 1)
+
+    prompts = [
+        call.kwargs["cached_prefix"] + call.args[0]
+        for call in mocked_run_prompt.call_args_list
+    ]
+    assert len(prompts) == 3
+    assert all(estimate_tokens(prompt) <= token_budget for prompt in prompts)
+
+
+def test_output_mode_in_cache_key():
+    keywords = {"crime": ["crimes"]}
+    outline = "[KEYWORDS]\n[TEXT]"
+    sentences = TopicKeywordFilter(keywords, outline, packed_prompt_outline=outline)
+    indices = TopicKeywordFilter(
+        keywords, outline, packed_prompt_outline=outline, output_mode="indices"
+    )
+
+    assert sentences.cache_key("a") != indices.cache_key("a")
+
+
+def test_indexed_prompt_numbers_sentences():
+    filter = TopicKeywordFilter({"crime": ["crimes"]}, output_mode="indices")
+    prompt = filter.make_keyword_prompt(test_article)
+
+    assert "0: Here's a sentence about crime.\n1: Here's another" in prompt
+    assert str(test_article) not in prompt
+
+
+@mark.parametrize(
+    "result,expected_output",
+    [
+        param(
+            [
+                {"topic": "1", "sentence_ids": [0, 2]},
+                {"topic": "2", "sentence_ids": [2]},
+            ],
+            {"sentence1": ["1"], "sentence2": [], "sentence3": ["1", "2"]},
+            id="list of topics",
+        ),
+        param(
+            {"1": [1], "2": []},
+            {"sentence1": [], "sentence2": ["1"], "sentence3": []},
+            id="dictionary",
+        ),
+        param(
+            [
+                {"topic": "1", "sentence_ids": [0, 0, 7, -1]},
+                {"topic": "9", "sentence_ids": [1]},
+            ],
+            {"sentence1": ["1"], "sentence2": [], "sentence3": []},
+            id="bad numbers and topics skipped",
+        ),
+        param([], {"sentence1": [], "sentence2": [], "sentence3": []}, id="nothing"),
+    ],
+)
+def test_format_indexed_results(result, expected_output):
+    filter = TopicKeywordFilter(
+        {"health": ["doctor"], "business": ["briefcase"]}, output_mode="indices"
+    )
+    sentences = ["sentence1", "sentence2", "sentence3"]
+
+    assert filter.format_indexed_results(result, sentences) == expected_output
+
+
+def test_format_indexed_results_error():
+    filter = TopicKeywordFilter({"health": ["doctor"]}, output_mode="indices")
+
+    for bad_result in ["sentence1", [{"topic": "1", "sentence_ids": ["one"]}]]:
+        try:
+            filter.format_indexed_results(bad_result, ["sentence1"])
+            assert False, "Expected a ParsingError"
+        except ParsingError:
+            pass
+
+
+@patch(
+    "harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async",
+    return_value='[{"topic": "1", "sentence_ids": [0, 2]}]',
+)
+async def test_indexed_output(mocked_run_prompt):
+    filter = TopicKeywordFilter({"crime": ["crimes"]}, output_mode="indices")
+    result = await filter.run_all_for_article(test_article, 1)
+
+    prompt = mocked_run_prompt.call_args.args[0]
+    assert "0: Here's a sentence about crime.\n1: Here's another" in prompt
+    assert str(test_article) not in prompt
+    assert "output_schema" in mocked_run_prompt.call_args.kwargs
+    assert result == {
+        "Here's a sentence about crime.": ["crime"],
+        "Here's another sentence about something crime.": [],
+        "This could be a sentence about education.": ["crime"],
+        "More importantly, let's talk about Severence.": [],
+    }
+
+
+@patch(
+    "harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async",
+    return_value='[{"topic": "1", "sentence_ids": [0, 2]}]',
+)
+async def test_indexed_packed_articles(mocked_run_prompt):
+    filter = TopicKeywordFilter({"health": ["doctor"]}, output_mode="indices")
+    articles = [["video 1 sentence 1", "shared"], ["shared", "video 2 sentence 2"]]
+    results = await filter.run_all_for_articles(articles, 100_000, 1)
+
+    prompt = mocked_run_prompt.call_args.args[0]
+    assert "### Transcript 2\n1: shared\n2: video 2 sentence 2" in prompt
+    assert results == [
+        {"video 1 sentence 1": ["health"], "shared": []},
+        {"shared": [], "video 2 sentence 2": ["health"]},
+    ]
+
+
+@patch(
+    "harmful_claim_finder.keyword_filter.topic_keyword_filter.run_prompt_async",
+    side_effect=["Sorry, I cannot help with that", '{"1": ["sentence1"]}'],
+)
+async def test_refusal_not_taken_as_no_topics(mocked_run_prompt):
+    filter = TopicKeywordFilter({"health": ["doctor"]})
+
+    result = await filter.run_all_for_article(["sentence1", "sentence2"], 1)
+
+    assert mocked_run_prompt.call_count == 2
+    assert "Sorry, I cannot help" in mocked_run_prompt.call_args.args[0]
+    assert result == {"sentence1": ["health"], "sentence2": []}
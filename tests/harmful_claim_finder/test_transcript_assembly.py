@@ -0,0 +1,100 @@
+from uuid import UUID
+
+import pytest
+
+from harmful_claim_finder.utils.models import TranscriptFragment
+from harmful_claim_finder.utils.transcript_assembly import assemble_sentences
+
+VIDEO_ID = UUID("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
+
+
+def fragment(text: str, start: float, duration: float = 2.0) -> TranscriptFragment:
+    return TranscriptFragment(text=text, start=start, duration=duration)
+
+
+def test_split_at_punctuation():
+    fragments = [
+        fragment("castor oil penetrates very", 0.0),
+        fragment("deep. It helps the hair", 2.0),
+        fragment("grow!", 4.0),
+    ]
+    sentences = list(assemble_sentences(fragments, VIDEO_ID))
+
+    assert [s.text for s in sentences] == [
+        "castor oil penetrates very deep.",
+        "It helps the hair grow!",
+    ]
+    assert sentences[0].start_time_s == 0.0
+    assert sentences[0].metadata == {"end_time_s": pytest.approx(2.4)}
+    # "It" is the second of five words in the fragment starting at 2s
+    assert sentences[1].start_time_s == pytest.approx(2.4)
+    assert sentences[1].video_id == VIDEO_ID
+    assert sentences[1].source == "captions"
+
+
+def test_overlapping_captions_deduplicated():
+    fragments = [
+        fragment("the greatest perpetrator of", 0.0),
+        fragment("perpetrator of fraud is the", 2.0),
+        fragment("the government said that", 4.0),
+        fragment("that they knew.", 6.0),
+    ]
+    sentences = list(assemble_sentences(fragments, VIDEO_ID))
+
+    # "perpetrator of" is repeated caption text, but "the" and "that" are only
+    # repeated once, so could have been said twice
+    assert [s.text for s in sentences] == [
+        "the greatest perpetrator of fraud is the the government said that that "
+        "they knew."
+    ]
+
+
+def test_overlap_ignores_case_and_punctuation():
+    fragments = [
+        fragment("vaccines are not, tested", 0.0),
+        fragment("Not tested properly.", 2.0),
+    ]
+    sentences = list(assemble_sentences(fragments, VIDEO_ID))
+
+    assert [s.text for s in sentences] == ["vaccines are not, tested properly."]
+
+
+def test_split_at_pause():
+    fragments = [
+        fragment("so that is what we found", 0.0),
+        fragment("and then after a break", 10.0),
+    ]
+    sentences = list(assemble_sentences(fragments, VIDEO_ID, max_gap_s=2.0))
+
+    assert [s.text for s in sentences] == [
+        "so that is what we found",
+        "and then after a break",
+    ]
+    assert sentences[1].start_time_s == 10.0
+
+
+def test_split_long_unpunctuated_text():
+    fragments = [fragment(f"word{i} word{i}a word{i}b", i * 2.0) for i in range(10)]
+    sentences = list(assemble_sentences(fragments, VIDEO_ID, max_words=6))
+
+    assert len(sentences) == 5
+    assert all(len(s.text.split()) == 6 for s in sentences)
+
+
+def test_annotations_removed():
+    fragments = [
+        fragment("[Music]", 0.0),
+        fragment("[Applause] thank you   all.", 2.0),
+    ]
+    sentences = list(assemble_sentences(fragments, VIDEO_ID))
+
+    assert [s.text for s in sentences] == ["thank you all."]
+    assert sentences[0].start_time_s == 2.0
+
+
+def test_streams_lazily():
+    def fragments():
+        yield fragment("first sentence.", 0.0)
+        raise AssertionError("Read past the first sentence")
+
+    assert next(assemble_sentences(fragments(), VIDEO_ID)).text == "first sentence."
@@ -7,8 +7,18 @@ from harmful_claim_finder.transcript_inference import (
     CheckworthyClaimDetector,
     TopicKeywordFilter,
     get_claims,
+    get_claims_batch,
+    stream_claims,
 )
-from harmful_claim_finder.utils.models import TranscriptSentence, VideoClaims
+from harmful_claim_finder.utils.journal import JobJournal
+from harmful_claim_finder.utils.models import (
+    PastelError,
+    TopicDetectionError,
+    TranscriptSentence,
+    VideoClaims,
+    VideoResult,
+)
+from harmful_claim_finder.utils.usage import UsageLedger, record_usage
 
 fake_id = UUID("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
 
@@ -62,9 +72,8 @@ scored_claims = [
 ]
 
 
-@patch("harmful_claim_finder.transcript_inference.CheckworthyClaimDetector")
 @patch("harmful_claim_finder.transcript_inference.TopicKeywordFilter")
-async def test_output_format(mock_keyword_filter, mock_pastel):
+async def test_output_format(mock_keyword_filter):
     mock_keyword_class = Mock(TopicKeywordFilter)
     mock_keyword_class.run_all_for_article.return_value = {
         s.text: ["topic"] for s in unscored_claims
@@ -82,7 +91,228 @@ async def test_output_format(mock_keyword_filter, mock_pastel):
             sentence=Sentence("claim 3"), score=0, answers={"q": 0.3}
         ),
     }
-    mock_pastel.return_value = mock_pastel_class
     kw = {"topic": ["keyword"]}
-    output = await get_claims(kw, unscored_claims)
+    output = await get_claims(kw, unscored_claims, checkworthy_model=mock_pastel_class)
     assert output == scored_claims
+
+
+@patch("harmful_claim_finder.transcript_inference.TopicKeywordFilter")
+async def test_usage_reported(mock_keyword_filter):
+    async def fake_topics(texts, **kwargs):
+        record_usage("topic_detection", 100, 20)
+        return {text: ["topic"] for text in texts}
+
+    mock_keyword_class = Mock(TopicKeywordFilter)
+    mock_keyword_class.run_all_for_article.side_effect = fake_topics
+    mock_keyword_filter.return_value = mock_keyword_class
+    mock_pastel_class = Mock(CheckworthyClaimDetector)
+    mock_pastel_class.score_sentences.return_value = {}
+    usage = UsageLedger()
+
+    await get_claims(
+        {"topic": ["keyword"]},
+        unscored_claims,
+        checkworthy_model=mock_pastel_class,
+        usage=usage,
+    )
+
+    assert usage.summary().by_feature["topic_detection"].prompt_tokens == 100
+    assert usage.total_tokens == 120
+
+
+@patch("harmful_claim_finder.transcript_inference.TopicKeywordFilter")
+async def test_batch_isolates_failures(mock_keyword_filter):
+    failing_id = UUID("bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb")
+
+    async def fake_topics(texts, max_attempts, allow_partial):
+        if "broken" in texts:
+            raise TopicDetectionError("topic detection failed")
+        return {text: ["topic"] for text in texts}
+
+    mock_keyword_class = Mock(TopicKeywordFilter)
+    mock_keyword_class.run_all_for_article.side_effect = fake_topics
+    mock_keyword_filter.return_value = mock_keyword_class
+    mock_pastel_class = Mock(CheckworthyClaimDetector)
+    mock_pastel_class.score_sentences.return_value = {
+        "claim 1": ScoreAndAnswers(
+            sentence=Sentence("claim 1"), score=0.9, answers={"q": 0.1}
+        ),
+        "claim 2": ScoreAndAnswers(
+            sentence=Sentence("claim 2"), score=0.2, answers={"q": 0.2}
+        ),
+    }
+    broken = [
+        TranscriptSentence(
+            video_id=failing_id, source="test", text="broken", start_time_s=0
+        )
+    ]
+    jobs = [(fake_id, unscored_claims), (failing_id, broken)]
+
+    results = {
+        result.video_id: result
+        async for result in get_claims_batch(
+            {"topic": ["keyword"]},
+            jobs,
+            checkworthy_model=mock_pastel_class,
+            topic_concurrency=1,
+            pastel_concurrency=1,
+        )
+    }
+
+    assert results[fake_id].claims == scored_claims
+    assert results[fake_id].error is None
+    assert results[failing_id].claims == []
+    assert "topic detection failed" in results[failing_id].error
+
+
+@patch("harmful_claim_finder.transcript_inference.TopicKeywordFilter")
+async def test_batch_packs_topic_prompts(mock_keyword_filter):
+    other_id = UUID("bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb")
+
+    async def fake_topics(
+        articles, token_budget, max_attempts, return_exceptions, **kwargs
+    ):
+        return [{text: ["topic"] for text in article} for article in articles]
+
+    mock_keyword_class = Mock(TopicKeywordFilter)
+    mock_keyword_class.format_text.side_effect = str
+    mock_keyword_class.run_all_for_articles.side_effect = fake_topics
+    mock_keyword_filter.return_value = mock_keyword_class
+    mock_pastel_class = Mock(CheckworthyClaimDetector)
+    mock_pastel_class.score_sentences.return_value = {
+        "claim 1": ScoreAndAnswers(
+            sentence=Sentence("claim 1"), score=0.9, answers={"q": 0.1}
+        ),
+        "claim 2": ScoreAndAnswers(
+            sentence=Sentence("claim 2"), score=0.2, answers={"q": 0.2}
+        ),
+    }
+    jobs = [(fake_id, unscored_claims), (other_id, unscored_claims)]
+
+    results = [
+        result
+        async for result in get_claims_batch(
+            {"topic": ["keyword"]},
+            jobs,
+            checkworthy_model=mock_pastel_class,
+            pack_topic_tokens=8_000,
+        )
+    ]
+
+    assert [result.error for result in results] == [None, None]
+    mock_keyword_class.run_all_for_article.assert_not_called()
+    mock_keyword_class.run_all_for_articles.assert_called_once()
+    packed = mock_keyword_class.run_all_for_articles.call_args.args[0]
+    assert packed == [[s.text for s in unscored_claims]] * 2
+
+
+@patch("harmful_claim_finder.transcript_inference.TopicKeywordFilter")
+async def test_stream_claims(mock_keyword_filter):
+    mock_keyword_class = Mock(TopicKeywordFilter)
+    mock_keyword_class.run_all_for_article.side_effect = lambda texts, **kwargs: {
+        text: ["topic"] for text in texts
+    }
+    mock_keyword_filter.return_value = mock_keyword_class
+    mock_pastel_class = Mock(CheckworthyClaimDetector)
+    mock_pastel_class.score_sentences.return_value = {
+        "claim 1": ScoreAndAnswers(
+            sentence=Sentence("claim 1"), score=0.9, answers={"q": 0.1}
+        ),
+        "claim 2": ScoreAndAnswers(
+            sentence=Sentence("claim 2"), score=0.2, answers={"q": 0.2}
+        ),
+        "claim 3": ScoreAndAnswers(
+            sentence=Sentence("claim 3"), score=0, answers={"q": 0.3}
+        ),
+    }
+
+    # one sentence per chunk
+    output = [
+        claim
+        async for claim in stream_claims(
+            {"topic": ["keyword"]},
+            unscored_claims,
+            checkworthy_model=mock_pastel_class,
+            chunk_tokens=1,
+        )
+    ]
+
+    assert sorted(output, key=lambda claim: claim.start_time_s) == scored_claims
+    assert mock_keyword_class.run_all_for_article.call_count == 3
+
+
+@patch("harmful_claim_finder.transcript_inference.TopicKeywordFilter")
+async def test_batch_resumes_from_journal(mock_keyword_filter, tmp_path):
+    journal = JobJournal(tmp_path / "journal.db", "batch")
+    mock_keyword_class = Mock(TopicKeywordFilter)
+    mock_keyword_class.run_all_for_article.side_effect = lambda texts, **kwargs: {
+        text: ["topic"] for text in texts
+    }
+    mock_keyword_filter.return_value = mock_keyword_class
+    mock_pastel_class = Mock(CheckworthyClaimDetector)
+    mock_pastel_class.score_sentences.side_effect = PastelError("interrupted")
+
+    async def run_batch() -> list[VideoResult]:
+        return [
+            result
+            async for result in get_claims_batch(
+                {"topic": ["keyword"]},
+                [(fake_id, unscored_claims)],
+                checkworthy_model=mock_pastel_class,
+                journal=journal,
+            )
+        ]
+
+    [failed] = await run_batch()
+    assert failed.error is not None
+    assert journal.get(str(fake_id), "topics") is not None
+
+    mock_pastel_class.score_sentences.side_effect = None
+    mock_pastel_class.score_sentences.return_value = {
+        "claim 1": ScoreAndAnswers(
+            sentence=Sentence("claim 1"), score=0.9, answers={"q": 0.1}
+        ),
+        "claim 2": ScoreAndAnswers(
+            sentence=Sentence("claim 2"), score=0.2, answers={"q": 0.2}
+        ),
+        "claim 3": ScoreAndAnswers(
+            sentence=Sentence("claim 3"), score=0, answers={"q": 0.3}
+        ),
+    }
+    [resumed] = await run_batch()
+    assert resumed.claims == scored_claims
+    assert mock_keyword_class.run_all_for_article.call_count == 1
+
+    [finished] = await run_batch()
+    assert finished == resumed
+    assert mock_keyword_class.run_all_for_article.call_count == 1
+    assert mock_pastel_class.score_sentences.call_count == 2
+
+
+@patch("harmful_claim_finder.transcript_inference.TopicKeywordFilter")
+async def test_empty_topics_not_journaled(mock_keyword_filter, tmp_path):
+    journal = JobJournal(tmp_path / "journal.db", "batch")
+    mock_keyword_class = Mock(TopicKeywordFilter)
+    mock_keyword_class.run_all_for_article.side_effect = lambda texts, **kwargs: {
+        text: [] for text in texts
+    }
+    mock_keyword_filter.return_value = mock_keyword_class
+
+    [result] = [
+        result
+        async for result in get_claims_batch(
+            {"topic": ["keyword"]},
+            [(fake_id, unscored_claims)],
+            checkworthy_model=Mock(CheckworthyClaimDetector),
+            journal=journal,
+        )
+    ]
+
+    assert result.claims == []
+    assert journal.get(str(fake_id), "topics") is None
+    assert journal.get(str(fake_id), "claims") is not None
+    # a journaled batch doesn't keep the topics of a partly failed transcript
+    assert mock_keyword_class.run_all_for_article.call_args.kwargs == {
+        "max_attempts": 2,
+        "allow_partial": False,
+    }
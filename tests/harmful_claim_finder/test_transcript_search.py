@@ -4,8 +4,9 @@ from uuid import UUID
 from pastel.models import ScoreAndAnswers, Sentence
 
 from harmful_claim_finder.pastel_inference import CheckworthyClaimDetector
-from harmful_claim_finder.transcript_search import get_claims
-from harmful_claim_finder.utils.models import VideoClaims
+from harmful_claim_finder.transcript_search import get_claims, stream_claims
+from harmful_claim_finder.utils.metrics import FUNNEL
+from harmful_claim_finder.utils.models import TranscriptSentence, VideoClaims
 
 fake_id = UUID("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
 
@@ -52,9 +53,8 @@ scored_claims = [
 ]
 
 
-@patch("harmful_claim_finder.transcript_search.CheckworthyClaimDetector")
 @patch("harmful_claim_finder.transcript_search.extract_claims_from_transcript")
-async def test_output_format(mock_extract_claims, mock_pastel):
+async def test_output_format(mock_extract_claims):
     mock_extract_claims.return_value = unscored_claims
     mock_pastel_class = Mock(CheckworthyClaimDetector)
     mock_pastel_class.score_sentences.return_value = {
@@ -68,7 +68,60 @@ async def test_output_format(mock_extract_claims, mock_pastel):
             sentence=Sentence("claim 3"), score=0, answers={"q": 0.3}
         ),
     }
-    mock_pastel.return_value = mock_pastel_class
     kw = {"topic": ["keyword"]}
-    output = await get_claims(kw, [])
+    output = await get_claims(kw, [], checkworthy_model=mock_pastel_class)
     assert output == scored_claims
+
+
+@patch("harmful_claim_finder.transcript_search.extract_claims_from_transcript")
+async def test_stream_claims_skips_duplicates_from_overlapping_chunks(
+    mock_extract_claims,
+):
+    chunk_claims = [
+        [unscored_claims[0], unscored_claims[1]],
+        [
+            # same quote as the first chunk
+            VideoClaims(
+                video_id=fake_id,
+                claim="claim one",
+                start_time_s=5,
+                metadata={"quote": "Quote  1"},
+            ),
+            # similar claim at the same time, with a different quote
+            VideoClaims(
+                video_id=fake_id,
+                claim="claim 2.",
+                start_time_s=1,
+                metadata={"quote": "quote two"},
+            ),
+            unscored_claims[2],
+        ],
+    ]
+    mock_extract_claims.side_effect = chunk_claims
+    mock_pastel_class = Mock(CheckworthyClaimDetector)
+    mock_pastel_class.score_sentences.side_effect = lambda sentences, **_: {
+        sentence: ScoreAndAnswers(sentence=Sentence(sentence), score=1, answers={})
+        for sentence in sentences
+    }
+    transcript = [
+        TranscriptSentence(
+            video_id=fake_id, source="", text="word " * 50, start_time_s=i
+        )
+        for i in range(2)
+    ]
+    FUNNEL.reset()
+
+    claims = [
+        claim
+        async for claim in stream_claims(
+            {"topic": ["keyword"]},
+            transcript,
+            checkworthy_model=mock_pastel_class,
+            chunk_tokens=100,
+            overlap_tokens=0,
+        )
+    ]
+
+    assert mock_extract_claims.call_count == 2
+    assert sorted(claim.claim for claim in claims) == ["claim 1", "claim 2", "claim 3"]
+    assert FUNNEL.value(pipeline="transcript_search", step="scored") == 3
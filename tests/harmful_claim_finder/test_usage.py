@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from harmful_claim_finder.utils.models import BudgetExceededError
+from harmful_claim_finder.utils.usage import (
+    TokenPrices,
+    UsageLedger,
+    check_budgets,
+    record_usage,
+    track_usage,
+)
+
+
+def test_usage_grouped_by_feature():
+    ledger = UsageLedger(prices=TokenPrices(1.0, 10.0))
+    with track_usage(ledger):
+        record_usage("get_transcript_claims", 1_000, 200)
+        record_usage("get_transcript_claims/fix_json", 300, 200)
+        record_usage("get_transcript_claims", 1_000, 100)
+    record_usage("get_transcript_claims", 5_000, 5_000)
+
+    summary = ledger.summary()
+    assert summary.calls == 3
+    assert summary.prompt_tokens == 2_300
+    assert summary.output_tokens == 500
+    assert summary.cost_usd == pytest.approx((2_300 * 1.0 + 500 * 10.0) / 1e6)
+    assert summary.by_feature["get_transcript_claims"].calls == 2
+    assert summary.by_feature["get_transcript_claims/fix_json"].prompt_tokens == 300
+
+
+def test_cached_tokens_counted_separately():
+    ledger = UsageLedger(prices=TokenPrices(1.0, 10.0, 0.25))
+    with track_usage(ledger):
+        record_usage("get_transcript_claims", 500, 100, cached_tokens=4_000)
+
+    summary = ledger.summary()
+    assert summary.prompt_tokens == 500
+    assert summary.cached_tokens == 4_000
+    assert ledger.total_tokens == 4_600
+    assert summary.cost_usd == pytest.approx(
+        (500 * 1.0 + 100 * 10.0 + 4_000 * 0.25) / 1e6
+    )
+
+
+async def test_nested_ledgers_follow_tasks():
+    batch = UsageLedger()
+    videos = [UsageLedger(), UsageLedger()]
+
+    async def run_video(ledger: UsageLedger, tokens: int) -> None:
+        with track_usage(ledger):
+            await asyncio.create_task(_record_later(tokens))
+
+    with track_usage(batch):
+        await asyncio.gather(run_video(videos[0], 10), run_video(videos[1], 20))
+
+    assert videos[0].total_tokens == 10
+    assert videos[1].total_tokens == 20
+    assert batch.total_tokens == 30
+
+
+async def _record_later(tokens: int) -> None:
+    await asyncio.sleep(0)
+    record_usage("run_all_for_article", tokens, 0)
+
+
+def test_budget_stops_calls():
+    batch = UsageLedger(budget_tokens=1_000)
+    video = UsageLedger(budget_tokens=100, name="video 1")
+    with track_usage(batch), track_usage(video):
+        check_budgets()
+        record_usage("run_all_for_article", 90, 20)
+        with pytest.raises(BudgetExceededError, match="video 1"):
+            check_budgets()
+
+    # other videos can carry on until the batch budget is used up
+    with track_usage(batch), track_usage(UsageLedger(budget_tokens=100)):
+        check_budgets()
+    record_usage("unbudgeted", 10_000, 0)
+    with track_usage(batch):
+        record_usage("run_all_for_article", 900, 0)
+        with pytest.raises(BudgetExceededError):
+            check_budgets()
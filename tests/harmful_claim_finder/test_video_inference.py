@@ -5,7 +5,7 @@ from pastel.models import ScoreAndAnswers, Sentence
 
 from harmful_claim_finder.pastel_inference import CheckworthyClaimDetector
 from harmful_claim_finder.utils.models import VideoClaims
-from harmful_claim_finder.video_inference import get_claims
+from harmful_claim_finder.video_inference import get_claims, stream_claims
 
 fake_id = UUID("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
 
@@ -52,9 +52,8 @@ scored_claims = [
 ]
 
 
-@patch("harmful_claim_finder.video_inference.CheckworthyClaimDetector")
 @patch("harmful_claim_finder.video_inference.extract_claims_from_video")
-async def test_output_format(mock_extract_claims, mock_pastel):
+async def test_output_format(mock_extract_claims):
     mock_extract_claims.return_value = unscored_claims
     mock_pastel_class = Mock(CheckworthyClaimDetector)
     mock_pastel_class.score_sentences.return_value = {
@@ -68,7 +67,37 @@ async def test_output_format(mock_extract_claims, mock_pastel):
             sentence=Sentence("claim 3"), score=0, answers={"q": 0.3}
         ),
     }
-    mock_pastel.return_value = mock_pastel_class
     kw = {"topic": ["keyword"]}
-    output = await get_claims(fake_id, "video_uri", kw)
+    output = await get_claims(
+        fake_id, "video_uri", kw, checkworthy_model=mock_pastel_class
+    )
     assert output == scored_claims
+
+
+@patch("harmful_claim_finder.video_inference.extract_claims_from_video")
+async def test_stream_claims(mock_extract_claims):
+    mock_extract_claims.return_value = unscored_claims
+    mock_pastel_class = Mock(CheckworthyClaimDetector)
+    mock_pastel_class.score_sentences.side_effect = lambda claims, max_attempts: {
+        claim: ScoreAndAnswers(
+            sentence=Sentence(claim),
+            score=scored.metadata["score"],
+            answers=scored.metadata["answers"],
+        )
+        for scored in scored_claims
+        for claim in claims
+        if scored.claim == claim
+    }
+    kw = {"topic": ["keyword"]}
+    output = [
+        claim
+        async for claim in stream_claims(
+            fake_id,
+            "video_uri",
+            kw,
+            checkworthy_model=mock_pastel_class,
+            pastel_batch_size=2,
+        )
+    ]
+    assert sorted(output, key=lambda claim: claim.start_time_s) == scored_claims
+    assert mock_pastel_class.score_sentences.call_count == 2
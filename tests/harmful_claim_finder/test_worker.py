@@ -0,0 +1,113 @@
+import threading
+from unittest.mock import Mock, patch
+from uuid import UUID
+
+from pastel.models import ScoreAndAnswers, Sentence
+
+from harmful_claim_finder.transcript_inference import (
+    CheckworthyClaimDetector,
+    TopicKeywordFilter,
+)
+from harmful_claim_finder.utils.job_queue import SQLiteJobQueue
+from harmful_claim_finder.utils.journal import JobJournal
+from harmful_claim_finder.utils.models import TranscriptSentence, VideoResult
+from harmful_claim_finder.worker import (
+    WorkerConfig,
+    decode_job,
+    encode_job,
+    enqueue_transcripts,
+    run_worker,
+    run_workers,
+)
+
+video_ids = [UUID(int=i) for i in range(5)]
+
+
+def make_sentences(video_id: UUID) -> list[TranscriptSentence]:
+    return [
+        TranscriptSentence(
+            video_id=video_id, source="test", text=f"claim {i}", start_time_s=i
+        )
+        for i in range(2)
+    ]
+
+
+def make_config(tmp_path, **kwargs) -> WorkerConfig:
+    return WorkerConfig(
+        queue_path=str(tmp_path / "queue.db"),
+        journal_path=str(tmp_path / "journal.db"),
+        batch="batch",
+        keywords={"topic": ["keyword"]},
+        **kwargs,
+    )
+
+
+def test_job_round_trip():
+    sentences = make_sentences(video_ids[0])
+
+    assert decode_job(encode_job(video_ids[0], sentences)) == (
+        video_ids[0],
+        sentences,
+    )
+
+
+def test_rate_limits_shared_between_workers(tmp_path):
+    limiter = make_config(
+        tmp_path, processes=4, requests_per_s=10, max_concurrency=32
+    ).rate_limiter()
+
+    assert limiter.requests_per_s == 2.5
+    assert limiter.max_concurrency == 8
+
+
+@patch("harmful_claim_finder.transcript_inference.get_checkworthy_detector")
+@patch("harmful_claim_finder.transcript_inference.TopicKeywordFilter")
+async def test_worker_drains_queue(mock_keyword_filter, mock_get_detector, tmp_path):
+    config = make_config(tmp_path)
+    queue = SQLiteJobQueue(config.queue_path)
+    enqueue_transcripts(
+        queue, ((video_id, make_sentences(video_id)) for video_id in video_ids)
+    )
+    mock_keyword_class = Mock(TopicKeywordFilter)
+    mock_keyword_class.run_all_for_article.side_effect = lambda texts, **kwargs: {
+        text: ["topic"] for text in texts
+    }
+    mock_keyword_filter.return_value = mock_keyword_class
+    mock_pastel_class = Mock(CheckworthyClaimDetector)
+    mock_pastel_class.score_sentences.side_effect = lambda texts, max_attempts: {
+        text: ScoreAndAnswers(sentence=Sentence(text), score=0.5, answers={})
+        for text in texts
+    }
+    mock_get_detector.return_value = mock_pastel_class
+
+    finished = await run_worker(config, "worker-0", threading.Event())
+
+    assert finished == len(video_ids)
+    assert queue.counts() == {"done": len(video_ids)}
+    results = [
+        VideoResult.model_validate_json(output)
+        for _, output in JobJournal(config.journal_path, "batch").outputs("claims")
+    ]
+    assert sorted(result.video_id for result in results) == video_ids
+    assert all(len(result.claims) == 2 for result in results)
+
+
+async def test_stopped_worker_claims_nothing(tmp_path):
+    config = make_config(tmp_path)
+    queue = SQLiteJobQueue(config.queue_path)
+    enqueue_transcripts(queue, [(video_ids[0], make_sentences(video_ids[0]))])
+    stop = threading.Event()
+    stop.set()
+
+    assert await run_worker(config, "worker-0", stop) == 0
+    assert queue.counts() == {"pending": 1}
+
+
+def test_workers_finish_jobs_left_by_killed_run(tmp_path):
+    config = make_config(tmp_path, processes=2)
+    queue = SQLiteJobQueue(config.queue_path)
+    # a video with no sentences needs no LLM calls
+    enqueue_transcripts(queue, [(video_ids[0], [])])
+    queue.claim("worker-0")
+
+    assert run_workers(config) == {"done": 1}